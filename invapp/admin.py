@@ -1,23 +1,26 @@
+import os
+import uuid
+
 from django.contrib import admin
+from django.conf import settings
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseNotAllowed
 from django.urls import reverse, path
 from django.utils.html import format_html
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
-from django.utils import timezone
+from django.shortcuts import render, redirect, get_object_or_404
+from django.db.models import Count
+from django.utils import timezone, translation
 from django.contrib import messages
-from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _, gettext as __
 from import_export.admin import ImportExportModelAdmin
 from import_export import resources
-import csv
-import uuid
-import urllib.parse
-from datetime import timedelta
 
 from .models import (
+    StripeEventLog,
     Event,
+    EventStats,
     Godparent,
     Guest,
     RSVP,
@@ -38,8 +41,10 @@ from .models import (
     Voucher,
     MarketingCampaign,
     PlatformPartner,
+    Job,
 )
 from .forms import TableAssignmentAdminForm
+from . import jobs, transfers
 
 
 # ==========================================
@@ -68,6 +73,73 @@ class CardDesignResource(resources.ModelResource):
         model = CardDesign
         fields = ('id', 'name', 'event_type', 'template_name', 'priority', 'is_active', 'is_public')
 
+class BackgroundImportExportMixin:
+    """
+    Runs ImportExportModelAdmin's export and import as background jobs (see
+    invapp/transfers.py) instead of inside the request. Exports redirect to the
+    job's progress page, which links the finished file; imports always start as a
+    dry run whose report is reviewed there before the real import is confirmed.
+    """
+
+    def _enqueue_transfer(self, request, name, payload, **kwargs):
+        payload = dict(payload, model=self.model._meta.label, language=translation.get_language())
+        job = jobs.enqueue(name, payload, owner=request.user, **kwargs)
+        return redirect('admin:invapp_job_progress', job_id=job.public_id)
+
+    def _do_file_export(self, file_format, request, queryset, export_form=None):
+        return self._enqueue_transfer(request, 'admin_export', {
+            'resource': transfers.class_path(self.choose_export_resource_class(export_form, request)),
+            'fields': self.get_export_resource_fields_from_form(export_form),
+            'pks': transfers.export_pks(queryset),
+            'format': transfers.class_path(type(file_format)),
+            'filename': self.get_export_filename(request, queryset, file_format),
+            'content_type': file_format.get_content_type(),
+        })
+
+    def import_action(self, request, **kwargs):
+        if request.method != 'POST':
+            return super().import_action(request, **kwargs)
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        import_form = self.create_import_form(request)
+        if not import_form.is_valid():
+            return super().import_action(request, **kwargs)
+
+        input_format = self.get_import_formats()[int(import_form.cleaned_data['format'])]
+        import_file = import_form.cleaned_data['import_file']
+        stored_name = transfers.get_storage().save(
+            transfers.transfer_path(uuid.uuid4().hex, os.path.basename(import_file.name)), import_file)
+        return self._enqueue_transfer(request, 'admin_import', {
+            'resource': transfers.class_path(self.choose_import_resource_class(import_form, request)),
+            'format': transfers.class_path(input_format),
+            'encoding': self.from_encoding,
+            'input': stored_name,
+            'dry_run': True,
+        })
+
+    def get_urls(self):
+        opts = self.model._meta
+        custom_urls = [
+            path('import/<uuid:job_id>/confirm/', self.admin_site.admin_view(self.confirm_import_view),
+                 name=f'{opts.app_label}_{opts.model_name}_import_confirm'),
+        ]
+        return custom_urls + super().get_urls()
+
+    def confirm_import_view(self, request, job_id):
+        """Queues the real import for a dry run that finished without errors."""
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+        dry_run = get_object_or_404(Job, public_id=job_id, name='admin_import', owner=request.user,
+                                    status=Job.Status.SUCCEEDED, payload__model=self.model._meta.label,
+                                    payload__dry_run=True)
+        if not (dry_run.result or {}).get('confirm_url'):
+            raise PermissionDenied
+        # Not retried: a batch committed before a failure would be imported twice
+        return self._enqueue_transfer(request, 'admin_import', dict(dry_run.payload, dry_run=False), max_attempts=1)
+
+
 # ==========================================
 # === 1. INLINES (Secondary Tables)      ===
 # ==========================================
@@ -108,27 +180,32 @@ class GalleryImageInline(admin.TabularInline):
 # ==========================================
 
 @admin.register(Event)
-class EventAdmin(ImportExportModelAdmin):
+class EventAdmin(BackgroundImportExportMixin, ImportExportModelAdmin):
     resource_class = EventResource
     list_display = ('title', 'owner', 'event_date', 'venue_name', 'host_whatsapp', 'view_guests_link')
     search_fields = ('title', 'venue_name', 'owner__username', 'owner__email', 'host_whatsapp')
     list_filter = ('event_type', 'event_date')
+    list_select_related = ('owner',)
     inlines = [TableInline, TableAssignmentInline, GodparentInline, ScheduleItemInline, GalleryImageInline]
 
-    @admin.display(description=_('Guests'))
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(guest_count=Count('guests'))
+
+    @admin.display(description=_('Guests'), ordering='guest_count')
     def view_guests_link(self, obj):
-        count = obj.guests.count()
+        count = obj.guest_count
         url = reverse('admin:invapp_guest_changelist') + f'?event__id__exact={obj.id}'
         return format_html('<a href="{}">{} {}</a>', url, count, _('Guests'))
 
 
 
 @admin.register(Guest)
-class GuestAdmin(ImportExportModelAdmin):
+class GuestAdmin(BackgroundImportExportMixin, ImportExportModelAdmin):
     resource_class = GuestResource
     list_display = ('honorific', 'name', 'event', 'preferred_language', 'get_rsvp_status', 'get_assigned_table')
     search_fields = ('name', 'email', 'event__title')
     list_filter = ('event', 'preferred_language')
+    list_select_related = ('event', 'rsvp_details', 'tableassignment__table')
     readonly_fields = ('unique_id',)
 
     @admin.display(description=_('RSVP Status'))
@@ -154,6 +231,7 @@ class GuestAdmin(ImportExportModelAdmin):
 @admin.register(Table)
 class TableAdmin(admin.ModelAdmin):
     list_display = ('name', 'event', 'capacity')
+    list_select_related = ('event',)
     search_fields = ('name', 'event__title')
 
 
@@ -162,6 +240,7 @@ class TableAssignmentAdmin(admin.ModelAdmin):
     form = TableAssignmentAdminForm
     list_display = ('guest', 'table', 'get_event_title')
     list_filter = ('event', 'table')
+    list_select_related = ('guest', 'table', 'event')
     autocomplete_fields = ['guest', 'table']
     search_fields = ('guest__name', 'table__name', 'event__title')
 
@@ -171,7 +250,17 @@ class TableAssignmentAdmin(admin.ModelAdmin):
         return "—"
 
 
-admin.site.register(RSVP)
+@admin.register(RSVP)
+class RSVPAdmin(admin.ModelAdmin):
+    list_select_related = ('guest',)
+
+
+@admin.register(EventStats)
+class EventStatsAdmin(admin.ModelAdmin):
+    list_display = ('event', 'invited', 'attending', 'declined', 'pending', 'headcount', 'updated_at')
+    list_select_related = ('event',)
+    search_fields = ('event__title',)
+    readonly_fields = ('event', 'invited', 'attending', 'declined', 'pending', 'headcount', 'updated_at')
 
 # ==========================================
 # === 3. USER MANAGEMENT                 ===
@@ -203,17 +292,29 @@ class CustomUserAdmin(UserAdmin):
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'get_user_email', 'plan', 'get_event_count')
     list_filter = ('plan',)
-    search_fields = ('user__username', 'user__email')
+    search_fields = ('user__username', 'user__email', 'stripe_customer_id')
     list_select_related = ('user', 'plan')
     list_editable = ('plan',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(event_count=Count('user__events'))
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == 'plan':
+            # The changelist renders one plan <select> per row: load the choices once per request
+            if not hasattr(request, '_plan_choices'):
+                request._plan_choices = list(field.choices)
+            field.choices = request._plan_choices
+        return field
+
     @admin.display(description=_('Email Address'), ordering='user__email')
     def get_user_email(self, obj):
         return obj.user.email
 
-    @admin.display(description=_('Events Created'))
+    @admin.display(description=_('Events Created'), ordering='event_count')
     def get_event_count(self, obj):
-        return Event.objects.filter(owner=obj.user).count()
+        return obj.event_count
 
 
 # ==========================================
@@ -227,7 +328,7 @@ class SpecialFieldAdmin(admin.ModelAdmin):
 
 
 @admin.register(CardDesign)
-class CardDesignAdmin(ImportExportModelAdmin):
+class CardDesignAdmin(BackgroundImportExportMixin, ImportExportModelAdmin):
     resource_class = CardDesignResource
     list_display = ('name', 'event_type', 'show_preview_icon', 'is_active', 'is_public', 'priority', 'display_plans')
     list_editable = ('priority', 'is_active', 'is_public')
@@ -253,6 +354,9 @@ class CardDesignAdmin(ImportExportModelAdmin):
 
     readonly_fields = ('show_large_preview',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('available_on_plans', 'special_fields')
+
     def show_preview_icon(self, obj):
         if obj.preview_image:
             return format_html(
@@ -288,7 +392,7 @@ class PlanFeatureInline(admin.TabularInline):
 
 
 @admin.register(Plan)
-class PlanAdmin(ImportExportModelAdmin):
+class PlanAdmin(BackgroundImportExportMixin, ImportExportModelAdmin):
     resource_class = PlanResource
     list_display = ('name', 'price','show_watermark', 'max_guests', 'max_events', 'stripe_price_id', 'is_public')
     list_editable = ('price', 'max_guests', 'max_events', 'is_public','show_watermark')
@@ -348,6 +452,7 @@ class VoucherAdmin(admin.ModelAdmin):
                 discount = int(request.POST.get('discount', 100))
                 selected_plan_ids = request.POST.getlist('applicable_plans')
                 custom_message = request.POST.get('custom_message', '')
+                code_length = int(request.POST.get('code_length') or settings.VOUCHER_CODE_LENGTH)
                 
                 # Handle optional start date
                 start_date_str = request.POST.get('valid_from')
@@ -358,76 +463,18 @@ class VoucherAdmin(admin.ModelAdmin):
                 else:
                     valid_from = timezone.now()
 
-                valid_until = valid_from + timedelta(days=days_valid)
-                vouchers_to_create = []
-                codes = []
-
-                for i in range(count):
-                    code = f"TARG-{uuid.uuid4().hex[:4].upper()}"
-                    while code in codes:
-                        code = f"TARG-{uuid.uuid4().hex[:4].upper()}"
-                    codes.append(code)
-                    
-                    vouchers_to_create.append(Voucher(
-                        code=code,
-                        discount_percentage=discount,
-                        campaign_name=campaign,
-                        valid_from=valid_from,
-                        valid_until=valid_until,
-                        active=True,
-                        max_uses=1,
-                        custom_message=custom_message
-                    ))
-
-                from django.db import transaction
-                with transaction.atomic():
-                    Voucher.objects.bulk_create(vouchers_to_create)
-                    created_vouchers = Voucher.objects.filter(code__in=codes)
-                    if selected_plan_ids:
-                        for v in created_vouchers:
-                            v.applicable_plans.set(selected_plan_ids)
-
-                safe_campaign = slugify(campaign) if campaign else "direct_sale"
-                base_domain = "https://invapp-romania.ro/ro/accounts/signup/"
-                
-                response = HttpResponse(content_type='text/csv')
-                response['Content-Disposition'] = f'attachment; filename="vouchers_{safe_campaign}.csv"'
-                response.write(u'\ufeff'.encode('utf8'))
-                
-                writer = csv.writer(response)
-                writer.writerow([
-                    __('Code'), __('Campaign'), __ ('Discount %'), 
-                    __('Valid From'), __('Valid Until'), __('Plans'), 
-                    __('Activation Link (Client)'), __('Send via WhatsApp')
-                ])
-                
-                plan_names = __("All")
-                if selected_plan_ids:
-                    plan_names = ", ".join(Plan.objects.filter(id__in=selected_plan_ids).values_list('name', flat=True))
-
-                for v in created_vouchers:
-                    activation_url = f"{base_domain}?v={v.code}&utm_source=whatsapp&utm_medium=direct_message&utm_campaign={safe_campaign}"
-                    open_link_text = __("Open Link")
-                    activation_formula = f'=HYPERLINK("{activation_url}", "{open_link_text}")'
-                    
-                    # Use custom message if provided, otherwise fallback to default
-                    if v.custom_message:
-                        wa_text = f"{v.custom_message}\n\n{activation_url}"
-                    else:
-                        wa_text = __("Hi! 🥂 We're happy we reached an agreement for your event decor! As promised, here is your link to activate the InvApp platform (Free). Click here to create your account: %(url)s") % {'url': activation_url}
-                    
-                    encoded_wa_text = urllib.parse.quote(wa_text)
-                    wa_link = f"https://wa.me/?text={encoded_wa_text}"
-                    send_wa_text = __("SEND VIA WHATSAPP ➔")
-                    wa_formula = f'=HYPERLINK("{wa_link}", "{send_wa_text}")'
-                    
-                    writer.writerow([
-                        v.code, v.campaign_name, v.discount_percentage, 
-                        v.valid_from.strftime('%Y-%m-%d %H:%M'),
-                        v.valid_until.strftime('%Y-%m-%d %H:%M'), 
-                        plan_names, activation_formula, wa_formula
-                    ])
-                return response
+                job = jobs.enqueue('generate_vouchers', {
+                    'count': count,
+                    'campaign': campaign,
+                    'days_valid': days_valid,
+                    'discount': discount,
+                    'plan_ids': [int(plan_id) for plan_id in selected_plan_ids],
+                    'custom_message': custom_message,
+                    'code_length': code_length,
+                    'valid_from': valid_from.isoformat(),
+                    'language': translation.get_language(),
+                }, owner=request.user)
+                return redirect('admin:invapp_job_progress', job_id=job.public_id)
 
             except Exception as e:
                 error_msg = __("Error: %(error)s") % {'error': str(e)}
@@ -439,6 +486,7 @@ class VoucherAdmin(admin.ModelAdmin):
             title=__("Generate Bulk Vouchers"),
             opts=self.model._meta,
             available_plans=Plan.objects.all().order_by('price'),
+            code_length=settings.VOUCHER_CODE_LENGTH,
         )
         return render(request, "admin/invapp/voucher/generate_bulk.html", context)
 
@@ -446,6 +494,7 @@ class VoucherAdmin(admin.ModelAdmin):
 @admin.register(MarketingCampaign)
 class MarketingCampaignAdmin(admin.ModelAdmin):
     list_display = ('name', 'partner', 'is_active', 'show_urgency_bar', 'countdown_end_date')
+    list_select_related = ('partner',)
     list_editable = ('is_active',)
     search_fields = ('name',)
 
@@ -469,7 +518,7 @@ class FAQResource(resources.ModelResource):
 
 
 @admin.register(FAQ)
-class FAQAdmin(ImportExportModelAdmin):
+class FAQAdmin(BackgroundImportExportMixin, ImportExportModelAdmin):
     resource_class = FAQResource
     list_display = ('question', 'question_ro', 'order', 'is_visible')
     list_editable = ('order', 'is_visible')
@@ -492,6 +541,66 @@ class AboutSectionAdmin(admin.ModelAdmin):
 
 
 @admin.register(FutureFeature)
-class FutureFeatureAdmin(ImportExportModelAdmin):
+class FutureFeatureAdmin(BackgroundImportExportMixin, ImportExportModelAdmin):
     list_display = ('title_en', 'target_date', 'priority', 'is_public')
     list_editable = ('priority', 'is_public')
+
+
+# ==========================================
+# === 7. BACKGROUND JOBS                 ===
+# ==========================================
+
+@admin.register(StripeEventLog)
+class StripeEventLogAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'received_at', 'processed_at')
+    list_filter = ('event_type',)
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'event_type', 'payload', 'received_at', 'processed_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'owner', 'attempts', 'progress_percent', 'run_at', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    list_select_related = ('owner',)
+    search_fields = ('public_id', 'name', 'owner__username')
+    readonly_fields = ('public_id', 'name', 'payload', 'owner', 'status', 'attempts', 'max_attempts', 'run_at',
+                       'locked_by', 'locked_at', 'progress_current', 'progress_total', 'progress_message',
+                       'input_filename', 'result', 'result_filename', 'result_storage_name', 'last_error', 'created_at', 'finished_at')
+    exclude = ('input_file', 'result_file', 'result_content_type')
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_queryset(self, request):
+        # Uploaded inputs and generated files can be megabytes per row; no admin page shows them
+        return super().get_queryset(request).defer('input_file', 'result_file')
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('<uuid:job_id>/progress/', self.admin_site.admin_view(self.progress_view), name='invapp_job_progress'),
+        ]
+        return custom_urls + urls
+
+    def progress_view(self, request, job_id):
+        job = get_object_or_404(Job, public_id=job_id)
+        context = dict(
+            self.admin_site.each_context(request),
+            title=__("Background Job: %(name)s") % {'name': job.name},
+            opts=self.model._meta,
+            job=job,
+            status_url=reverse('invapp:job_status', kwargs={'job_id': job.public_id}),
+        )
+        return render(request, "admin/invapp/job/progress.html", context)
+
+    @admin.action(description=_("Retry selected jobs now"))
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.QUEUED, run_at=timezone.now(), attempts=0, finished_at=None,
+        )
+        self.message_user(request, __("%(count)d jobs queued again.") % {'count': updated})
@@ -5,6 +5,4 @@ class InvappConfig(AppConfig):
     name = 'invapp'
 
     def ready(self):
-        # We have removed the signal import to avoid the djstripe error.
-        # import invapp.signals
-        pass
\ No newline at end of file
+        import invapp.signals  # noqa: F401
\ No newline at end of file
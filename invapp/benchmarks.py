@@ -0,0 +1,132 @@
+"""
+View benchmarks for `manage.py bench_views`: a fixed list of requests against the
+hot views, each timed through the Django test client over the seeded dataset
+(invapp/perf_data.py), summarised as latency percentiles, queries per request
+and response size, and compared against an earlier run's JSON.
+"""
+import json
+import math
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+
+from .management.commands.bench_preview import SAMPLE_PAYLOAD
+from .models import Event, Guest
+from .views import GUEST_LIST_SORTS
+
+
+@dataclass
+class Scenario:
+    name: str
+    url: str
+    method: str = 'get'
+    data: dict = field(default_factory=dict)
+    content_type: str = None
+    login: bool = True
+    expected_status: int = 200
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def pick_targets():
+    """
+    The largest event whose host's plan includes every benchmarked page, a guest
+    who has not answered and one to answer with.
+    """
+    event = (Event.objects.filter(owner__userprofile__plan__has_table_assignment=True)
+             .annotate(guest_count=Count('guests')).filter(guest_count__gt=0)
+             .select_related('owner', 'selected_design').order_by('-guest_count', 'pk').first())
+    if event is None:
+        return None
+    guests = Guest.objects.filter(event=event, preferred_language=settings.LANGUAGE_CODE).order_by('pk')
+    pending = guests.filter(rsvp_details__isnull=True, manual_is_attending__isnull=True).first()
+    answering = guests.exclude(pk=getattr(pending, 'pk', None)).first()
+    return event, pending, answering
+
+
+def build_scenarios(event, pending_guest, answering_guest):
+    with translation.override(settings.LANGUAGE_CODE):
+        invite_url = reverse('invapp:guest_invite', kwargs={'guest_uuid': answering_guest.unique_id})
+        design_id = str(event.selected_design_id)
+        scenarios = [
+            Scenario('landing_page', reverse('invapp:landing_page'), login=False),
+            Scenario('invitation_get', reverse('invapp:guest_invite', kwargs={'guest_uuid': pending_guest.unique_id}),
+                     login=False),
+            Scenario('invitation_post', invite_url, method='post', login=False, expected_status=302,
+                     data={'attending': 'True', 'number_attending': '1', 'meal_preference': '', 'message': 'Vom fi acolo!'}),
+            Scenario('dashboard', reverse('invapp:dashboard')),
+            *[Scenario(f'guest_list_sort_{sort.replace("-", "desc_")}',
+                       reverse('invapp:guest_list', kwargs={'event_id': event.pk}), data={'sort': sort})
+              for sort in GUEST_LIST_SORTS],
+            Scenario('table_assignment_ui', reverse('invapp:table_assignment_ui', kwargs={'event_id': event.pk})),
+            Scenario('export_assignments_csv', reverse('invapp:export_assignments_csv', kwargs={'event_id': event.pk})),
+            Scenario('preview_demo', reverse('invapp:event_preview_demo', kwargs={'event_id': event.pk})),
+            Scenario('live_preview', reverse('invapp:event_live_preview'), method='post',
+                     data=dict(SAMPLE_PAYLOAD, selected_design=design_id, event_id=str(event.pk))),
+            Scenario('event_preview', reverse('invapp:event_preview'), method='post',
+                     data=json.dumps(dict(SAMPLE_PAYLOAD, selected_design=design_id)), content_type='application/json'),
+        ]
+    return scenarios
+
+
+def _request(client, scenario):
+    send = getattr(client, scenario.method)
+    if scenario.content_type:
+        return send(scenario.url, scenario.data, content_type=scenario.content_type)
+    return send(scenario.url, scenario.data)
+
+
+def run_scenario(client, scenario, iterations, warmup=2):
+    """Times `iterations` requests after `warmup` untimed ones; returns the summary dict."""
+    for _ in range(warmup):
+        _request(client, scenario)
+
+    latencies, queries, sizes = [], [], []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = _request(client, scenario)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != scenario.expected_status:
+            raise RuntimeError(f"{scenario.name}: {scenario.method.upper()} {scenario.url} returned "
+                               f"{response.status_code}, expected {scenario.expected_status}")
+        queries.append(len(captured))
+        sizes.append(len(body))
+
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'queries': max(queries),
+        'bytes': max(sizes),
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Regressions of `current` against `baseline` (both run results): a p95 more than
+    `threshold` (a fraction) slower, or more queries per request.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms vs {before['p95_ms']}ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {result['queries']} queries vs {before['queries']}")
+    return regressions
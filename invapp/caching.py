@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class TwoLevelCache:
+    """
+    A small, rarely changing value kept in two places: a copy in this process,
+    trusted for `local_timeout` seconds, in front of the shared Django cache.
+    invalidate() clears both here; other processes drop their copy when it expires.
+    """
+
+    def __init__(self, key, loader, local_timeout=None, shared_timeout=None):
+        self.key = key
+        self.loader = loader
+        self.local_timeout = local_timeout
+        self.shared_timeout = shared_timeout
+        self._local = None  # (value, expires_at)
+
+    def _timeouts(self):
+        local = self.local_timeout if self.local_timeout is not None else getattr(settings, 'SITE_CONTEXT_LOCAL_TIMEOUT', 30)
+        shared = self.shared_timeout if self.shared_timeout is not None else getattr(settings, 'SITE_CONTEXT_CACHE_TIMEOUT', 60 * 60)
+        return local, shared
+
+    def get(self):
+        local_timeout, shared_timeout = self._timeouts()
+        entry = self._local
+        now = time.monotonic()
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        value = cache.get(self.key)
+        if value is None:
+            value = self.loader()
+            cache.set(self.key, value, shared_timeout)
+        self._local = (value, now + local_timeout)
+        return value
+
+    def invalidate(self):
+        self._local = None
+        cache.delete(self.key)
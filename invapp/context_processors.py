@@ -1,23 +1,54 @@
 from django.conf import settings
-from .models import UserProfile, SiteImage
+from django.contrib.auth.models import User
+from .caching import TwoLevelCache
+from .models import UserProfile, SiteImage, Plan
+
+
+def _load_site_images():
+    return {img.key: img.image for img in SiteImage.objects.all() if img.image}
+
+
+def _load_plans():
+    return {plan.pk: plan for plan in Plan.objects.all()}
+
+
+# Invalidated from invapp/signals.py when a SiteImage or Plan is saved or deleted.
+site_images_cache = TwoLevelCache('context:site_images:v1', _load_site_images)
+plans_cache = TwoLevelCache('context:plans:v1', _load_plans)
+
+
+def get_active_plan(request):
+    """
+    Returns the logged-in user's Plan, memoized on the request. Reuses the profile
+    if the view already loaded it; otherwise costs one query for the plan id, with
+    the Plan itself coming from the cache.
+    """
+    if hasattr(request, '_active_plan'):
+        return request._active_plan
+
+    plan_id = None
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        profile_cache = User.userprofile.related
+        if profile_cache.is_cached(user):
+            profile = profile_cache.get_cached_value(user)
+            plan_id = profile.plan_id if profile else None
+        else:
+            plan_id = UserProfile.objects.filter(user=user).values_list('plan_id', flat=True).first()
+
+    plan = None
+    if plan_id:
+        # A plan created in another process may not be in our copy yet
+        plan = plans_cache.get().get(plan_id) or Plan.objects.filter(pk=plan_id).first()
+    request._active_plan = plan
+    return plan
 
 
 def add_active_plan_to_context(request):
     """
     A context processor to add the user's active plan to every page context.
     """
-    if request.user.is_authenticated:
-        try:
-            # We use select_related('plan') for efficiency. This fetches
-            # the UserProfile and its related Plan in a single database query.
-            user_profile = UserProfile.objects.select_related('plan').get(user=request.user)
-            return {'active_plan': user_profile.plan}
-        except UserProfile.DoesNotExist:
-            # This handles cases like the superuser, who might not have a profile.
-            return {'active_plan': None}
-
-    # If the user is not logged in, there is no plan.
-    return {'active_plan': None}
+    return {'active_plan': get_active_plan(request)}
 
 
 def site_assets(request):
@@ -27,15 +58,7 @@ def site_assets(request):
     Usage Example: {{ site_images.hero_bg.url }}
     """
     try:
-        # Try to fetch images only if the table exists
-        images = SiteImage.objects.all()
-        images_dict = {}
-
-        for img in images:
-            if img.image:
-                images_dict[img.key] = img.image
-
-        return {'site_images': images_dict}
+        return {'site_images': site_images_cache.get()}
     except Exception:
         # If an error occurs (e.g., migration not yet applied), return an empty dict
         # to avoid blocking the entire site.
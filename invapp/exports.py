@@ -0,0 +1,189 @@
+import csv
+import re
+import tempfile
+
+from django.db.models.functions import Lower
+from django.http import StreamingHttpResponse, FileResponse
+from django.utils.text import slugify
+from django.utils.translation import gettext as _
+
+from .models import Guest, TableAssignment
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_CONTENT_TYPE = 'text/csv'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Excel rejects these in sheet titles and caps them at 31 characters.
+INVALID_SHEET_TITLE_RE = re.compile(r'[\\/*?:\[\]]')
+
+# Spreadsheet apps run a CSV cell starting with one of these as a formula. Numbers and
+# phone numbers ("+40 721 ...", "-5") start the same way but cannot call anything.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+PLAIN_NUMBER_RE = re.compile(r'[+-]?[\d\s().-]+')
+
+
+def csv_safe(value):
+    """Guests type their names and RSVP messages: text that would run as a formula gets a leading '."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) and not PLAIN_NUMBER_RE.fullmatch(value):
+        return "'" + value
+    return value
+
+
+def _xlsx_row(sheet, row):
+    # openpyxl stores a string starting with '=' as a formula; keep such values as text
+    from openpyxl.cell import WriteOnlyCell
+
+    cells = []
+    for value in row:
+        if isinstance(value, str) and value.startswith('='):
+            value = WriteOnlyCell(sheet, value)
+            value.data_type = 's'
+        cells.append(value)
+    return cells
+
+
+class Echo:
+    """File-like object whose write() hands the value back, for csv.writer streaming."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv_response(header, rows, filename):
+    """
+    Streams `rows` (any iterable, normally a queryset iterator) as CSV.
+    The BOM and header go out immediately so the download starts before the first query.
+    """
+    writer = csv.writer(Echo())
+
+    def generate():
+        # BOM (Byte Order Mark) so Excel recognizes UTF-8 (ă, î, ș, ț)
+        yield '\ufeff'
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow([csv_safe(value) for value in row])
+
+    response = StreamingHttpResponse(generate(), content_type=CSV_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def write_xlsx(output, header, rows, sheet_title):
+    """Writes `rows` to the binary file `output` as a one-sheet workbook, row by row."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=INVALID_SHEET_TITLE_RE.sub('-', sheet_title)[:31])
+    sheet.append(header)
+    for row in rows:
+        sheet.append(_xlsx_row(sheet, row))
+    workbook.save(output)
+
+
+def xlsx_file_response(header, rows, filename, sheet_title):
+    """
+    Writes `rows` with openpyxl's write-only workbook, which flushes each row to a
+    temporary file instead of keeping the sheet in memory, then serves the result.
+    """
+    output = tempfile.TemporaryFile()
+    write_xlsx(output, header, rows, sheet_title)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=f"{filename}.xlsx", content_type=XLSX_CONTENT_TYPE)
+
+
+def export_response(export_format, header, rows, filename, sheet_title):
+    if export_format == 'xlsx':
+        return xlsx_file_response(header, rows, filename, sheet_title)
+    return stream_csv_response(header, rows, filename)
+
+
+def _label_map(choices):
+    # Resolve lazy labels once, up front: the streaming body is consumed after the view returns.
+    return {value: str(label) for value, label in choices}
+
+
+def _status_labels():
+    return {True: _('Attending'), False: _('Declined'), None: _('Pending')}
+
+
+def assignment_export(event):
+    header = [
+        _('Type'),
+        _('Guest Name'),
+        _('Phone Number'),
+        _('Email'),
+        _('Assigned Table'),
+        _('Number Attending'),
+        _('Invitation Method'),
+        _('Meal Preferences'),
+    ]
+    honorifics = _label_map(Guest.HonorificChoices.choices)
+    methods = _label_map(Guest.InvitationMethodChoices.choices)
+
+    assignments = TableAssignment.objects.filter(table__event=event) \
+        .select_related('guest', 'table', 'guest__rsvp_details') \
+        .order_by('table__name', 'guest__name')
+
+    def rows():
+        for assignment in assignments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            guest = assignment.guest
+            rsvp = getattr(guest, 'rsvp_details', None)
+            yield [
+                honorifics.get(guest.honorific, guest.honorific),
+                guest.name,
+                guest.phone_number or '',
+                guest.email or '',
+                assignment.table.name,
+                guest.attending_count,
+                methods.get(guest.invitation_method, guest.invitation_method or ''),
+                (rsvp.meal_preference or '') if rsvp else '',
+            ]
+
+    filename = f"event_{slugify(event.title) or event.pk}_table_assignments"
+    return header, rows(), filename
+
+
+def guest_list_export(event):
+    header = [
+        _('Type'),
+        _('Guest Name'),
+        _('Phone Number'),
+        _('Email'),
+        _('Language'),
+        _('Invitation Method'),
+        _('RSVP Status'),
+        _('Number Attending'),
+        _('Assigned Table'),
+        _('Meal Preferences'),
+        _('Message'),
+    ]
+    honorifics = _label_map(Guest.HonorificChoices.choices)
+    methods = _label_map(Guest.InvitationMethodChoices.choices)
+    statuses = _status_labels()
+
+    guests = Guest.objects.filter(event=event) \
+        .select_related('rsvp_details', 'tableassignment__table') \
+        .with_effective_attendance() \
+        .order_by(Lower('name'), 'id')
+
+    def rows():
+        for guest in guests.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            rsvp = getattr(guest, 'rsvp_details', None)
+            assignment = getattr(guest, 'tableassignment', None)
+            yield [
+                honorifics.get(guest.honorific, guest.honorific),
+                guest.name,
+                guest.phone_number or '',
+                guest.email or '',
+                guest.preferred_language,
+                methods.get(guest.invitation_method, guest.invitation_method or ''),
+                statuses[guest.is_attending],
+                guest.attending_count,
+                assignment.table.name if assignment else '',
+                (rsvp.meal_preference or '') if rsvp else '',
+                (rsvp.message or '') if rsvp else '',
+            ]
+
+    filename = f"event_{slugify(event.title) or event.pk}_guest_list"
+    return header, rows(), filename
@@ -3,7 +3,7 @@ import re
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.forms import inlineformset_factory
-from .models import RSVP, Guest, TableAssignment, Table, Event, Godparent, ScheduleItem, GalleryImage
+from .models import RSVP, Guest, TableAssignment, Table, Event, Godparent, ScheduleItem, GalleryImage, SeatingConstraint
 from .models import CardDesign
 from django import forms
 from django.db.models import Q
@@ -332,6 +332,35 @@ class TableAssignmentForm(forms.Form):
                                })
         return cleaned_data
 
+class SeatingConstraintForm(forms.ModelForm):
+    class Meta:
+        model = SeatingConstraint
+        fields = ['guest_a', 'kind', 'guest_b']
+        labels = {
+            'guest_a': _('Guest'),
+            'kind': _('Rule'),
+            'guest_b': _('Guest'),
+        }
+        widgets = {
+            'guest_a': forms.Select(attrs={'class': INPUT_CLASSES}),
+            'kind': forms.Select(attrs={'class': INPUT_CLASSES}),
+            'guest_b': forms.Select(attrs={'class': INPUT_CLASSES}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        event = kwargs.pop('event', None)
+        super().__init__(*args, **kwargs)
+        if event:
+            guests = Guest.objects.filter(event=event).order_by('name')
+            self.fields['guest_a'].queryset = guests
+            self.fields['guest_b'].queryset = guests
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('guest_a') and cleaned_data.get('guest_a') == cleaned_data.get('guest_b'):
+            raise forms.ValidationError(_("Please choose two different guests."))
+        return cleaned_data
+
 class GuestContactForm(forms.ModelForm):
     """
     Form for guests to provide contact info after RSVP.
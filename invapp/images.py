@@ -0,0 +1,291 @@
+"""
+Responsive image derivatives: smaller WebP/JPEG variants of uploaded photos at
+the widths in RESPONSIVE_IMAGE_WIDTHS, plus the dimensions of each, used by the
+{% responsive_image %} tag (invapp/templatetags/responsive_images.py).
+
+Each stored image is handled by the first backend in RESPONSIVE_IMAGE_BACKENDS
+that accepts it:
+- CloudinaryBackend builds transformation URLs; only the original's size is
+  looked up (once, via Cloudinary's fl_getinfo).
+- FilesystemBackend resizes the file with Pillow and saves the variants next to
+  it in the default storage.
+
+Work happens off the request path in a small thread pool: the first page that
+shows an image gets a plain <img> and queues it; later pages get the srcset.
+`manage.py build_image_derivatives` backfills or retries everything.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+
+from .models import ResponsiveImage
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'responsive_image:v1'
+DERIVATIVE_DIR = 'derivatives'
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+
+
+def get_widths():
+    return tuple(sorted(getattr(settings, 'RESPONSIVE_IMAGE_WIDTHS', (480, 960, 1600))))
+
+
+class ImageInfo:
+    """What a template needs to render one image."""
+
+    def __init__(self, url, width=None, height=None, srcsets=None):
+        self.url = url
+        self.width = width
+        self.height = height
+        self.srcsets = srcsets or {}  # {'webp': [(url, width), ...], 'jpeg': [...]}
+
+
+# --- Backends ---
+class DerivativeBackend:
+    name = None
+
+    def handles(self, image):
+        raise NotImplementedError
+
+    def identifier(self, image):
+        raise NotImplementedError
+
+    def generate(self, identifier):
+        """Returns (width, height, variants) for the stored image; runs in the pool."""
+        raise NotImplementedError
+
+    def srcsets(self, image, record):
+        raise NotImplementedError
+
+
+class CloudinaryBackend(DerivativeBackend):
+    name = 'cloudinary'
+    TRANSFORMATION = 'c_limit,w_{width},f_{format},q_auto'
+    FORMAT_CODES = {'webp': 'webp', 'jpeg': 'jpg'}
+
+    def _url(self, image):
+        return getattr(image, 'url', None) or ''
+
+    def handles(self, image):
+        url = self._url(image)
+        return 'res.cloudinary.com/' in url and '/image/upload/' in url
+
+    def identifier(self, image):
+        return self._url(image).split('?', 1)[0]
+
+    def transformed_url(self, url, transformation):
+        return url.replace('/image/upload/', f"/image/upload/{transformation}/", 1)
+
+    def generate(self, identifier):
+        info_url = self.transformed_url(identifier, 'fl_getinfo')
+        with urllib.request.urlopen(info_url, timeout=10) as response:
+            data = json.loads(response.read().decode('utf-8'))
+        original = data.get('input') or data.get('output') or {}
+        return original.get('width'), original.get('height'), []
+
+    def srcsets(self, image, record):
+        url = self.identifier(image)
+        widths = [width for width in get_widths() if not record.width or width < record.width]
+        if not widths:
+            return {}
+        return {
+            fmt: [(self.transformed_url(url, self.TRANSFORMATION.format(width=width, format=code)), width)
+                  for width in widths]
+            for fmt, code in self.FORMAT_CODES.items()
+        }
+
+
+class FilesystemBackend(DerivativeBackend):
+    name = 'filesystem'
+
+    def handles(self, image):
+        return bool(getattr(image, 'name', None)) and hasattr(image, 'storage')
+
+    def identifier(self, image):
+        return image.name
+
+    @cached_property
+    def storage(self):
+        return default_storage
+
+    def _variant_name(self, identifier, width, fmt):
+        digest = hashlib.sha1(identifier.encode('utf-8')).hexdigest()[:16]
+        stem = os.path.splitext(os.path.basename(identifier))[0][:60]
+        extension = 'jpg' if fmt == 'jpeg' else fmt
+        return f"{DERIVATIVE_DIR}/{digest}/{stem}-{width}.{extension}"
+
+    def generate(self, identifier):
+        with self.storage.open(identifier, 'rb') as handle:
+            image = ImageOps.exif_transpose(Image.open(BytesIO(handle.read())))
+        original_width, original_height = image.size
+
+        variants = []
+        for width in get_widths():
+            if width >= original_width:
+                break
+            height = max(1, round(original_height * width / original_width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt, (pil_format, _content_type) in FORMATS.items():
+                output = BytesIO()
+                frame = resized if fmt == 'webp' and resized.mode in ('RGB', 'RGBA') else resized.convert('RGB')
+                frame.save(output, pil_format, quality=80, optimize=True)
+                name = self._variant_name(identifier, width, fmt)
+                if self.storage.exists(name):
+                    self.storage.delete(name)
+                name = self.storage.save(name, ContentFile(output.getvalue()))
+                variants.append({'format': fmt, 'width': width, 'height': height, 'name': name})
+        return original_width, original_height, variants
+
+    def srcsets(self, image, record):
+        srcsets = {}
+        for variant in record.variants:
+            srcsets.setdefault(variant['format'], []).append((self.storage.url(variant['name']), variant['width']))
+        return srcsets
+
+
+_backends = None
+
+
+def get_backends():
+    global _backends
+    if _backends is None:
+        paths = getattr(settings, 'RESPONSIVE_IMAGE_BACKENDS',
+                        ['invapp.images.CloudinaryBackend', 'invapp.images.FilesystemBackend'])
+        _backends = [import_string(path)() for path in paths]
+    return _backends
+
+
+def get_backend(image):
+    if not image:
+        return None
+    for backend in get_backends():
+        if backend.handles(image):
+            return backend
+    return None
+
+
+def get_backend_by_name(name):
+    return next((backend for backend in get_backends() if backend.name == name), None)
+
+
+def source_key(backend, identifier):
+    return f"{backend.name}:{identifier}"
+
+
+# --- Generation ---
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.RESPONSIVE_IMAGE_WORKERS,
+                                           thread_name_prefix='image-derivatives')
+        return _executor
+
+
+def _cache_key(source):
+    return f"{CACHE_KEY_PREFIX}:{hashlib.sha1(source.encode('utf-8')).hexdigest()}"
+
+
+def process(source):
+    """Generates the variants for one ResponsiveImage source and records the result."""
+    backend_name, identifier = source.split(':', 1)
+    backend = get_backend_by_name(backend_name)
+    try:
+        width, height, variants = backend.generate(identifier)
+        status = ResponsiveImage.Status.READY
+    except Exception:
+        logger.exception("Could not generate image derivatives for %s", source)
+        width = height = None
+        variants = []
+        status = ResponsiveImage.Status.FAILED
+    ResponsiveImage.objects.update_or_create(
+        source=source, defaults={'width': width, 'height': height, 'variants': variants, 'status': status})
+    cache.delete(_cache_key(source))
+    return status
+
+
+def _process_in_thread(source):
+    try:
+        process(source)
+    finally:
+        with _executor_lock:
+            _in_flight.discard(source)
+        connection.close()
+
+
+def schedule(source):
+    """
+    Queues `source` for generation unless it is already queued or the queue is
+    full (RESPONSIVE_IMAGE_QUEUE_LIMIT); a later page view will try again.
+    With RESPONSIVE_IMAGE_WORKERS = 0 it runs inline.
+    """
+    if not settings.RESPONSIVE_IMAGE_WORKERS:
+        process(source)
+        return
+    with _executor_lock:
+        if source in _in_flight or len(_in_flight) >= getattr(settings, 'RESPONSIVE_IMAGE_QUEUE_LIMIT', 100):
+            return
+        _in_flight.add(source)
+    _get_executor().submit(_process_in_thread, source)
+
+
+def _load_record(source):
+    record = ResponsiveImage.objects.filter(source=source).first()
+    if record is None:
+        try:
+            record = ResponsiveImage.objects.create(source=source)
+        except IntegrityError:
+            # Another request registered it first
+            record = ResponsiveImage.objects.get(source=source)
+        else:
+            schedule(source)
+            record.refresh_from_db()
+    return record
+
+
+def get_image_info(image):
+    """
+    Returns an ImageInfo for a stored image (FieldFile or Cloudinary resource), or
+    one with only `url` for anything else, e.g. the preview's stand-in objects.
+    """
+    url = getattr(image, 'url', None)
+    backend = get_backend(image)
+    if backend is None or not url:
+        return ImageInfo(url)
+
+    source = source_key(backend, backend.identifier(image))
+    key = _cache_key(source)
+    record = cache.get(key)
+    if record is None:
+        record = _load_record(source)
+        timeout = 24 * 60 * 60 if record.status == ResponsiveImage.Status.READY else 60
+        cache.set(key, record, timeout)
+
+    if record.status != ResponsiveImage.Status.READY:
+        return ImageInfo(url)
+    srcsets = backend.srcsets(image, record)
+    if record.width:
+        # The original closes each set, for screens wider than the largest variant
+        for candidates in srcsets.values():
+            candidates.append((url, record.width))
+    return ImageInfo(url, record.width, record.height, srcsets)
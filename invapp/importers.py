@@ -0,0 +1,251 @@
+import csv
+import io
+from collections import namedtuple
+from functools import lru_cache
+from itertools import islice
+
+# pandas is imported inside the functions that use it: loading it costs every web
+# worker and manage.py command hundreds of milliseconds, and only imports need it.
+from django.conf import settings
+from django.db import transaction
+from django.utils import translation
+from django.utils.translation import gettext as _, gettext_lazy
+
+from .models import EventStats, Guest
+
+IMPORT_BATCH_SIZE = 1000
+
+# Column order of the downloadable template; the keys are Guest fields.
+TEMPLATE_COLUMNS = {
+    'honorific': gettext_lazy('Honorific'),
+    'name': gettext_lazy('Name'),
+    'email': gettext_lazy('Email'),
+    'phone_number': gettext_lazy('Phone Number'),
+    'max_attendees': gettext_lazy('Max Attendees'),
+    'invitation_method': gettext_lazy('Invitation Method'),
+}
+
+EXTRA_HEADER_ALIASES = {
+    'phone': 'phone_number',
+    'title': 'honorific',
+}
+
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+PHONE_PATTERN = r'^\+?\d{6,15}$'
+# Separators people type into phone numbers: spaces, dashes, dots, slashes and brackets.
+PHONE_SEPARATORS = r'[\s\-./()]'
+
+RowError = namedtuple('RowError', ['row', 'message'])
+
+
+class GuestImportError(ValueError):
+    """The file as a whole cannot be imported; nothing was saved."""
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    @property
+    def has_errors(self):
+        return bool(self.errors)
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace('_', ' ')
+
+
+@lru_cache(maxsize=None)
+def _header_aliases():
+    """Accepts the template headers in every site language, plus the raw field names."""
+    aliases = {_normalize_header(alias): field for alias, field in EXTRA_HEADER_ALIASES.items()}
+    for field in TEMPLATE_COLUMNS:
+        aliases[_normalize_header(field)] = field
+    for code, _name in settings.LANGUAGES:
+        with translation.override(code):
+            for field, label in TEMPLATE_COLUMNS.items():
+                aliases[_normalize_header(label)] = field
+    return aliases
+
+
+@lru_cache(maxsize=None)
+def _honorific_aliases():
+    aliases = {}
+    for code, _name in settings.LANGUAGES:
+        with translation.override(code):
+            for value, label in Guest.HonorificChoices.choices:
+                aliases[str(label).strip().lower().rstrip('.')] = value
+    for value in Guest.HonorificChoices.values:
+        aliases[value] = value
+    aliases[''] = Guest.HonorificChoices.NONE
+    return aliases
+
+
+# --- Readers ---
+def _read_xlsx(uploaded_file):
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    except Exception as exc:
+        raise GuestImportError(_("Could not read the Excel file.")) from exc
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _read_csv(uploaded_file):
+    stream = io.TextIOWrapper(getattr(uploaded_file, 'file', uploaded_file), encoding='utf-8-sig', newline='')
+    try:
+        sample = stream.read(4096)
+        stream.seek(0)
+        try:
+            # Excel in a Romanian locale saves CSV with semicolons.
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(stream, dialect)
+    except UnicodeDecodeError as exc:
+        raise GuestImportError(_("The CSV file must be UTF-8 encoded.")) from exc
+    finally:
+        stream.detach()
+
+
+def read_rows(uploaded_file):
+    """Yields raw row tuples, header first, without loading the whole file."""
+    name = (getattr(uploaded_file, 'name', '') or '').lower()
+    if name.endswith('.csv'):
+        return _read_csv(uploaded_file)
+    if name.endswith(('.xlsx', '.xlsm')):
+        return _read_xlsx(uploaded_file)
+    raise GuestImportError(_("Unsupported file type. Please upload an .xlsx or .csv file."))
+
+
+# --- Validation ---
+def _text_column(frame, field):
+    import pandas as pd
+
+    if field not in frame:
+        return pd.Series('', index=frame.index, dtype='string')
+    column = frame[field].astype('string').fillna('').str.strip()
+    # Whole numbers read back from Excel as floats ("40712345678.0").
+    return column.str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+
+
+def normalize_chunk(frame):
+    """
+    Validates and normalizes one chunk of rows with column-wise operations.
+    Returns the cleaned frame (valid rows only) and a Series of error messages
+    indexed by row for the rejected ones.
+    """
+    import pandas as pd
+
+    errors = pd.Series('', index=frame.index, dtype='string')
+
+    def reject(mask, message):
+        nonlocal errors
+        errors = errors.mask(mask & (errors == ''), message)
+
+    clean = pd.DataFrame(index=frame.index)
+
+    clean['name'] = _text_column(frame, 'name')
+    reject(clean['name'] == '', _("Name is required."))
+    reject(clean['name'].str.len() > Guest._meta.get_field('name').max_length, _("Name is too long."))
+
+    clean['email'] = _text_column(frame, 'email')
+    reject((clean['email'] != '') & ~clean['email'].str.match(EMAIL_PATTERN), _("Invalid email address."))
+
+    clean['phone_number'] = _text_column(frame, 'phone_number').str.replace(PHONE_SEPARATORS, '', regex=True)
+    reject((clean['phone_number'] != '') & ~clean['phone_number'].str.match(PHONE_PATTERN), _("Invalid phone number."))
+
+    honorific_raw = _text_column(frame, 'honorific').str.lower().str.rstrip('.')
+    clean['honorific'] = honorific_raw.map(_honorific_aliases())
+    reject(clean['honorific'].isna(), _("Unknown honorific."))
+
+    attendees_raw = _text_column(frame, 'max_attendees')
+    attendees = pd.to_numeric(attendees_raw.replace('', '1').astype(object), errors='coerce')
+    reject(attendees.isna() | (attendees < 1) | (attendees % 1 != 0), _("Max Attendees must be a whole number of at least 1."))
+    clean['max_attendees'] = attendees
+
+    method_raw = _text_column(frame, 'invitation_method').str.lower()
+    clean['invitation_method'] = Guest.InvitationMethodChoices.PHYSICAL
+    clean.loc[method_raw.str.contains('digit'), 'invitation_method'] = Guest.InvitationMethodChoices.DIGITAL
+
+    invalid = errors != ''
+    return clean[~invalid], errors[invalid]
+
+
+def _build_guests(event, owner, clean):
+    return [
+        Guest(
+            event=event,
+            owner=owner,
+            name=row.name,
+            email=row.email or None,
+            phone_number=row.phone_number or None,
+            honorific=row.honorific,
+            max_attendees=int(row.max_attendees),
+            invitation_method=row.invitation_method,
+            preferred_language='ro',  # Default to Romanian
+        )
+        for row in clean.itertuples(index=False)
+    ]
+
+
+def import_guests(event, owner, uploaded_file, limit=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Streams `uploaded_file` (xlsx or csv) into guests of `event`, `batch_size` rows at a time.
+    Invalid rows are skipped and reported; the valid ones are saved in one transaction.
+    Raises GuestImportError, saving nothing, if the file is unreadable or the valid rows
+    would take the event past `limit` new guests.
+    """
+    import pandas as pd
+
+    rows = read_rows(uploaded_file)
+    header = next(rows, None)
+    if header is None:
+        raise GuestImportError(_("The file is empty."))
+
+    aliases = _header_aliases()
+    positions = {}
+    for position, title in enumerate(header):
+        field = aliases.get(_normalize_header(title))
+        if field and field not in positions:
+            positions[field] = position
+    if 'name' not in positions:
+        raise GuestImportError(_("Missing 'Name' column"))
+
+    fields = list(positions)
+    result = ImportResult()
+    row_number = 1  # the header is spreadsheet row 1
+
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            records, numbers = [], []
+            for raw in chunk:
+                row_number += 1
+                values = [raw[positions[field]] if positions[field] < len(raw) else None for field in fields]
+                if all(value is None or str(value).strip() == '' for value in values):
+                    continue
+                records.append(values)
+                numbers.append(row_number)
+            if not records:
+                continue
+
+            clean, errors = normalize_chunk(pd.DataFrame(records, columns=fields, index=numbers, dtype=object))
+            result.errors.extend(RowError(row, message) for row, message in errors.items())
+
+            if limit is not None and result.created + len(clean) > limit:
+                raise GuestImportError(_("Import exceeds guest limit."))
+            Guest.objects.bulk_create(_build_guests(event, owner, clean), batch_size=batch_size)
+            result.created += len(clean)
+
+        if result.created:
+            EventStats.refresh(event.id)
+
+    return result
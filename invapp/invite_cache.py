@@ -0,0 +1,111 @@
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.html import escape
+
+from .models import Guest
+
+# Placeholders rendered into the shared shell and swapped for per-guest values on every hit.
+# They only use characters that survive HTML auto-escaping untouched.
+GUEST_NAME_PLACEHOLDER = 'xxINVAPPGUESTNAMExx'
+GUEST_UUID_PLACEHOLDER = uuid.UUID('c0de0000-0000-4000-8000-00000000c0de')
+CSRF_TOKEN_PLACEHOLDER = 'xxINVAPPCSRFTOKENxx'
+
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+KEY_PREFIX = 'invite_shell:v1'
+
+
+def get_timeout():
+    return getattr(settings, 'INVITE_CACHE_TIMEOUT', 60 * 60)
+
+
+def is_cacheable(request, guest):
+    """
+    Only fresh invitations share a shell: once a guest has answered (or the host
+    set the attendance manually) the RSVP form and status blocks become personal.
+    """
+    if request.method != 'GET' or not get_timeout():
+        return False
+    if guest.manual_is_attending is not None:
+        return False
+    return not hasattr(guest, 'rsvp_details')
+
+
+def build_cache_key(request, guest, template_name):
+    event = guest.event
+    try:
+        plan = event.owner.userprofile.plan
+    except Exception:
+        plan = None
+
+    parts = [
+        KEY_PREFIX,
+        event.pk,
+        event.selected_design_id or 0,
+        template_name,
+        translation.get_language(),
+        int(event.updated_at.timestamp() * 1000000) if event.updated_at else 0,
+        plan.pk if plan else 0,
+        int(bool(plan and plan.show_watermark)),
+        guest.honorific,
+        guest.max_attendees,
+        request.get_host(),
+    ]
+    return ':'.join(str(part) for part in parts)
+
+
+def build_placeholder_guest(guest):
+    """
+    Unsaved Guest carrying every attribute the invite templates branch on,
+    with the personal values replaced by placeholders.
+    """
+    return Guest(
+        owner_id=guest.owner_id,
+        event=guest.event,
+        name=GUEST_NAME_PLACEHOLDER,
+        max_attendees=guest.max_attendees,
+        honorific=guest.honorific,
+        invitation_method=guest.invitation_method,
+        rsvp_source=guest.rsvp_source,
+        unique_id=GUEST_UUID_PLACEHOLDER,
+        preferred_language=guest.preferred_language,
+    )
+
+
+def render_shell(request, guest, template_name, context):
+    """
+    Renders the invitation for the placeholder guest and strips everything that is
+    specific to the current request (its own UUID in absolute URLs, the CSRF token).
+    """
+    html = render_to_string(template_name, context, request=request)
+    html = html.replace(str(guest.unique_id), str(GUEST_UUID_PLACEHOLDER))
+    return CSRF_INPUT_RE.sub(r'\g<1>' + CSRF_TOKEN_PLACEHOLDER + r'\g<2>', html)
+
+
+def stitch(shell, request, guest):
+    return (
+        shell
+        .replace(GUEST_NAME_PLACEHOLDER, escape(guest.name))
+        .replace(str(GUEST_UUID_PLACEHOLDER), str(guest.unique_id))
+        .replace(CSRF_TOKEN_PLACEHOLDER, get_token(request))
+    )
+
+
+def get_or_render(request, guest, template_name, build_context):
+    """
+    Returns the personalised invitation HTML, rendering the shared shell only on a miss.
+    `build_context` receives the placeholder guest and must return the template context.
+    """
+    key = build_cache_key(request, guest, template_name)
+    shell = cache.get(key)
+    if shell is None:
+        context = build_context(build_placeholder_guest(guest))
+        shell = render_shell(request, guest, template_name, context)
+        cache.set(key, shell, get_timeout())
+    return stitch(shell, request, guest)
@@ -0,0 +1,219 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task modules imported by the worker so their @task functions are registered.
+TASK_MODULES = ['invapp.tasks']
+
+_registry = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a task for failures retrying cannot fix; the message is shown to the user."""
+
+
+def task(name):
+    """Registers a function as the handler for jobs called `name`. It receives the Job."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def autodiscover():
+    for module in getattr(settings, 'JOB_TASK_MODULES', TASK_MODULES):
+        import_module(module)
+
+
+def get_handler(name):
+    if name not in _registry:
+        autodiscover()
+    return _registry[name]
+
+
+def enqueue(name, payload=None, owner=None, run_at=None, max_attempts=None, input_file=None):
+    """
+    Queues `name` to run in the background and returns the Job. `input_file` is an
+    uploaded file whose bytes are stored on the job for the worker to read.
+    """
+    job = Job(
+        name=name,
+        payload=payload or {},
+        owner=owner,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+    )
+    if input_file is not None:
+        job.input_file = input_file.read()
+        job.input_filename = getattr(input_file, 'name', '') or ''
+    job.save()
+    return job
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2x base, 4x base ... capped at JOB_RETRY_MAX_DELAY seconds."""
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 10)
+    ceiling = getattr(settings, 'JOB_RETRY_MAX_DELAY', 60 * 60)
+    return timedelta(seconds=min(ceiling, base * 2 ** max(attempts - 1, 0)))
+
+
+def claim_next(worker_id):
+    """
+    Marks the oldest due job as running for `worker_id` and returns it, or None.
+    On PostgreSQL/MySQL competing workers skip each other's locked rows; SQLite has
+    no row locks, so there the status-guarded UPDATE alone decides who wins.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.Status.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            job_id = due.select_for_update(skip_locked=True).values_list('id', flat=True).first()
+        else:
+            job_id = due.values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        claimed = Job.objects.filter(pk=job_id, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+    if not claimed:
+        return None
+    return Job.objects.get(pk=job_id)
+
+
+def requeue_stale(timeout=None):
+    """
+    Puts back jobs whose worker died mid-run: still 'running', with no heartbeat
+    (updated_at) for `timeout` seconds. However long a job runs, its worker keeps
+    the heartbeat fresh, so only orphaned jobs are picked up again.
+    """
+    timeout = timeout or getattr(settings, 'JOB_LOCK_TIMEOUT', 5 * 60)
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.Status.RUNNING, updated_at__lt=now - timedelta(seconds=timeout))
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.Status.FAILED, locked_by='', locked_at=None, finished_at=now, updated_at=now,
+        last_error='Worker stopped before the job finished.',
+    )
+    return stale.update(status=Job.Status.QUEUED, locked_by='', locked_at=None, updated_at=now)
+
+
+@contextmanager
+def heartbeat(job, interval=None):
+    """
+    Touches the running job's updated_at every JOB_HEARTBEAT_INTERVAL seconds from a
+    separate thread, and so its own connection: the beat is committed even while
+    the task holds a long transaction. set_progress() beats as well.
+    """
+    interval = interval or getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                Job.objects.filter(pk=job.pk, status=Job.Status.RUNNING).update(updated_at=timezone.now())
+        except Exception:
+            logger.exception("Heartbeat of job %s stopped", job.public_id)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"job-heartbeat-{job.pk}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def release_connections():
+    """
+    Drops connections that broke or outlived CONN_MAX_AGE, as Django does around
+    each request. Skipped inside an atomic block, where closing would abort it.
+    """
+    if not connection.in_atomic_block:
+        close_old_connections()
+
+
+def run_job(job):
+    """Executes a claimed job and records the outcome, scheduling a retry on failure."""
+    try:
+        with heartbeat(job):
+            result = get_handler(job.name)(job)
+    except PermanentJobError as e:
+        job.status = Job.Status.FAILED
+        job.result = {'error': str(e)}
+        job.last_error = str(e)
+        job.finished_at = timezone.now()
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.Status.QUEUED
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+            logger.warning("Job %s (%s) failed, retry %d/%d at %s",
+                           job.public_id, job.name, job.attempts, job.max_attempts, job.run_at)
+        else:
+            job.status = Job.Status.FAILED
+            job.finished_at = timezone.now()
+            logger.error("Job %s (%s) failed permanently", job.public_id, job.name)
+    else:
+        job.status = Job.Status.SUCCEEDED
+        job.result = result
+        job.last_error = ''
+        job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_at = None
+    job.save()
+    return job
+
+
+def run_pending(worker_id=None, limit=None):
+    """Runs due jobs until the queue is empty (or `limit` jobs ran). Returns the count."""
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        release_connections()
+        processed += 1
+    return processed
+
+
+def work(worker_id=None, sleep=1.0, max_jobs=None, stop_when_empty=False):
+    """The runworker loop: poll, run, sleep while idle."""
+    worker_id = worker_id or default_worker_id()
+    autodiscover()
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        release_connections()
+        requeue_stale()
+        ran = run_pending(worker_id, limit=None if max_jobs is None else max_jobs - processed)
+        processed += ran
+        if not ran:
+            if stop_when_empty:
+                break
+            time.sleep(sleep)
+    return processed
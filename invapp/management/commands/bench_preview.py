@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from invapp import previews
+from invapp.models import CardDesign
+
+SAMPLE_PAYLOAD = {
+    'title': 'Ana & Mihai',
+    'bride_name': 'Ana',
+    'groom_name': 'Mihai',
+    'event_date': '2027-06-12',
+    'ceremony_time': '15:00',
+    'party_time': '19:30',
+    'ceremony_location': 'Biserica Sf. Nicolae',
+    'venue_name': 'Salon Regal',
+    'venue_address': 'Str. Lalelelor 4, Cluj-Napoca',
+    'invitation_wording': 'Together with their families',
+    'godparents-TOTAL_FORMS': '2',
+    'godparents-0-name': 'Ioana & Andrei',
+    'godparents-1-name': 'Maria & Dan',
+    'schedule_items-TOTAL_FORMS': '2',
+    'schedule_items-0-activity_type': 'ceremony',
+    'schedule_items-0-time': '15:00',
+    'schedule_items-1-activity_type': 'party',
+    'schedule_items-1-time': '19:30',
+}
+
+
+class Command(BaseCommand):
+    help = 'Measures live preview renders per second, with and without the render cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--design', type=int, help='CardDesign id (default: every active design)')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def _rate(self, design, iterations, cached):
+        previews.preview_cache.clear()
+        started = time.perf_counter()
+        for i in range(iterations):
+            payload = SAMPLE_PAYLOAD if cached else dict(SAMPLE_PAYLOAD, title=f"Ana & Mihai {i}")
+            previews.render_preview(payload, design)
+        return iterations / (time.perf_counter() - started)
+
+    def handle(self, *args, **options):
+        designs = CardDesign.objects.order_by('pk')
+        if options['design']:
+            designs = designs.filter(pk=options['design'])
+        else:
+            designs = designs.filter(is_active=True)
+        if not designs:
+            raise CommandError("No card design to render.")
+
+        iterations = options['iterations']
+        for design in designs:
+            uncached = self._rate(design, iterations, cached=False)
+            cached = self._rate(design, iterations, cached=True)
+            self.stdout.write(
+                f"{design.name} ({design.template_name}): "
+                f"{uncached:.0f} renders/s uncached, {cached:.0f} renders/s cached"
+            )
+        previews.preview_cache.clear()
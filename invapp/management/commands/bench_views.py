@@ -0,0 +1,112 @@
+import json
+import logging
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+from invapp import benchmarks, perf_data
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the hot views over a seeded dataset (built in a throwaway test database) and reports '
+            'p50/p95/p99 latency, queries and bytes per request. Optionally fails on regressions against a baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--guests', type=int, default=20000, help='Guests in the seeded dataset')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per scenario')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Only run this scenario (repeatable)')
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+        parser.add_argument('--baseline', help='JSON from an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed p95 slowdown against the baseline, as a fraction (default 0.25)')
+        parser.add_argument('--current-db', action='store_true',
+                            help='Use the configured database as is (seeded beforehand) instead of a throwaway one')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+
+        # One line per request from PerformanceMiddleware would drown the report
+        perf_logger = logging.getLogger('wedding_project.perf')
+        previous_level = perf_logger.level
+        perf_logger.setLevel(logging.ERROR)
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            own_environment = False  # already inside a test run
+        else:
+            own_environment = True
+        old_config = None
+        try:
+            if not options['current_db']:
+                old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+                self.stdout.write(f"Seeding {options['guests']} guests (seed {options['seed']})...")
+                perf_data.seed(users=options['users'], guests=options['guests'], seed=options['seed'])
+            report = self.run(options)
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+            if own_environment:
+                teardown_test_environment()
+            perf_logger.setLevel(previous_level)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(baseline, report, options['threshold'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def run(self, options):
+        targets = benchmarks.pick_targets()
+        if targets is None or None in targets:
+            raise CommandError("No event with guests to benchmark; run seed_perf_data first.")
+        event, pending_guest, answering_guest = targets
+        scenarios = benchmarks.build_scenarios(event, pending_guest, answering_guest)
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+
+        guests = event.guests.count()
+        self.stdout.write(f"Event {event.pk} with {guests} guests on {connection.vendor}.")
+        self.stdout.write(f"{'scenario':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'bytes':>10}")
+        host, anonymous = Client(), Client()
+        host.force_login(event.owner)
+        results = {}
+        for scenario in scenarios:
+            client = host if scenario.login else anonymous
+            try:
+                result = benchmarks.run_scenario(client, scenario, options['iterations'], options['warmup'])
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            results[scenario.name] = result
+            self.stdout.write(f"{scenario.name:<28} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                              f"{result['p99_ms']:>8.1f} {result['queries']:>8} {result['bytes']:>10}")
+
+        return {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'event_guests': guests,
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'results': results,
+        }
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from invapp import images
+from invapp.models import CardDesign, Event, GalleryImage, ResponsiveImage
+
+IMAGE_FIELDS = [
+    (Event, ['couple_photo', 'landscape_photo', 'main_invitation_image']),
+    (GalleryImage, ['image']),
+    (CardDesign, ['preview_image']),
+]
+
+
+class Command(BaseCommand):
+    help = 'Generates responsive image variants for stored event, gallery and design images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate images that are already done')
+
+    def handle(self, *args, **options):
+        done = ResponsiveImage.objects.filter(status=ResponsiveImage.Status.READY)
+        skip = set() if options['force'] else set(done.values_list('source', flat=True))
+
+        counts = {ResponsiveImage.Status.READY: 0, ResponsiveImage.Status.FAILED: 0}
+        for model, fields in IMAGE_FIELDS:
+            for instance in model.objects.only('pk', *fields).iterator():
+                for field in fields:
+                    image = getattr(instance, field)
+                    backend = images.get_backend(image)
+                    if backend is None:
+                        continue
+                    source = images.source_key(backend, backend.identifier(image))
+                    if source in skip:
+                        continue
+                    skip.add(source)
+                    counts[images.process(source)] += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {counts[ResponsiveImage.Status.READY]} image(s), "
+            f"{counts[ResponsiveImage.Status.FAILED]} failed."
+        ))
@@ -1,63 +1,52 @@
-import csv
-import random
-import string
+import time
 from datetime import timedelta
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils import timezone
-from django.conf import settings
-from invapp.models import Voucher
+from invapp import vouchers
+from invapp.models import Plan
 
 class Command(BaseCommand):
-    help = 'Generates a batch of unique campaign vouchers and exports them to CSV.'
+    help = 'Generates a batch of unique campaign vouchers and streams them to a CSV file.'
 
     def add_arguments(self, parser):
         parser.add_argument('--count', type=int, default=50, help='Number of vouchers to generate')
         parser.add_argument('--campaign', type=str, default='General', help='Name of the campaign')
         parser.add_argument('--days-valid', type=int, default=30, help='How many days the vouchers are valid')
         parser.add_argument('--discount', type=int, default=100, help='Discount percentage (1-100)')
+        parser.add_argument('--plan', type=int, action='append', default=[], dest='plans',
+                            help='Id of a plan the vouchers are limited to (repeatable; default: all plans)')
+        parser.add_argument('--length', type=int, help='Random characters per code (default: VOUCHER_CODE_LENGTH)')
+        parser.add_argument('--alphabet', type=str, help='Characters codes are drawn from (default: VOUCHER_CODE_ALPHABET)')
+        parser.add_argument('--prefix', type=str, help='Code prefix (default: VOUCHER_CODE_PREFIX)')
+        parser.add_argument('--output', type=str, help='CSV path (default: vouchers_<campaign>_<timestamp>.csv)')
 
     def handle(self, *args, **options):
         count = options['count']
         campaign = options['campaign']
-        days_valid = options['days-valid']
-        discount = options['discount']
-        
-        valid_until = timezone.now() + timedelta(days=days_valid)
-        
-        # Base URL for activation (signup with voucher param)
-        # Using a default or settings if available, otherwise a placeholder
-        base_url = "https://invapp-romania.ro/ro/accounts/signup/"
-        
-        vouchers_created = []
-        
+        plans = list(Plan.objects.filter(pk__in=options['plans']))
+        if len(plans) != len(set(options['plans'])):
+            raise CommandError("Unknown plan id in --plan.")
+
+        valid_from = timezone.now()
+        filename = options['output'] or f"vouchers_{campaign}_{valid_from.strftime('%Y%m%d_%H%M')}.csv"
+        plan_names = ", ".join(plan.name for plan in plans) or "All"
+
         self.stdout.write(f"Generating {count} vouchers for campaign '{campaign}'...")
-        
-        for _ in range(count):
-            # Generate a unique code: TARG-XXXX
-            code = f"TARG-{''.join(random.choices(string.ascii_uppercase + string.digits, k=4))}"
-            
-            # Ensure uniqueness
-            while Voucher.objects.filter(code=code).exists():
-                code = f"TARG-{''.join(random.choices(string.ascii_uppercase + string.digits, k=4))}"
-            
-            voucher = Voucher.objects.create(
-                code=code,
-                discount_percentage=discount,
-                campaign_name=campaign,
-                valid_until=valid_until,
-                active=True,
-                max_uses=1 # Single use for these campaigns
-            )
-            vouchers_created.append(voucher)
-            
-        # Export to CSV
-        filename = f"vouchers_{campaign}_{timezone.now().strftime('%Y%m%d_%H%M')}.csv"
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Cod Voucher', 'Link Activare', 'Campanie', 'Valabil Pana La'])
-            for v in vouchers_created:
-                activation_link = f"{base_url}?v={v.code}"
-                writer.writerow([v.code, activation_link, v.campaign_name, v.valid_until.strftime('%Y-%m-%d %H:%M')])
-                
-        self.stdout.write(self.style.SUCCESS(f"Successfully generated {len(vouchers_created)} vouchers."))
+        started = time.perf_counter()
+        batches = vouchers.create_vouchers(
+            count, plan_ids=[plan.pk for plan in plans],
+            length=options['length'], alphabet=options['alphabet'], prefix=options['prefix'],
+            campaign_name=campaign, discount_percentage=options['discount'],
+            valid_from=valid_from, valid_until=valid_from + timedelta(days=options['days_valid']),
+            active=True, max_uses=1,  # Single use for these campaigns
+        )
+        try:
+            with open(filename, 'w', newline='', encoding='utf-8') as csvfile, transaction.atomic():
+                created = vouchers.write_csv(csvfile, batches, campaign, plan_names)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Successfully generated {created} vouchers in {elapsed:.1f}s."))
         self.stdout.write(self.style.SUCCESS(f"CSV file exported to: {filename}"))
@@ -0,0 +1,77 @@
+import os
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.management.commands.collectstatic import Command as CollectStaticCommand
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from invapp.static_storage import OptimizedStaticFilesStorage
+
+
+def _size(num_bytes):
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+
+class Command(BaseCommand):
+    help = ('Collects static files with image recompression, WebP siblings, duplicate collapsing, '
+            'hashed manifest names and gzip/brotli precompression, then prints a size report.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Empty STATIC_ROOT before collecting')
+
+    def _source_size(self):
+        total = 0
+        seen = set()
+        for finder in finders.get_finders():
+            for path, storage in finder.list(['CVS', '.*', '*~']):
+                name = os.path.join(getattr(storage, 'prefix', None) or '', path)
+                if name not in seen:
+                    seen.add(name)
+                    total += storage.size(path)
+        return total, len(seen)
+
+    def _output_size(self, storage):
+        served = {}
+        for hashed_name in set(storage.hashed_files.values()):
+            path = storage.path(hashed_name)
+            if os.path.isfile(path):
+                served[hashed_name] = os.path.getsize(path)
+        compressed = {'.gz': 0, '.br': 0}
+        for root, _dirs, files in os.walk(settings.STATIC_ROOT):
+            for filename in files:
+                extension = os.path.splitext(filename)[1]
+                if extension in compressed:
+                    compressed[extension] += 1
+        return served, compressed
+
+    def handle(self, *args, **options):
+        # Production already uses this storage; elsewhere build it just for this run
+        storage = staticfiles_storage
+        if not isinstance(storage, OptimizedStaticFilesStorage):
+            storage = OptimizedStaticFilesStorage()
+
+        source_bytes, source_count = self._source_size()
+        started = time.perf_counter()
+        collect = CollectStaticCommand()
+        collect.storage = storage
+        call_command(collect, interactive=False, clear=options['clear'], verbosity=0)
+        elapsed = time.perf_counter() - started
+
+        served, compressed = self._output_size(storage)
+        stats = storage.stats
+        lines = [
+            f"Source files:        {source_count} ({_size(source_bytes)})",
+            f"Images recompressed: {stats['images']} ({_size(stats['image_bytes_before'])} -> {_size(stats['image_bytes_after'])})",
+            f"WebP siblings:       {stats['webp']} ({_size(stats['webp_bytes'])})",
+            f"Duplicates merged:   {stats['duplicates']} ({_size(stats['duplicate_bytes'])} no longer served twice)",
+            f"Hashed files served: {len(served)} ({_size(sum(served.values()))})",
+            f"Precompressed:       {compressed['.gz']} gzip, {compressed['.br']} brotli",
+            f"Time:                {elapsed:.1f}s",
+        ]
+        for line in lines:
+            self.stdout.write(line)
+        if not compressed['.br']:
+            self.stdout.write(self.style.WARNING("Brotli is not installed; only gzip files were written."))
+        self.stdout.write(self.style.SUCCESS(f"Static files written to {settings.STATIC_ROOT}."))
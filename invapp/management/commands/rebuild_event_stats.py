@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from invapp.models import Event, EventStats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized EventStats totals from the guest table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, action='append', dest='event_ids', help='Only rebuild this event id (repeatable)')
+
+    def handle(self, *args, **options):
+        event_ids = Event.objects.order_by('pk').values_list('pk', flat=True)
+        if options['event_ids']:
+            event_ids = event_ids.filter(pk__in=options['event_ids'])
+
+        rebuilt = 0
+        for event_id in event_ids.iterator():
+            EventStats.refresh(event_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {rebuilt} event(s)."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from invapp import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (emails, guest imports, voucher batches, Stripe events).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Exit after running this many jobs')
+        parser.add_argument('--once', action='store_true', help='Run every job that is due, then exit')
+        parser.add_argument('--worker-id', default=None, help='Name recorded on claimed jobs (default: host:pid)')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id'] or jobs.default_worker_id()
+        self.stdout.write(f"Worker {worker_id} started.")
+        try:
+            processed = jobs.work(
+                worker_id=worker_id,
+                sleep=options['sleep'],
+                max_jobs=options['max_jobs'],
+                stop_when_empty=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped.")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} job(s)."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from invapp import preview_uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes images uploaded for the live preview once they are older than PREVIEW_UPLOAD_MAX_AGE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, help='Age in seconds (default: PREVIEW_UPLOAD_MAX_AGE)')
+
+    def handle(self, *args, **options):
+        removed = preview_uploads.sweep(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} preview upload(s)."))
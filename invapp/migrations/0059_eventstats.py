@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invapp', '0058_event_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invited', models.PositiveIntegerField(default=0)),
+                ('attending', models.PositiveIntegerField(default=0)),
+                ('declined', models.PositiveIntegerField(default=0)),
+                ('pending', models.PositiveIntegerField(default=0)),
+                ('headcount', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='invapp.event')),
+            ],
+            options={
+                'verbose_name': 'Event Statistics',
+                'verbose_name_plural': 'Event Statistics',
+            },
+        ),
+    ]
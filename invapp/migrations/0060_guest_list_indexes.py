@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:13
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invapp', '0059_eventstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(models.F('event'), django.db.models.functions.text.Lower('name'), models.F('id'), name='guest_event_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['event', 'preferred_language'], name='guest_event_language_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['event', 'invitation_method'], name='guest_event_method_idx'),
+        ),
+    ]
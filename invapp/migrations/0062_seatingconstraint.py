@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invapp', '0061_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatingConstraint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('together', 'Seat together'), ('apart', 'Keep apart')], default='together', max_length=10)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seating_constraints', to='invapp.event')),
+                ('guest_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='invapp.guest')),
+                ('guest_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='invapp.guest')),
+            ],
+            options={
+                'unique_together': {('guest_a', 'guest_b', 'kind')},
+            },
+        ),
+    ]
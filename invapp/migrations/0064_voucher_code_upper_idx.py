@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:49
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invapp', '0063_responsiveimage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(django.db.models.functions.text.Upper('code'), name='voucher_code_upper_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invapp', '0064_voucher_code_upper_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEventLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='stripe_customer_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invapp', '0065_stripe_event_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='result_storage_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,5 +1,7 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, When, Value, F, Q, Count, Sum
+from django.db.models.functions import Coalesce, Lower, Upper
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -133,6 +135,12 @@ class Voucher(models.Model):
     applicable_plans = models.ManyToManyField(Plan, blank=True)
     custom_message = models.TextField(blank=True, help_text=_("Optional custom message for WhatsApp sharing."))
 
+    class Meta:
+        indexes = [
+            # Codes are matched case-insensitively (see invapp/vouchers.py)
+            models.Index(Upper('code'), name='voucher_code_upper_idx'),
+        ]
+
     def __str__(self):
         return f"{self.code} ({self.discount_percentage}%)"
 
@@ -203,6 +211,7 @@ class Event(models.Model):
     audio_greeting = models.FileField(upload_to='audio_greetings/', storage=RawMediaCloudinaryStorage(), blank=True, null=True)
     couple_photo = models.ImageField(upload_to='event_photos/', null=True, blank=True)
     landscape_photo = models.ImageField(upload_to='event_landscape_photos/', null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.title
@@ -229,6 +238,66 @@ class GalleryImage(models.Model):
         return f"Image for {self.event}"
 
 
+def effective_attendance_expressions(prefix=''):
+    """
+    SQL equivalents of Guest.is_attending / Guest.attending_count.
+    `prefix` is the lookup path to the guest (e.g. 'assigned_guests__guest__')
+    so the same logic can be aggregated from related models.
+    """
+    manual = f'{prefix}manual_is_attending'
+    manual_count = f'{prefix}manual_attending_count'
+    rsvp_attending = f'{prefix}rsvp_details__attending'
+    rsvp_count = f'{prefix}rsvp_details__number_attending'
+
+    is_attending = Case(
+        When(**{f'{manual}__isnull': False}, then=F(manual)),
+        default=F(rsvp_attending),
+        output_field=models.BooleanField(null=True),
+    )
+    attending_count = Case(
+        When(**{manual: True}, then=Coalesce(F(manual_count), Value(0))),
+        When(**{manual: False}, then=Value(0)),
+        When(**{rsvp_attending: True, f'{rsvp_count}__gt': 0}, then=F(rsvp_count)),
+        When(**{rsvp_attending: True}, then=Value(1)),
+        default=Value(0),
+        output_field=models.PositiveIntegerField(),
+    )
+    return is_attending, attending_count
+
+
+class GuestQuerySet(models.QuerySet):
+    def with_effective_attendance(self):
+        """
+        Annotates `effective_is_attending`, `effective_attending_count` and
+        `status_priority` (0 attending, 1 pending, 2 declined) so callers can
+        filter, sort and aggregate on attendance in SQL.
+        """
+        is_attending, attending_count = effective_attendance_expressions()
+        return self.annotate(
+            effective_is_attending=is_attending,
+            effective_attending_count=attending_count,
+        ).annotate(
+            status_priority=Case(
+                When(effective_is_attending=True, then=Value(0)),
+                When(effective_is_attending__isnull=True, then=Value(1)),
+                default=Value(2),
+                output_field=models.PositiveSmallIntegerField(),
+            )
+        )
+
+    def attendance_totals(self):
+        queryset = self
+        if 'effective_is_attending' not in self.query.annotations:
+            queryset = self.with_effective_attendance()
+        return queryset.aggregate(
+            invited=Count('id'),
+            attending=Count('id', filter=Q(effective_is_attending=True)),
+            declined=Count('id', filter=Q(effective_is_attending=False)),
+            pending=Count('id', filter=Q(effective_is_attending__isnull=True)),
+            headcount=Coalesce(Sum('effective_attending_count'), Value(0)),
+        )
+
+
 class Guest(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='guests')
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='guests')
@@ -275,8 +344,21 @@ class Guest(models.Model):
     unique_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     preferred_language = models.CharField(max_length=5, choices=settings.LANGUAGES, default='ro')
 
+    objects = GuestQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the guest list: (event, lower(name), id)
+            models.Index(F('event'), Lower('name'), F('id'), name='guest_event_name_idx'),
+            models.Index(fields=['event', 'preferred_language'], name='guest_event_language_idx'),
+            models.Index(fields=['event', 'invitation_method'], name='guest_event_method_idx'),
+        ]
+
+    # Keep in sync with effective_attendance_expressions(); annotated values win when present.
     @property
     def is_attending(self):
+        if hasattr(self, 'effective_is_attending'):
+            return self.effective_is_attending
         if self.manual_is_attending is not None:
             return self.manual_is_attending
         try:
@@ -288,8 +370,10 @@ class Guest(models.Model):
 
     @property
     def attending_count(self):
+        if hasattr(self, 'effective_attending_count'):
+            return self.effective_attending_count
         if self.manual_is_attending is not None:
-            return self.manual_attending_count if self.manual_is_attending else 0
+            return (self.manual_attending_count or 0) if self.manual_is_attending else 0
         try:
             if hasattr(self, 'rsvp_details') and self.rsvp_details.attending:
                 return self.rsvp_details.number_attending or 1
@@ -319,14 +403,67 @@ class RSVP(models.Model):
         return str(format_lazy(_("RSVP for {name} - {status}"), name=self.guest.name, status=status))
 
 
+class EventStats(models.Model):
+    """
+    Denormalized RSVP totals for one event, refreshed on every write path that
+    changes a guest's attendance so dashboards read a single row.
+    """
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, related_name='stats')
+    invited = models.PositiveIntegerField(default=0)
+    attending = models.PositiveIntegerField(default=0)
+    declined = models.PositiveIntegerField(default=0)
+    pending = models.PositiveIntegerField(default=0)
+    headcount = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Event Statistics")
+        verbose_name_plural = _("Event Statistics")
+
+    def __str__(self):
+        return f"Stats for {self.event}"
+
+    @classmethod
+    def refresh(cls, event_id):
+        """
+        Recomputes the totals from the guest table. The stats row is locked first,
+        so concurrent writers for the same event are applied one after another.
+        """
+        with transaction.atomic():
+            stats, created = cls.objects.select_for_update().get_or_create(event_id=event_id)
+            totals = Guest.objects.filter(event_id=event_id).attendance_totals()
+            for field, value in totals.items():
+                setattr(stats, field, value)
+            stats.save()
+        return stats
+
+    @classmethod
+    def get_for(cls, event):
+        """Returns the stats row for `event`, building it on first access."""
+        try:
+            return event.stats
+        except cls.DoesNotExist:
+            return cls.refresh(event.pk)
+
+
+class TableQuerySet(models.QuerySet):
+    def with_seated_count(self):
+        attending_count = effective_attendance_expressions(prefix='assigned_guests__guest__')[1]
+        return self.annotate(seated_count=Coalesce(Sum(attending_count), Value(0)))
+
+
 class Table(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tables')
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='tables')
     name = models.CharField(max_length=100)
     capacity = models.PositiveIntegerField(default=8)
 
+    objects = TableQuerySet.as_manager()
+
     @property
     def current_seated_count(self):
+        if hasattr(self, 'seated_count'):
+            return self.seated_count
         return sum(assignment.guest.attending_count for assignment in self.assigned_guests.all())
 
     @property
@@ -352,13 +489,34 @@ class TableAssignment(models.Model):
         guest_name = self.guest.name if self.guest else _("Unknown Guest")
         table_name = self.table.name if self.table else _("Unknown Table")
         if self.event:
-            return format_lazy(_("{guest} -> {table} for {event}"), guest=guest_name, table=table_name, event=self.event.title)
+            return str(format_lazy(_("{guest} -> {table} for {event}"), guest=guest_name, table=table_name, event=self.event.title))
         return str(format_lazy(_("{guest} -> {table} (No Event Assigned)"), guest=guest_name, table=table_name))
 
 
+class SeatingConstraint(models.Model):
+    """A host's rule for the auto-seating planner (see invapp/seating.py)."""
+
+    class Kind(models.TextChoices):
+        TOGETHER = 'together', _('Seat together')
+        APART = 'apart', _('Keep apart')
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='seating_constraints')
+    guest_a = models.ForeignKey(Guest, on_delete=models.CASCADE, related_name='+')
+    guest_b = models.ForeignKey(Guest, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.TOGETHER)
+
+    class Meta:
+        unique_together = ('guest_a', 'guest_b', 'kind')
+
+    def __str__(self):
+        return f"{self.guest_a} / {self.guest_b}: {self.get_kind_display()}"
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     plan = models.ForeignKey(Plan, on_delete=models.SET_NULL, null=True, blank=True)
+    # Saved from checkout so subscription webhooks find the user without calling Stripe
+    stripe_customer_id = models.CharField(max_length=255, blank=True, db_index=True)
 
     def __str__(self):
         return self.user.username
@@ -489,3 +647,127 @@ class FutureFeature(models.Model):
 
     def __str__(self):
         return self.title_en
+
+
+class Job(models.Model):
+    """
+    A unit of background work, stored in the database and executed by `manage.py runworker`.
+    See invapp/jobs.py for enqueue() and the worker loop.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', _('Queued')
+        RUNNING = 'running', _('Running')
+        SUCCEEDED = 'succeeded', _('Succeeded')
+        FAILED = 'failed', _('Failed')
+
+    public_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    progress_current = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(null=True, blank=True)
+    progress_message = models.CharField(max_length=255, blank=True)
+
+    # Uploaded input and generated output travel with the row: web and worker
+    # processes do not share a filesystem.
+    input_file = models.BinaryField(null=True, blank=True)
+    input_filename = models.CharField(max_length=255, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.BinaryField(null=True, blank=True)
+    result_filename = models.CharField(max_length=255, blank=True)
+    result_content_type = models.CharField(max_length=100, blank=True)
+    # Results too large for a row (admin exports) live in the transfer storage instead
+    result_storage_name = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.SUCCEEDED, self.Status.FAILED)
+
+    @property
+    def progress_percent(self):
+        if self.status == self.Status.SUCCEEDED:
+            return 100
+        if not self.progress_total:
+            return 0
+        return min(100, int(self.progress_current * 100 / self.progress_total))
+
+    def set_progress(self, current, total=None, message=None):
+        """
+        Saves progress right away, which also counts as a heartbeat (see
+        jobs.requeue_stale); inside a transaction it only becomes visible on commit.
+        """
+        self.progress_current = current
+        if total is not None:
+            self.progress_total = total
+        if message is not None:
+            self.progress_message = message[:255]
+        Job.objects.filter(pk=self.pk).update(
+            progress_current=self.progress_current,
+            progress_total=self.progress_total,
+            progress_message=self.progress_message,
+            updated_at=timezone.now(),
+        )
+
+
+class StripeEventLog(models.Model):
+    """
+    Every verified Stripe webhook event, stored once per Stripe event id: redeliveries
+    are acknowledged and dropped, and the worker handles each event at most once.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-received_at']
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
+
+class ResponsiveImage(models.Model):
+    """
+    Sizes of a stored image and of the smaller variants generated for it, so pages
+    can emit srcset/width/height without touching the file. See invapp/images.py.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        READY = 'ready', _('Ready')
+        FAILED = 'failed', _('Failed')
+
+    source = models.CharField(max_length=500, unique=True, help_text=_("Backend name and image identifier"))
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    # [{"format": "webp", "width": 480, "height": 320, "name": "derivatives/..."}]
+    variants = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source
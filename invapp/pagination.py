@@ -0,0 +1,136 @@
+import base64
+import binascii
+import json
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset, with opaque cursors for the
+    neighbouring pages. Exposes `object_list` like Django's Page.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Returns the decoded key values, or None for anything malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def _output_field(queryset, name):
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    try:
+        return queryset.model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def clean_cursor_values(queryset, keys, values):
+    """
+    Converts decoded cursor values to the Python types of their sort fields, or
+    returns None if any of them is not a scalar of that type (or is out of range),
+    so a tampered cursor is treated like a missing one instead of reaching the ORM.
+    """
+    if values is None:
+        return None
+    cleaned = []
+    for (name, _descending), value in zip(keys, values):
+        if value is None or isinstance(value, (list, dict)):
+            return None
+        field = _output_field(queryset, name)
+        if field is not None:
+            try:
+                value = field.to_python(value)
+                field.run_validators(value)
+            except (ValidationError, TypeError, ValueError, OverflowError):
+                return None
+        cleaned.append(value)
+    return cleaned
+
+
+def _seek_filter(keys, values, forward):
+    """
+    Expands the row comparison (k1, k2, ...) > (v1, v2, ...) into OR-ed prefix
+    equalities, since not every backend supports row values.
+    """
+    clauses = []
+    for position, (field, descending) in enumerate(keys):
+        lookup = 'lt' if descending == forward else 'gt'
+        clause = {keys[index][0]: values[index] for index in range(position)}
+        clause[f'{field}__{lookup}'] = values[position]
+        clauses.append(Q(**clause))
+    return reduce(lambda left, right: left | right, clauses)
+
+
+def keyset_paginate(queryset, keys, per_page, after=None, before=None):
+    """
+    Paginates `queryset` on `keys`, a list of (field, descending) pairs whose last
+    entry must be unique (normally the primary key). Every field has to be a real
+    column or an annotation on the queryset.
+    """
+    fields = [field for field, _descending in keys]
+    ordering = [f'-{field}' if descending else field for field, descending in keys]
+    reverse_ordering = [field if descending else f'-{field}' for field, descending in keys]
+
+    after_values = clean_cursor_values(queryset, keys, decode_cursor(after, len(keys)))
+    before_values = clean_cursor_values(queryset, keys, decode_cursor(before, len(keys)))
+
+    if before_values is not None:
+        rows = list(
+            queryset.filter(_seek_filter(keys, before_values, forward=False)).order_by(*reverse_ordering)[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        object_list = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        if after_values is not None:
+            queryset = queryset.filter(_seek_filter(keys, after_values, forward=True))
+        rows = list(queryset.order_by(*ordering)[:per_page + 1])
+        has_next = len(rows) > per_page
+        object_list = rows[:per_page]
+        has_previous = after_values is not None
+
+    def cursor_for(obj):
+        return encode_cursor([getattr(obj, field) for field in fields])
+
+    return KeysetPage(
+        object_list,
+        next_cursor=cursor_for(object_list[-1]) if has_next and object_list else None,
+        previous_cursor=cursor_for(object_list[0]) if has_previous and object_list else None,
+    )
@@ -0,0 +1,140 @@
+"""
+Temporary images for the live preview. A photo picked in the event form is
+uploaded once, downsized to preview resolution and stored under a token
+derived from its content; preview payloads then reference the token instead of
+carrying the image, and the rendered invitation links to a small cacheable URL.
+
+Files are swept after PREVIEW_UPLOAD_MAX_AGE by `manage.py sweep_preview_uploads`.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+UPLOAD_DIR = 'preview_uploads'
+# Payload values of the form "preview-upload:<token>" refer to a stored upload.
+TOKEN_PREFIX = 'preview-upload:'
+TOKEN_RE = re.compile(r'^[0-9a-f]{32}\.(jpg|png)$')
+DATA_URL_RE = re.compile(r'^data:image/[\w.+-]+;base64,', re.IGNORECASE)
+
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png'}
+
+
+class PreviewUploadError(ValueError):
+    pass
+
+
+def get_storage():
+    """
+    PREVIEW_UPLOAD_STORAGE names an entry of STORAGES (e.g. 'default'); unset, the
+    files stay on this machine's disk under PREVIEW_UPLOAD_ROOT.
+    """
+    alias = getattr(settings, 'PREVIEW_UPLOAD_STORAGE', None)
+    if alias:
+        return storages[alias]
+    return FileSystemStorage(location=getattr(settings, 'PREVIEW_UPLOAD_ROOT', settings.MEDIA_ROOT))
+
+
+def is_valid_token(token):
+    return bool(TOKEN_RE.match(token or ''))
+
+
+def token_path(token):
+    return f"{UPLOAD_DIR}/{token}"
+
+
+def token_url(token):
+    return reverse('preview_upload_file', kwargs={'token': token})
+
+
+def _touch(storage, name):
+    # Keeps an image that is still being previewed away from the sweeper
+    try:
+        os.utime(storage.path(name))
+    except (NotImplementedError, OSError):
+        pass
+
+
+def _downsize(raw):
+    max_size = getattr(settings, 'PREVIEW_UPLOAD_MAX_DIMENSION', 1600)
+    try:
+        image = Image.open(BytesIO(raw))
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise PreviewUploadError(_("The file is not an image we can read."))
+
+    image.thumbnail((max_size, max_size))
+    output = BytesIO()
+    if image.mode in ('RGBA', 'LA', 'P') and (image.mode != 'P' or 'transparency' in image.info):
+        image.save(output, 'PNG', optimize=True)
+        return output.getvalue(), 'png'
+    image.convert('RGB').save(output, 'JPEG', quality=82, optimize=True, progressive=True)
+    return output.getvalue(), 'jpg'
+
+
+def store(raw):
+    """Stores image bytes once and returns their token. The same image always gets the same token."""
+    if len(raw) > getattr(settings, 'PREVIEW_UPLOAD_MAX_BYTES', 15 * 1024 * 1024):
+        raise PreviewUploadError(_("The image is too large to preview."))
+
+    storage = get_storage()
+    digest = hashlib.sha256(raw).hexdigest()[:32]
+    for ext in CONTENT_TYPES:
+        name = token_path(f"{digest}.{ext}")
+        if storage.exists(name):
+            _touch(storage, name)
+            return f"{digest}.{ext}"
+
+    content, ext = _downsize(raw)
+    token = f"{digest}.{ext}"
+    storage.save(token_path(token), ContentFile(content))
+    return token
+
+
+def store_file(uploaded_file):
+    return store(uploaded_file.read())
+
+
+def store_data_url(value):
+    """Stores a `data:image/...;base64,` URL and returns its token."""
+    match = DATA_URL_RE.match(value)
+    if not match:
+        raise PreviewUploadError(_("The file is not an image we can read."))
+    try:
+        raw = base64.b64decode(value[match.end():], validate=True)
+    except (binascii.Error, ValueError):
+        raise PreviewUploadError(_("The file is not an image we can read."))
+    return store(raw)
+
+
+def sweep(max_age=None):
+    """Deletes uploads older than `max_age` seconds; returns how many were removed."""
+    if max_age is None:
+        max_age = getattr(settings, 'PREVIEW_UPLOAD_MAX_AGE', 24 * 60 * 60)
+    storage = get_storage()
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    try:
+        _dirs, files = storage.listdir(UPLOAD_DIR)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for filename in files:
+        if not is_valid_token(filename):
+            continue
+        name = token_path(filename)
+        if storage.get_modified_time(name) < cutoff:
+            storage.delete(name)
+            removed += 1
+    return removed
@@ -0,0 +1,332 @@
+"""
+Live invitation previews: one engine behind the event form's preview iframe.
+
+A payload (the event form's fields, as a flat dict of strings) is normalized,
+hashed and looked up in a per-process LRU of rendered HTML. Only on a miss is
+the mock event built - each field goes through the parser registered for it in
+FIELD_PARSERS - and the design template rendered.
+
+Previews are rendered without the request: the invitation templates only use
+the request for the RSVP form's CSRF token, which is left out while
+`is_preview` is set, so the output can be shared between users. The site-wide
+values the context processors add to a live invite (the Maps key, analytics
+ids, site images) are added by site_context instead. The one thing they read
+from the host is whether their plan shows the watermark, which is part of the
+cache key.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.translation import gettext as _
+
+from . import context_processors, preview_uploads
+from .caching import TwoLevelCache
+from .forms import RSVPForm
+from .models import CardDesign, Event, UserProfile
+
+PREVIEW_GUEST_UUID = '00000000-0000-0000-0000-000000000000'
+
+# Form fields that never affect the rendered invitation.
+IGNORED_FIELDS = frozenset({'csrfmiddlewaretoken', 'event_id', 'selected_design'})
+FORMSET_FIELD_RE = re.compile(r'^(godparents|schedule_items)-(\d+)-(\w+)$')
+
+
+def _parse_date(value):
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_time(value):
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_media(value):
+    """
+    New uploads arrive as preview-upload tokens (or, from older clients, data:
+    URIs), stored files as absolute or /media/ relative URLs.
+    """
+    if value.startswith(preview_uploads.TOKEN_PREFIX):
+        token = value[len(preview_uploads.TOKEN_PREFIX):]
+        return SimpleNamespace(url=preview_uploads.token_url(token)) if preview_uploads.is_valid_token(token) else None
+    if value.startswith(('data:', 'http://', 'https://')):
+        return SimpleNamespace(url=value)
+    start = value.find('http')
+    if start > 0 and '://' in value[start:]:
+        return SimpleNamespace(url=value[start:])
+    path = value.lstrip('/')
+    if path.startswith('media/'):
+        return SimpleNamespace(url=f"/{path}")
+    return SimpleNamespace(url=f"{settings.MEDIA_URL}{path}")
+
+
+# field -> parser(str) -> template value; fields not listed are passed through as text.
+FIELD_PARSERS = {
+    'event_date': _parse_date,
+    'party_time': _parse_time,
+    'ceremony_time': _parse_time,
+    'couple_photo': _parse_media,
+    'landscape_photo': _parse_media,
+    'main_invitation_image': _parse_media,
+    'audio_greeting': _parse_media,
+}
+MEDIA_FIELDS = tuple(field for field, parser in FIELD_PARSERS.items() if parser is _parse_media)
+
+
+class PreviewRelated:
+    """Stands in for a related manager (event.godparents, event.schedule_items) in templates."""
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def all(self):
+        return self.objects
+
+    def count(self):
+        return len(self.objects)
+
+    def exists(self):
+        return bool(self.objects)
+
+
+def _load_designs():
+    return {design.pk: design for design in CardDesign.objects.all()}
+
+
+# Invalidated from invapp/signals.py when a CardDesign is saved or deleted.
+designs_cache = TwoLevelCache('previews:designs:v1', _load_designs)
+
+
+def get_design(design_id):
+    try:
+        design_id = int(design_id)
+    except (TypeError, ValueError):
+        return None
+    return designs_cache.get().get(design_id) or CardDesign.objects.filter(pk=design_id).first()
+
+
+# --- Normalization ---
+def store_images(data, files=None, allow_write=None):
+    """
+    Swaps uploaded image files and inline data: images in `data` for
+    preview-upload tokens, so the payload and the rendered HTML stay small.
+    `allow_write()` is asked before each file is stored (the caller's upload
+    throttle). Images that cannot be read or are over the limit are left out.
+    """
+    for field in MEDIA_FIELDS:
+        upload = files.get(field) if files else None
+        value = data.get(field)
+        inline = isinstance(value, str) and value.startswith('data:image')
+        if not (upload or inline):
+            continue
+        if allow_write is not None and not allow_write():
+            data.pop(field, None)
+            continue
+        try:
+            if upload:
+                data[field] = preview_uploads.TOKEN_PREFIX + preview_uploads.store_file(upload)
+            else:
+                data[field] = preview_uploads.TOKEN_PREFIX + preview_uploads.store_data_url(value.strip())
+        except preview_uploads.PreviewUploadError:
+            data.pop(field, None)
+    return data
+
+
+def drop_inline_images(data):
+    """Leaves data: images out of a payload that may not store them (the public preview)."""
+    for field in MEDIA_FIELDS:
+        value = data.get(field)
+        if isinstance(value, str) and value.strip().startswith('data:'):
+            data.pop(field)
+    return data
+
+
+def normalize_payload(data):
+    """
+    Reduces a raw form payload to what the preview depends on: trimmed, non-empty
+    fields plus the godparents and schedule formsets as ordered lists, without
+    deleted rows or management-form bookkeeping. Equal previews normalize equally.
+    """
+    fields = {}
+    formsets = {'godparents': {}, 'schedule_items': {}}
+    for key, value in data.items():
+        if isinstance(value, (list, tuple)):
+            value = value[-1] if value else ''
+        if value is None or key in IGNORED_FIELDS:
+            continue
+        value = str(value).strip()
+        if not value:
+            continue
+        match = FORMSET_FIELD_RE.match(key)
+        if match:
+            prefix, index, name = match.groups()
+            formsets[prefix].setdefault(int(index), {})[name] = value
+        elif '-' not in key:
+            fields[key] = value
+
+    godparents = [row['name'] for _index, row in sorted(formsets['godparents'].items())
+                  if row.get('name') and row.get('DELETE') != 'on']
+    schedule = [[row['activity_type'], row.get('time', '')] for _index, row in sorted(formsets['schedule_items'].items())
+                if row.get('activity_type') and row.get('DELETE') != 'on']
+    return {'fields': fields, 'godparents': godparents, 'schedule': schedule}
+
+
+def payload_hash(normalized):
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+# --- Mock objects ---
+def build_preview_event(normalized, design):
+    event = SimpleNamespace()
+    # Text fields the form left out read as they would on a new Event, as in the live invite
+    for field in Event._meta.concrete_fields:
+        if not field.is_relation and field.attname not in FIELD_PARSERS:
+            setattr(event, field.attname, field.get_default())
+    for field, value in normalized['fields'].items():
+        parser = FIELD_PARSERS.get(field)
+        setattr(event, field, parser(value) if parser else value)
+    for field in FIELD_PARSERS:
+        if not hasattr(event, field):
+            setattr(event, field, None)
+
+    event.date_time = event.event_date  # Alias for older templates
+    event.selected_design = design
+    event.get_couple_photo_url = event.couple_photo.url if event.couple_photo else None
+    event.godparents = PreviewRelated([SimpleNamespace(name=name) for name in normalized['godparents']])
+    schedule = [SimpleNamespace(activity_type=activity, time=_parse_time(time_str) if time_str else None)
+                for activity, time_str in normalized['schedule']]
+    schedule.sort(key=lambda item: item.time or time.min)
+    event.schedule_items = PreviewRelated(schedule)
+    return event
+
+
+def show_watermark_for(user):
+    """Whether `user`'s plan watermarks their invitations (False without a plan, or anonymous)."""
+    if user is None or not user.is_authenticated:
+        return False
+    return bool(UserProfile.objects.filter(user=user).values_list('plan__show_watermark', flat=True).first())
+
+
+def build_preview_owner(show_watermark):
+    """Stands in for event.owner with only what the templates read, so cached HTML holds nothing else of the host."""
+    return SimpleNamespace(userprofile=SimpleNamespace(plan=SimpleNamespace(show_watermark=show_watermark)))
+
+
+def build_preview_guest(event):
+    return SimpleNamespace(
+        unique_id=PREVIEW_GUEST_UUID,
+        name=_('Sample Guest Name'),
+        honorific='family',
+        max_attendees=2,
+        manual_is_attending=None,
+        rsvp_details=SimpleNamespace(attending=None),
+        event=event,
+    )
+
+
+def site_context():
+    """What the context processors add to every invite that does not depend on the viewer."""
+    context = context_processors.seo_settings(None)
+    context.update(context_processors.site_assets(None))
+    return context
+
+
+# --- Render cache ---
+class PreviewCache:
+    """A thread-safe LRU of rendered previews, local to this process."""
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _limit(self):
+        if self.max_entries is not None:
+            return self.max_entries
+        return getattr(settings, 'PREVIEW_CACHE_SIZE', 256)
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def set(self, key, html):
+        limit = self._limit()
+        if limit <= 0:
+            return
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > limit:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+preview_cache = PreviewCache()
+
+
+def render_preview(data, design, fallback_event=None, show_watermark=False):
+    """
+    Returns the invitation HTML for an unsaved event form payload rendered with
+    `design`. Images missing from the payload fall back to `fallback_event`'s
+    stored files, so editing an existing event keeps showing its photos.
+    `show_watermark` is the host's plan setting (see show_watermark_for).
+    """
+    normalized = normalize_payload(data)
+    if fallback_event is not None:
+        for field in MEDIA_FIELDS:
+            stored = getattr(fallback_event, field, None)
+            if field not in normalized['fields'] and stored:
+                normalized['fields'][field] = stored.url
+
+    key = (design.pk, design.template_name, translation.get_language(), bool(show_watermark), payload_hash(normalized))
+    html = preview_cache.get(key)
+    if html is None:
+        event = build_preview_event(normalized, design)
+        event.owner = build_preview_owner(bool(show_watermark))
+        guest = build_preview_guest(event)
+        context = {
+            **site_context(),
+            'event': event,
+            'guest': guest,
+            'form': RSVPForm(guest=guest),
+            'is_preview': True,
+            'google_calendar_link': None,
+            'godparents': [],
+            'schedule_items': [],
+            'gallery_images': [],
+        }
+        html = render_to_string(design.template_name, context)
+        preview_cache.set(key, html)
+    return html
@@ -0,0 +1,236 @@
+"""
+Auto-seating: packs attending guests (each with a party size) into tables,
+honouring keep-together / keep-apart rules between guests.
+
+The solver works on plain ids and sizes so it can be run and tested without
+the database; `build_plan_for_event` loads an event into it.
+"""
+import time
+from collections import namedtuple
+
+from .models import Guest, SeatingConstraint, Table, TableAssignment
+
+SeatingGuest = namedtuple('SeatingGuest', ['id', 'size'])
+SeatingTable = namedtuple('SeatingTable', ['id', 'capacity', 'seated_guest_ids'])
+
+# Local search stops after this many seconds even if it could still improve.
+LOCAL_SEARCH_BUDGET = 0.5
+
+
+class SeatingPlan:
+    def __init__(self, assignments, unseated, broken_constraints):
+        self.assignments = assignments  # {guest_id: table_id} for newly seated guests
+        self.unseated = unseated  # guest ids that did not fit
+        self.broken_constraints = broken_constraints  # (guest_a, guest_b, kind) that could not be honoured
+
+    @property
+    def is_complete(self):
+        return not self.unseated
+
+
+class _Unit:
+    """A keep-together group of guests, placed as one block."""
+    __slots__ = ('index', 'guest_ids', 'size', 'fixed')
+
+    def __init__(self, index, guest_ids, size, fixed=False):
+        self.index = index
+        self.guest_ids = guest_ids
+        self.size = size
+        self.fixed = fixed
+
+
+def _find(parent, item):
+    while parent[item] != item:
+        parent[item] = parent[parent[item]]
+        item = parent[item]
+    return item
+
+
+class _Solver:
+    def __init__(self, guests, tables, keep_together, keep_apart):
+        self.broken = []
+        self.capacity = {table.id: table.capacity for table in tables}
+        self.table_order = [table.id for table in tables]
+        self.max_capacity = max(self.capacity.values(), default=0)
+
+        sizes = {guest.id: max(guest.size, 1) for guest in guests}
+        fixed_table = {}
+        for table in tables:
+            for guest_id in table.seated_guest_ids:
+                fixed_table[guest_id] = table.id
+
+        # 1. Merge keep-together pairs into groups (union-find over the free guests)
+        parent = {guest_id: guest_id for guest_id in sizes}
+        for a, b in keep_together:
+            if a in parent and b in parent:
+                parent[_find(parent, a)] = _find(parent, b)
+        groups = {}
+        for guest_id in sizes:
+            groups.setdefault(_find(parent, guest_id), []).append(guest_id)
+
+        self.units = []
+        self.unit_of = {}
+        for members in sorted(groups.values(), key=lambda ids: min(ids)):
+            size = sum(sizes[guest_id] for guest_id in members)
+            if size > self.max_capacity and len(members) > 1:
+                # Too big for any table: seat the members on their own
+                self.broken.extend((a, b, SeatingConstraint.Kind.TOGETHER) for a, b in keep_together
+                                   if a in members and b in members)
+                chunks = [[guest_id] for guest_id in members]
+            else:
+                chunks = [members]
+            for chunk in chunks:
+                unit = _Unit(len(self.units), sorted(chunk), sum(sizes[guest_id] for guest_id in chunk))
+                self.units.append(unit)
+                for guest_id in chunk:
+                    self.unit_of[guest_id] = unit
+
+        # Guests already seated are immovable units that still take part in keep-apart rules
+        self.table_of = {}
+        self.free = dict(self.capacity)
+        self.members = {table_id: set() for table_id in self.capacity}
+        for guest_id, table_id in fixed_table.items():
+            unit = _Unit(len(self.units), [guest_id], 0, fixed=True)
+            self.units.append(unit)
+            self.unit_of[guest_id] = unit
+            self.table_of[unit.index] = table_id
+            self.members[table_id].add(unit.index)
+
+        # 2. Keep-apart rules between units
+        self.conflicts = {unit.index: set() for unit in self.units}
+        for a, b in keep_apart:
+            unit_a, unit_b = self.unit_of.get(a), self.unit_of.get(b)
+            if unit_a is None or unit_b is None:
+                continue
+            if unit_a is unit_b:
+                self.broken.append((a, b, SeatingConstraint.Kind.APART))
+                continue
+            self.conflicts[unit_a.index].add(unit_b.index)
+            self.conflicts[unit_b.index].add(unit_a.index)
+
+    # --- Helpers ---
+    def _fits(self, unit, table_id, extra_free=0, ignore=None):
+        if self.free[table_id] + extra_free < unit.size:
+            return False
+        conflicts = self.conflicts[unit.index]
+        return not any(other in conflicts and other != ignore for other in self.members[table_id])
+
+    def _place(self, unit, table_id):
+        self.table_of[unit.index] = table_id
+        self.members[table_id].add(unit.index)
+        self.free[table_id] -= unit.size
+
+    def _remove(self, unit):
+        table_id = self.table_of.pop(unit.index)
+        self.members[table_id].discard(unit.index)
+        self.free[table_id] += unit.size
+        return table_id
+
+    def _best_fit(self, unit, exclude=None):
+        best = None
+        for table_id in self.table_order:
+            if table_id == exclude or not self._fits(unit, table_id):
+                continue
+            if best is None or self.free[table_id] < self.free[best]:
+                best = table_id
+        return best
+
+    # --- Phases ---
+    def pack(self):
+        """Best-fit decreasing: largest parties first, each into the tightest table it fits."""
+        movable = [unit for unit in self.units if not unit.fixed]
+        movable.sort(key=lambda unit: (-unit.size, -len(self.conflicts[unit.index]), unit.index))
+        unplaced = []
+        for unit in movable:
+            table_id = self._best_fit(unit)
+            if table_id is None:
+                unplaced.append(unit)
+            else:
+                self._place(unit, table_id)
+        return unplaced
+
+    def _make_room(self, unit, deadline):
+        """
+        Tries to seat `unit` by relocating one placed unit out of a table that would
+        then have room (a one-step ejection chain).
+        """
+        for table_id in sorted(self.table_order, key=lambda t: -self.free[t]):
+            if time.monotonic() > deadline:
+                return False
+            missing = unit.size - self.free[table_id]
+            for other_index in sorted(self.members[table_id], key=lambda i: self.units[i].size):
+                other = self.units[other_index]
+                if other.fixed or other.size < missing:
+                    continue
+                # Would `unit` be allowed at this table once `other` leaves?
+                if not self._fits(unit, table_id, extra_free=other.size, ignore=other_index):
+                    continue
+                self._remove(other)
+                target = self._best_fit(other, exclude=table_id)
+                if target is not None:
+                    self._place(other, target)
+                    self._place(unit, table_id)
+                    return True
+                self._place(other, table_id)
+        return False
+
+    def improve(self, unplaced, budget):
+        """Local search over the unplaced parties, largest first, within `budget` seconds."""
+        deadline = time.monotonic() + budget
+        still_unplaced = []
+        for unit in sorted(unplaced, key=lambda unit: (-unit.size, unit.index)):
+            if sum(self.free.values()) < unit.size:
+                still_unplaced.append(unit)
+                continue
+            table_id = self._best_fit(unit)
+            if table_id is not None:
+                self._place(unit, table_id)
+            elif not self._make_room(unit, deadline):
+                still_unplaced.append(unit)
+        return still_unplaced
+
+    def solve(self, budget):
+        unplaced = self.improve(self.pack(), budget)
+        assignments = {}
+        for unit in self.units:
+            if unit.fixed or unit.index not in self.table_of:
+                continue
+            for guest_id in unit.guest_ids:
+                assignments[guest_id] = self.table_of[unit.index]
+        unseated = sorted(guest_id for unit in unplaced for guest_id in unit.guest_ids)
+        return SeatingPlan(assignments, unseated, self.broken)
+
+
+def solve_seating(guests, tables, keep_together=(), keep_apart=(), budget=LOCAL_SEARCH_BUDGET):
+    """
+    guests: SeatingGuest list still to be seated.
+    tables: SeatingTable list; `capacity` is the number of free seats and
+            `seated_guest_ids` the guests already there (only used for keep-apart).
+    keep_together / keep_apart: iterables of (guest_id, guest_id) pairs.
+    """
+    return _Solver(list(guests), list(tables), list(keep_together), list(keep_apart)).solve(budget)
+
+
+def build_plan_for_event(event, budget=LOCAL_SEARCH_BUDGET):
+    """Runs the solver for every attending guest of `event` who has no table yet."""
+    tables = list(Table.objects.filter(event=event).with_seated_count().order_by('name', 'id'))
+    seated = {}
+    for guest_id, table_id in TableAssignment.objects.filter(table__event=event).values_list('guest_id', 'table_id'):
+        seated.setdefault(table_id, []).append(guest_id)
+
+    guests = Guest.objects.filter(event=event, tableassignment__isnull=True) \
+        .with_effective_attendance() \
+        .filter(effective_is_attending=True) \
+        .values_list('id', 'effective_attending_count')
+
+    constraints = SeatingConstraint.objects.filter(event=event).values_list('guest_a_id', 'guest_b_id', 'kind')
+    keep_together = [(a, b) for a, b, kind in constraints if kind == SeatingConstraint.Kind.TOGETHER]
+    keep_apart = [(a, b) for a, b, kind in constraints if kind == SeatingConstraint.Kind.APART]
+
+    return solve_seating(
+        [SeatingGuest(guest_id, size or 0) for guest_id, size in guests],
+        [SeatingTable(table.id, max(table.capacity - table.seated_count, 0), seated.get(table.id, [])) for table in tables],
+        keep_together,
+        keep_apart,
+        budget=budget,
+    )
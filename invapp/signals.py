@@ -0,0 +1,63 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .context_processors import plans_cache, site_images_cache
+from . import vouchers
+from .models import CardDesign, Event, Godparent, ScheduleItem, GalleryImage, Plan, SiteImage, Voucher
+from .previews import designs_cache
+
+
+@receiver([post_save, post_delete], sender=Godparent)
+@receiver([post_save, post_delete], sender=ScheduleItem)
+@receiver([post_save, post_delete], sender=GalleryImage)
+def touch_event_on_related_change(sender, instance, **kwargs):
+    """
+    Bumps Event.updated_at when an inline relation changes, so the cached
+    invitation shells keyed on it (see invite_cache) are not served stale.
+    """
+    if instance.event_id:
+        Event.objects.filter(pk=instance.event_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=SiteImage)
+def invalidate_site_images(sender, **kwargs):
+    site_images_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def invalidate_plans(sender, **kwargs):
+    plans_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=CardDesign)
+def invalidate_designs(sender, **kwargs):
+    designs_cache.invalidate()
+
+
+@receiver(pre_save, sender=Voucher)
+def remember_voucher_code(sender, instance, **kwargs):
+    # A renamed code must stop resolving too; invalidate_voucher drops it after the save
+    instance._previous_code = None
+    if instance.pk:
+        instance._previous_code = Voucher.objects.filter(pk=instance.pk).values_list('code', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Voucher)
+def invalidate_voucher(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_code', None)
+    if previous and previous != instance.code:
+        vouchers.invalidate_many([previous, instance.code])
+    else:
+        vouchers.invalidate(instance.code)
+
+
+@receiver(m2m_changed, sender=Voucher.applicable_plans.through)
+def invalidate_voucher_plans(sender, instance, **kwargs):
+    if isinstance(instance, Voucher):
+        vouchers.invalidate(instance.code)
+    else:
+        # Changed from the plan's side: every voucher touched is in pk_set
+        pks = kwargs.get('pk_set')
+        qs = Voucher.objects.filter(pk__in=pks) if pks else Voucher.objects.filter(applicable_plans=instance)
+        vouchers.invalidate_many(qs.values_list('code', flat=True))
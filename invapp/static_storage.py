@@ -0,0 +1,140 @@
+"""
+Static files storage used in production (see STORAGES in settings) and by
+`manage.py optimize_static`. On top of WhiteNoise's hashed manifest and
+gzip/brotli precompression it:
+
+- recompresses collected PNG/JPEG files (only when that makes them smaller)
+  and writes a WebP sibling next to each (foo.png -> foo.webp);
+- points every copy of identical content at one hashed file, so the browser
+  downloads and caches it once, and hard-links the duplicates on disk.
+
+Hashed names are served by WhiteNoise with far-future immutable headers.
+"""
+import hashlib
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+IMAGE_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG'}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+class OptimizedStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    # A name missing from the manifest (e.g. collectstatic not run yet) raises
+    # here and is served unhashed by stored_name() instead of failing the page.
+    manifest_strict = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'images': 0, 'image_bytes_before': 0, 'image_bytes_after': 0,
+            'webp': 0, 'webp_bytes': 0, 'duplicates': 0, 'duplicate_bytes': 0,
+        }
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    # --- Images ---
+    def _optimize_image(self, name):
+        """Returns (bytes before, bytes after, WebP bytes) or None if the file is not a readable image."""
+        path = self.path(name)
+        pil_format = IMAGE_FORMATS[os.path.splitext(name)[1].lower()]
+        with open(path, 'rb') as handle:
+            original = handle.read()
+        try:
+            image = Image.open(BytesIO(original))
+            image.load()
+        except (OSError, Image.DecompressionBombError):
+            return None
+
+        output = BytesIO()
+        if pil_format == 'PNG':
+            image.save(output, 'PNG', optimize=True)
+        else:
+            image.convert('RGB').save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        optimized = output.getvalue()
+        if len(optimized) < len(original):
+            with open(path, 'wb') as handle:
+                handle.write(optimized)
+
+        webp = BytesIO()
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image.convert('RGBA' if has_alpha else 'RGB').save(webp, 'WEBP', quality=WEBP_QUALITY)
+        return len(original), min(len(original), len(optimized)), webp.getvalue()
+
+    def optimize_images(self, paths):
+        """Recompresses collected images in place and adds their WebP siblings to `paths`."""
+        names = [name for name in paths if os.path.splitext(name)[1].lower() in IMAGE_FORMATS]
+        # Pillow releases the GIL while encoding, so threads use every core
+        with ThreadPoolExecutor() as executor:
+            results = list(executor.map(self._optimize_image, names))
+
+        for name, result in zip(names, results):
+            if result is None:
+                continue
+            before, after, webp = result
+            self.stats['images'] += 1
+            self.stats['image_bytes_before'] += before
+            self.stats['image_bytes_after'] += after
+            # Hash and compress the optimized copy, not the source file
+            paths[name] = (self, name)
+
+            webp_name = os.path.splitext(name)[0] + '.webp'
+            if webp_name in paths:
+                continue
+            with open(self.path(webp_name), 'wb') as handle:
+                handle.write(webp)
+            paths[webp_name] = (self, webp_name)
+            self.stats['webp'] += 1
+            self.stats['webp_bytes'] += len(webp)
+
+    # --- Duplicates ---
+    def collapse_duplicates(self):
+        """Maps every name whose hashed file has the same content to a single hashed file."""
+        by_digest = defaultdict(list)
+        for name, hashed_name in self.hashed_files.items():
+            path = self.path(hashed_name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as handle:
+                by_digest[hashlib.sha256(handle.read()).hexdigest()].append((name, hashed_name))
+
+        for entries in by_digest.values():
+            hashed_names = sorted({hashed_name for _name, hashed_name in entries})
+            if len(hashed_names) < 2:
+                continue
+            canonical = hashed_names[0]
+            canonical_path = self.path(canonical)
+            for name, hashed_name in entries:
+                if hashed_name == canonical:
+                    continue
+                self.hashed_files[name] = canonical
+                duplicate_path = self.path(hashed_name)
+                if os.path.exists(duplicate_path) and not os.path.samefile(duplicate_path, canonical_path):
+                    self.stats['duplicates'] += 1
+                    self.stats['duplicate_bytes'] += os.path.getsize(duplicate_path)
+                    os.unlink(duplicate_path)
+                    try:
+                        os.link(canonical_path, duplicate_path)
+                    except OSError:
+                        pass
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            self.reset_stats()
+            self.optimize_images(paths)
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if not dry_run:
+            self.collapse_duplicates()
+            self.save_manifest()
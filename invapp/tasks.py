@@ -0,0 +1,180 @@
+"""
+Background tasks executed by `manage.py runworker`. Each one receives the Job
+and returns a JSON-serialisable result; see invapp/jobs.py.
+"""
+import io
+import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.mail import send_mail
+from django.db import transaction
+from django.utils import timezone, translation
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+from django.urls import reverse
+from django.utils.translation import gettext as _
+
+from . import importers, transfers, vouchers
+from .jobs import task, PermanentJobError
+from .models import Event, EventStats, Plan, StripeEventLog, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+@task('send_email')
+def send_email_task(job):
+    payload = job.payload
+    send_mail(payload['subject'], payload['message'], payload.get('from_email') or settings.DEFAULT_FROM_EMAIL,
+              payload['recipient_list'])
+    return {'sent': len(payload['recipient_list'])}
+
+
+@task('import_guests')
+def import_guests_task(job):
+    event = Event.objects.select_related('owner__userprofile__plan').get(pk=job.payload['event_id'], owner_id=job.owner_id)
+    plan = event.owner.userprofile.plan
+    limit = plan.max_guests - event.guests.count() if plan else None
+    upload = ContentFile(bytes(job.input_file), name=job.input_filename)
+
+    with translation.override(job.payload.get('language')):
+        job.set_progress(0, message=_("Importing guests..."))
+        try:
+            result = importers.import_guests(event, event.owner, upload, limit=limit)
+        except importers.GuestImportError as e:
+            raise PermanentJobError(str(e))
+    return {
+        'created': result.created,
+        'errors': [[error.row, str(error.message)] for error in result.errors],
+    }
+
+
+# --- Vouchers ---
+@task('generate_vouchers')
+def generate_vouchers_task(job):
+    payload = job.payload
+    count = payload['count']
+    campaign = payload.get('campaign') or ''
+    selected_plan_ids = payload.get('plan_ids') or []
+    valid_from = parse_datetime(payload['valid_from']) if payload.get('valid_from') else timezone.now()
+
+    with translation.override(payload.get('language')):
+        job.set_progress(0, count, _("Generating vouchers..."))
+        plan_names = _("All")
+        if selected_plan_ids:
+            plan_names = ", ".join(Plan.objects.filter(id__in=selected_plan_ids).values_list('name', flat=True))
+
+        batches = vouchers.create_vouchers(
+            count, plan_ids=selected_plan_ids, length=payload.get('code_length'),
+            campaign_name=campaign, discount_percentage=payload['discount'],
+            valid_from=valid_from, valid_until=valid_from + timedelta(days=payload['days_valid']),
+            active=True, max_uses=1, custom_message=payload.get('custom_message', ''))
+        output = io.StringIO()
+        try:
+            # One transaction, so a failed attempt leaves no partial campaign behind for the retry
+            with transaction.atomic():
+                created = vouchers.write_csv(output, batches, campaign, plan_names)
+        except vouchers.CodeSpaceExhausted as e:
+            raise PermanentJobError(str(e))
+
+        job.result_file = output.getvalue().encode('utf-8')
+        job.result_filename = f"vouchers_{slugify(campaign) if campaign else 'direct_sale'}.csv"
+        job.result_content_type = 'text/csv'
+        job.set_progress(count, count)
+    return {'created': created}
+
+
+# --- Admin import/export ---
+@task('admin_export')
+def admin_export_task(job):
+    payload = job.payload
+    with translation.override(payload.get('language')):
+        job.result_storage_name = transfers.export_queryset(job, payload)
+    job.result_filename = payload['filename']
+    job.result_content_type = payload['content_type']
+    return {'rows': job.progress_total}
+
+
+@task('admin_import')
+def admin_import_task(job):
+    payload = job.payload
+    dry_run = payload.get('dry_run', True)
+    with translation.override(payload.get('language')):
+        job.result_storage_name, totals, errors, event_ids = transfers.import_dataset(job, payload, user=job.owner)
+    # Imports write guests and RSVPs directly, so the dashboards' totals are rebuilt here
+    for event_id in sorted(event_ids):
+        EventStats.refresh(event_id)
+    job.result_filename = f"{'dry_run' if dry_run else 'import'}_report_{job.public_id}.csv"
+    job.result_content_type = 'text/csv'
+    result = {'dry_run': dry_run, 'totals': totals, 'errors': errors}
+    if dry_run and not errors:
+        opts = apps.get_model(payload['model'])._meta
+        result['confirm_url'] = reverse(f'admin:{opts.app_label}_{opts.model_name}_import_confirm',
+                                        kwargs={'job_id': job.public_id})
+    if not dry_run:
+        transfers.get_storage().delete(payload['input'])
+    return result
+
+
+# --- Stripe ---
+def _downgrade_customer(customer_id):
+    profiles = UserProfile.objects.filter(stripe_customer_id=customer_id)
+    if not profiles.exists():
+        # Customers from checkouts made before their id was saved: look them up once and remember
+        import stripe
+
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        email = stripe.Customer.retrieve(customer_id).get('email')
+        if not email:
+            logger.warning("Stripe customer %s has no email; cannot downgrade", customer_id)
+            return
+        profiles = UserProfile.objects.filter(user__email=email)
+        if not profiles.update(stripe_customer_id=customer_id):
+            logger.warning("No user with email %s for Stripe customer %s", email, customer_id)
+            return
+    profiles.update(plan=None)
+    logger.info("Downgraded Stripe customer %s (subscription ended)", customer_id)
+
+
+def handle_stripe_event(event):
+    # --- 1. PAYMENT COMPLETED ---
+    if event['type'] == 'checkout.session.completed':
+        session = event['data']['object']
+        metadata = session.get('metadata') or {}
+        user_id = metadata.get('user_id')
+        plan_id = metadata.get('plan_id')
+
+        if user_id and plan_id:
+            user = User.objects.get(id=user_id)
+            new_plan = Plan.objects.get(id=plan_id)
+
+            profile, _created = UserProfile.objects.get_or_create(user=user)
+            profile.plan = new_plan
+            if session.get('customer'):
+                profile.stripe_customer_id = session['customer']
+            profile.save()
+            logger.info("Upgraded %s to plan '%s' (checkout %s)", user.username, new_plan.name, session.get('id'))
+
+    # --- 2. NEW SUBSCRIPTION CREATED ---
+    elif event['type'] == 'customer.subscription.created':
+        subscription = event['data']['object']
+        logger.info("Subscription %s created for customer %s", subscription.get('id'), subscription.get('customer'))
+
+    # --- 3. SUBSCRIPTION CANCELLED ---
+    elif event['type'] == 'customer.subscription.deleted':
+        _downgrade_customer(event['data']['object'].get('customer'))
+
+
+@task('stripe_event')
+def stripe_event_task(job):
+    with transaction.atomic():
+        log = StripeEventLog.objects.select_for_update().get(pk=job.payload['event_log_id'])
+        if log.processed_at:
+            return {'type': log.event_type, 'skipped': True}
+        handle_stripe_event(log.payload)
+        log.processed_at = timezone.now()
+        log.save(update_fields=['processed_at'])
+    return {'type': log.event_type}
@@ -0,0 +1,44 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from invapp.images import get_image_info
+
+register = template.Library()
+
+
+def _srcset(candidates):
+    return ', '.join(f"{url} {width}w" for url, width in candidates)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', loading='lazy', **attrs):
+    """
+    Renders an <img> for a stored image with srcset/sizes and its intrinsic
+    width/height, wrapped in a layout-neutral <picture> offering WebP first.
+    Extra keyword arguments become attributes of the <img>:
+
+        {% responsive_image event.couple_photo alt=event.title sizes="(min-width: 768px) 50vw, 100vw" class="w-full" %}
+    """
+    if not image:
+        return ''
+    info = get_image_info(image)
+    if not info.url:
+        return ''
+
+    img_attrs = {'src': info.url, 'alt': alt, 'loading': loading, 'decoding': 'async'}
+    if info.width and info.height:
+        img_attrs.update(width=info.width, height=info.height)
+    img_attrs.update((key.replace('_', '-'), value) for key, value in attrs.items())
+
+    if not info.srcsets:
+        return format_html('<img{}>', flatatt(img_attrs))
+
+    if info.srcsets.get('jpeg'):
+        img_attrs.update(srcset=_srcset(info.srcsets['jpeg']), sizes=sizes)
+    source = ''
+    if info.srcsets.get('webp'):
+        source = format_html('<source type="image/webp"{}>',
+                             flatatt({'srcset': _srcset(info.srcsets['webp']), 'sizes': sizes}))
+    # display: contents keeps the <img> sized by its own classes, as if <picture> were not there
+    return format_html('<picture style="display: contents">{}<img{}></picture>', source, flatatt(img_attrs))
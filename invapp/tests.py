@@ -1,7 +1,37 @@
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
-from .models import Event, Guest, RSVP, Plan, UserProfile, CardDesign
+import base64
+import csv
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from django.db import OperationalError, connection
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.utils import timezone, translation
+from .models import Event, EventStats, MarketingCampaign, PlatformPartner, Guest, Job, RSVP, Plan, UserProfile, CardDesign, ResponsiveImage, SeatingConstraint, SiteImage, SpecialField, StripeEventLog, Table, TableAssignment, Voucher
+from . import context_processors, images, importers, invite_cache, jobs, pagination, perf_data, preview_uploads, previews, seating, views, vouchers
 from django.urls import reverse
+from .throttling import TokenBucket, client_ip
+from . import urls as invapp_urls
+from django.contrib.admin import site as admin_site
+from django.contrib.sites.models import Site
+from allauth.socialaccount.models import SocialApp
+from import_export.formats import base_formats
 
 class DashboardPerformanceTest(TestCase):
     def setUp(self):
@@ -58,3 +88,1706 @@ class DashboardPerformanceTest(TestCase):
         # confirmed_count counts GUESTS (rows) that are attending.
         self.assertEqual(event.confirmed_count, 1)
         self.assertEqual(event.total_guests_count, 2)
+
+
+@override_settings(INVITE_CACHE_TIMEOUT=300)
+class InvitationRenderCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='host', password='password123')
+        self.design = CardDesign.objects.create(name='Image', template_name='invapp/invites/image_based_invite.html')
+        self.event = Event.objects.create(owner=self.user, title="Cached Wedding", selected_design=self.design)
+        self.guest1 = Guest.objects.create(owner=self.user, event=self.event, name="Ana & Co", preferred_language='ro')
+        self.guest2 = Guest.objects.create(owner=self.user, event=self.event, name="Bogdan", preferred_language='ro')
+
+    def get_invite(self, guest):
+        return self.client.get(reverse('invapp:guest_invite', kwargs={'guest_uuid': guest.unique_id}))
+
+    def test_second_guest_is_stitched_into_cached_shell(self):
+        first = self.get_invite(self.guest1)
+        self.assertEqual(first.status_code, 200)
+        self.assertContains(first, "Ana &amp; Co")
+
+        with patch('invapp.invite_cache.render_to_string') as render_mock:
+            second = self.get_invite(self.guest2)
+            render_mock.assert_not_called()
+
+        html = second.content.decode()
+        self.assertIn("Bogdan", html)
+        self.assertIn(str(self.guest2.unique_id), html)
+        self.assertNotIn("Ana &amp; Co", html)
+        self.assertNotIn(str(self.guest1.unique_id), html)
+        self.assertNotIn(invite_cache.GUEST_NAME_PLACEHOLDER, html)
+        self.assertNotIn(invite_cache.CSRF_TOKEN_PLACEHOLDER, html)
+
+    def test_event_change_invalidates_shell(self):
+        self.get_invite(self.guest1)
+        self.event.title = "Renamed Wedding"
+        self.event.save()
+
+        response = self.get_invite(self.guest2)
+        self.assertContains(response, "Renamed Wedding")
+
+    def test_answered_guest_bypasses_cache(self):
+        RSVP.objects.create(guest=self.guest1, attending=True, number_attending=1)
+        with patch('invapp.invite_cache.get_or_render') as cached_render:
+            response = self.get_invite(self.guest1)
+            cached_render.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+
+
+class EventStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='statsuser', password='password123')
+        self.plan = Plan.objects.create(name='Stats Plan', price=0, max_events=5, max_guests=100)
+        profile, _ = UserProfile.objects.get_or_create(user=self.user)
+        profile.plan = self.plan
+        profile.save()
+        self.event = Event.objects.create(owner=self.user, title="Stats Wedding")
+        self.attending = Guest.objects.create(owner=self.user, event=self.event, name="Yes", max_attendees=3)
+        RSVP.objects.create(guest=self.attending, attending=True, number_attending=3)
+        self.declined = Guest.objects.create(owner=self.user, event=self.event, name="No")
+        RSVP.objects.create(guest=self.declined, attending=False)
+        self.manual = Guest.objects.create(owner=self.user, event=self.event, name="Manual",
+                                           manual_is_attending=True, manual_attending_count=2)
+        self.pending = Guest.objects.create(owner=self.user, event=self.event, name="Pending")
+        self.client.login(username='statsuser', password='password123')
+
+    def test_refresh_matches_python_properties(self):
+        stats = EventStats.refresh(self.event.id)
+        guests = list(Guest.objects.filter(event=self.event).select_related('rsvp_details'))
+        self.assertEqual(stats.invited, 4)
+        self.assertEqual(stats.attending, 2)
+        self.assertEqual(stats.declined, 1)
+        self.assertEqual(stats.pending, 1)
+        self.assertEqual(stats.headcount, sum(g.attending_count for g in guests))
+
+    def test_manual_override_updates_stats(self):
+        EventStats.refresh(self.event.id)
+        url = reverse('invapp:update_attendance', kwargs={'guest_id': self.pending.id})
+        response = self.client.post(url, data='{"number_attending": 4}', content_type='application/json')
+        self.assertEqual(response.json()['new_total_attending'], 9)
+        stats = EventStats.objects.get(event=self.event)
+        self.assertEqual(stats.attending, 3)
+        self.assertEqual(stats.pending, 0)
+
+    def test_guest_rsvp_and_delete_update_stats(self):
+        url = reverse('invapp:guest_invite', kwargs={'guest_uuid': self.pending.unique_id})
+        self.client.post(url, {'attending': 'False'})
+        self.assertEqual(EventStats.objects.get(event=self.event).declined, 2)
+
+        self.client.post(reverse('invapp:guest_delete', kwargs={'pk': self.declined.pk}))
+        stats = EventStats.objects.get(event=self.event)
+        self.assertEqual(stats.invited, 3)
+        self.assertEqual(stats.declined, 1)
+
+    def test_rebuild_command(self):
+        EventStats.objects.all().delete()
+        call_command('rebuild_event_stats', stdout=StringIO())
+        self.assertEqual(EventStats.objects.get(event=self.event).headcount, 5)
+
+
+class EffectiveAttendanceQuerySetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queryset', password='password123')
+        self.event = Event.objects.create(owner=self.user, title="Queryset Wedding")
+        # (manual_is_attending, manual_attending_count, rsvp attending, rsvp number_attending)
+        combinations = [
+            (None, None, None, None),
+            (None, None, True, 3),
+            (None, None, True, None),
+            (None, None, True, 0),
+            (None, None, False, None),
+            (None, None, 'no-rsvp', None),
+            (True, 2, False, None),
+            (True, None, None, None),
+            (False, None, True, 4),
+            (False, 3, 'no-rsvp', None),
+        ]
+        for index, (manual, manual_count, attending, number) in enumerate(combinations):
+            guest = Guest.objects.create(
+                owner=self.user, event=self.event, name=f"Guest {index}",
+                manual_is_attending=manual, manual_attending_count=manual_count
+            )
+            if attending != 'no-rsvp':
+                RSVP.objects.create(guest=guest, attending=attending, number_attending=number)
+
+    def test_annotations_match_python_properties(self):
+        annotated = {g.pk: g for g in Guest.objects.filter(event=self.event).with_effective_attendance()}
+        for guest in Guest.objects.filter(event=self.event).select_related('rsvp_details'):
+            with self.subTest(guest=guest.name):
+                self.assertEqual(annotated[guest.pk].effective_is_attending, guest.is_attending)
+                self.assertEqual(annotated[guest.pk].effective_attending_count, guest.attending_count)
+
+    def test_annotated_properties_skip_rsvp_queries(self):
+        guests = list(Guest.objects.filter(event=self.event).with_effective_attendance())
+        with self.assertNumQueries(0):
+            total = sum(g.attending_count for g in guests)
+        self.assertEqual(total, Guest.objects.filter(event=self.event).attendance_totals()['headcount'])
+
+    def test_table_seated_count_matches_python(self):
+        table = Table.objects.create(owner=self.user, event=self.event, name="T1", capacity=20)
+        for guest in Guest.objects.filter(event=self.event):
+            TableAssignment.objects.create(event=self.event, guest=guest, table=table)
+        annotated = Table.objects.with_seated_count().get(pk=table.pk)
+        self.assertEqual(annotated.current_seated_count, Table.objects.get(pk=table.pk).current_seated_count)
+
+    def test_guest_list_sorts_by_status_in_sql(self):
+        plan = Plan.objects.create(name='Sort Plan', price=0, max_events=5, max_guests=100)
+        UserProfile.objects.filter(user=self.user).update(plan=plan)
+        self.client.login(username='queryset', password='password123')
+        response = self.client.get(reverse('invapp:guest_list', kwargs={'event_id': self.event.id}), {'sort': 'status'})
+        priorities = [0 if g.is_attending is True else 1 if g.is_attending is None else 2 for g in response.context['guests']]
+        self.assertEqual(priorities, sorted(priorities))
+
+
+class GuestListPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', password='password123')
+        plan = Plan.objects.create(name='Pager Plan', price=0, max_events=5, max_guests=1000)
+        UserProfile.objects.filter(user=self.user).update(plan=plan)
+        self.event = Event.objects.create(owner=self.user, title="Big Wedding")
+        Guest.objects.bulk_create([
+            Guest(owner=self.user, event=self.event, name=f"guest {index:03d}",
+                  preferred_language='en' if index % 3 == 0 else 'ro',
+                  manual_is_attending=True if index % 2 == 0 else None,
+                  manual_attending_count=2 if index % 2 == 0 else None)
+            for index in range(120)
+        ])
+        self.url = reverse('invapp:guest_list', kwargs={'event_id': self.event.id})
+        self.client.login(username='pager', password='password123')
+
+    def walk(self, params):
+        names, after = [], None
+        while True:
+            response = self.client.get(self.url, {**params, **({'after': after} if after else {})})
+            page = response.context['page']
+            self.assertLessEqual(len(page), views.GUEST_LIST_PAGE_SIZE)
+            names.extend(g.name for g in page)
+            if not page.has_next:
+                return names
+            after = page.next_cursor
+
+    def test_pages_cover_every_guest_once_in_order(self):
+        names = self.walk({'sort': 'name'})
+        self.assertEqual(names, sorted(Guest.objects.filter(event=self.event).values_list('name', flat=True)))
+
+        status_names = self.walk({'sort': 'status'})
+        self.assertEqual(len(status_names), 120)
+        self.assertEqual(len(set(status_names)), 120)
+
+    def test_previous_cursor_returns_previous_page(self):
+        first = self.client.get(self.url, {'sort': '-name'}).context['page']
+        second = self.client.get(self.url, {'sort': '-name', 'after': first.next_cursor}).context['page']
+        back = self.client.get(self.url, {'sort': '-name', 'before': second.previous_cursor}).context['page']
+        self.assertEqual([g.pk for g in back], [g.pk for g in first])
+
+    def test_cursor_with_wrong_value_types_is_ignored(self):
+        first_page = [g.pk for g in self.client.get(self.url, {'sort': 'status'}).context['page']]
+        for values in ([[1], 'a', 1], [None, 'a', 1], [{'x': 1}, 'a', 1], ['high', 'a', 1], [0, 'a', 10 ** 30]):
+            cursor = pagination.encode_cursor(values)
+            for direction in ('after', 'before'):
+                with self.subTest(values=values, direction=direction):
+                    response = self.client.get(self.url, {'sort': 'status', direction: cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual([g.pk for g in response.context['page']], first_page)
+
+    def test_filters_and_aggregate_totals(self):
+        response = self.client.get(self.url, {'status': 'attending', 'language': 'en'})
+        expected = [i for i in range(120) if i % 2 == 0 and i % 3 == 0]
+        self.assertEqual(len(response.context['guests']), len(expected))
+        self.assertEqual(response.context['filtered_totals']['headcount'], 2 * len(expected))
+        self.assertEqual(response.context['stats'].invited, 120)
+
+        response = self.client.get(self.url, {'q': 'guest 11'})
+        self.assertEqual(len(response.context['guests']), 10)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='password123')
+        self.event = Event.objects.create(owner=self.user, title="Export Wedding")
+        self.table = Table.objects.create(owner=self.user, event=self.event, name="Table 1", capacity=10)
+        self.ana = Guest.objects.create(owner=self.user, event=self.event, name="Ana Ștefan", max_attendees=2)
+        RSVP.objects.create(guest=self.ana, attending=True, number_attending=2,
+                            meal_preference="Vegetarian", message="See you there!")
+        TableAssignment.objects.create(guest=self.ana, table=self.table)
+        Guest.objects.create(owner=self.user, event=self.event, name="Bogdan")
+        self.client.login(username='exporter', password='password123')
+
+    def test_guest_csv_is_streamed_with_rsvp_details(self):
+        response = self.client.get(reverse('invapp:guest_export', kwargs={'event_id': self.event.id}))
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        lines = content.lstrip('\ufeff').splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('Ana Ștefan', lines[1])
+        self.assertIn('Vegetarian', lines[1])
+        self.assertIn('See you there!', lines[1])
+        self.assertIn('Table 1', lines[1])
+
+    def test_xlsx_exports(self):
+        from openpyxl import load_workbook
+
+        response = self.client.get(reverse('invapp:guest_export', kwargs={'event_id': self.event.id}), {'format': 'xlsx'})
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][1], 'Ana Ștefan')
+        self.assertEqual(rows[1][9], 'Vegetarian')
+
+        response = self.client.get(reverse('invapp:export_assignments_csv', kwargs={'event_id': self.event.id}), {'format': 'xlsx'})
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[1][1:5], ('Ana Ștefan', None, None, 'Table 1'))
+
+    def test_formulas_typed_by_guests_are_exported_as_text(self):
+        from openpyxl import load_workbook
+
+        guest = Guest.objects.create(owner=self.user, event=self.event, name='=HYPERLINK("http://x.test","Hi")',
+                                     phone_number='+40 721 123 456')
+        RSVP.objects.create(guest=guest, attending=False, message='@SUM(1+1)')
+        url = reverse('invapp:guest_export', kwargs={'event_id': self.event.id})
+
+        content = b''.join(self.client.get(url).streaming_content).decode('utf-8')
+        row = next(csv.reader(content.lstrip('\ufeff').splitlines()[1:2]))
+        self.assertEqual((row[1], row[2], row[10]), ('\'=HYPERLINK("http://x.test","Hi")', '+40 721 123 456', "'@SUM(1+1)"))
+
+        workbook = load_workbook(BytesIO(b''.join(self.client.get(url, {'format': 'xlsx'}).streaming_content)))
+        cell = workbook.active['B2']
+        self.assertEqual((cell.value, cell.data_type), ('=HYPERLINK("http://x.test","Hi")', 's'))
+
+    def test_export_requires_owner(self):
+        User.objects.create_user(username='intruder', password='password123')
+        self.client.login(username='intruder', password='password123')
+        response = self.client.get(reverse('invapp:guest_export', kwargs={'event_id': self.event.id}))
+        self.assertEqual(response.status_code, 403)
+
+
+class GuestImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='password123')
+        self.plan = Plan.objects.create(name='Import Plan', price=0, max_events=5, max_guests=50)
+        UserProfile.objects.filter(user=self.user).update(plan=self.plan)
+        self.event = Event.objects.create(owner=self.user, title="Import Wedding")
+        self.url = reverse('invapp:guest_import', kwargs={'event_id': self.event.id})
+        self.client.login(username='importer', password='password123')
+
+    def xlsx_upload(self, rows):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        buffer = BytesIO()
+        workbook.save(buffer)
+        return SimpleUploadedFile('guests.xlsx', buffer.getvalue())
+
+    def test_xlsx_import_normalizes_columns_and_reports_bad_rows(self):
+        upload = self.xlsx_upload([
+            ['Honorific', 'Name', 'Email', 'Phone Number', 'Max Attendees', 'Invitation Method'],
+            ['Mr.', ' Ion Popescu ', 'ion@example.com', '0721 123-456', 2, 'Digital'],
+            ['family', 'Ionescu', None, 40721123456, None, 'On Paper'],
+            [None, None, None, None, None, None],
+            ['Baron', 'Bad Title', None, None, 1, None],
+            [None, 'Bad Email', 'not-an-email', None, 1, None],
+            [None, 'Bad Count', None, None, 'many', None],
+        ])
+        with translation.override('en'):
+            result = importers.import_guests(self.event, self.user, upload, batch_size=2)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual([error.row for error in result.errors], [5, 6, 7])
+        ion = Guest.objects.get(event=self.event, name='Ion Popescu')
+        self.assertEqual((ion.honorific, ion.phone_number, ion.max_attendees, ion.invitation_method),
+                         ('mr', '0721123456', 2, 'digital'))
+        family = Guest.objects.get(event=self.event, name='Ionescu')
+        self.assertEqual((family.honorific, family.phone_number, family.max_attendees, family.invitation_method),
+                         ('family', '40721123456', 1, 'physical'))
+        self.assertEqual(EventStats.objects.get(event=self.event).invited, 2)
+
+    def test_semicolon_csv_through_view(self):
+        content = '\ufeffName;Email;Max Attendees\nAna;ana@example.com;3\nMihai;;\n'.encode('utf-8')
+        response = self.client.post(self.url, {'guest_file': SimpleUploadedFile('guests.csv', content)})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Guest.objects.filter(event=self.event).exists())
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(
+            sorted(Guest.objects.filter(event=self.event).values_list('name', 'max_attendees')),
+            [('Ana', 3), ('Mihai', 1)],
+        )
+        job = Job.objects.get(name='import_guests')
+        status = self.client.get(reverse('invapp:job_status', kwargs={'job_id': job.public_id})).json()
+        self.assertEqual((status['status'], status['result']['created']), ('succeeded', 2))
+
+    def test_limit_rolls_back_whole_import(self):
+        rows = [['Name']] + [[f'Guest {index}'] for index in range(60)]
+        self.client.post(self.url, {'guest_file': self.xlsx_upload(rows)})
+        jobs.run_pending()
+        self.assertFalse(Guest.objects.filter(event=self.event).exists())
+        job = Job.objects.get(name='import_guests')
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 1))
+        self.assertIn('error', job.result)
+
+    def test_missing_name_column(self):
+        with self.assertRaises(importers.GuestImportError):
+            importers.import_guests(self.event, self.user, self.xlsx_upload([['Email'], ['a@example.com']]))
+
+
+@jobs.task('test_flaky')
+def flaky_task(job):
+    if job.attempts < 2:
+        raise RuntimeError("temporary failure")
+    return {'ok': True}
+
+
+class BackgroundJobTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='jobs', password='password123', email='jobs@example.com')
+
+    def test_signup_confirmation_is_translated(self):
+        # The message is queued with the welcome email; a stale django.mo would show it in English
+        with translation.override('ro'):
+            message = translation.gettext("Registration successful! A confirmation email is on its way.")
+        self.assertTrue(message.startswith("Contul a fost creat cu succes!"), message)
+
+    def test_retry_with_backoff_then_success(self):
+        job = jobs.enqueue('test_flaky', max_attempts=3)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertIn('temporary failure', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        # Not due yet, so the worker leaves it alone
+        self.assertEqual(jobs.run_pending(), 0)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.Status.SUCCEEDED, {'ok': True}))
+
+    def test_claim_is_exclusive_and_stale_jobs_are_requeued(self):
+        job = jobs.enqueue('test_flaky')
+        self.assertEqual(jobs.claim_next('worker-a').pk, job.pk)
+        self.assertIsNone(jobs.claim_next('worker-b'))
+
+        Job.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(jobs.claim_next('worker-b').locked_by, 'worker-b')
+
+    def test_long_running_job_with_heartbeat_is_not_requeued(self):
+        jobs.enqueue('test_flaky')
+        job = jobs.claim_next('worker-a')
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Job.objects.filter(pk=job.pk).update(locked_at=an_hour_ago, updated_at=an_hour_ago)
+        job.set_progress(10, 100)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        self.assertEqual(Job.objects.get(pk=job.pk).locked_by, 'worker-a')
+
+    def test_status_endpoint_is_private(self):
+        job = jobs.enqueue('test_flaky', owner=self.user)
+        url = reverse('invapp:job_status', kwargs={'job_id': job.public_id})
+        User.objects.create_user(username='other', password='password123')
+        self.client.login(username='other', password='password123')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.login(username='jobs', password='password123')
+        self.assertEqual(self.client.get(url).json()['status'], 'queued')
+
+    def test_status_polls_skip_file_contents(self):
+        job = Job.objects.create(name='import_guests', owner=self.user, status=Job.Status.SUCCEEDED,
+                                 input_file=b'x' * 1000, result_file=b'id\n1\n', result_filename='r.csv')
+        self.client.login(username='jobs', password='password123')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('invapp:job_status', kwargs={'job_id': job.public_id}))
+        job_selects = [query['sql'] for query in queries if 'FROM "invapp_job"' in query['sql']]
+        self.assertEqual(len(job_selects), 1)
+        self.assertNotIn('"input_file"', job_selects[0])
+        self.assertNotIn('"result_file"', job_selects[0])
+
+        response = self.client.get(reverse('invapp:job_download', kwargs={'job_id': job.public_id}))
+        self.assertEqual(response.content, b'id\n1\n')
+
+    def test_runworker_command(self):
+        jobs.enqueue('send_email', {'subject': 'Hi', 'message': 'Hello', 'recipient_list': ['a@example.com']})
+        out = StringIO()
+        call_command('runworker', '--once', stdout=out)
+        self.assertIn('Processed 1 job(s).', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_voucher_bulk_generation_runs_in_worker(self):
+        admin_user = User.objects.create_superuser(username='boss', password='password123', email='boss@example.com')
+        self.client.login(username='boss', password='password123')
+        response = self.client.post(reverse('admin:invapp_voucher_generate_bulk'),
+                                    {'count': 5, 'campaign': 'Fair', 'days_valid': 10, 'discount': 100})
+        job = Job.objects.get(name='generate_vouchers')
+        self.assertRedirects(response, reverse('admin:invapp_job_progress', kwargs={'job_id': job.public_id}))
+        self.assertEqual(Voucher.objects.count(), 0)
+
+        jobs.run_pending()
+        self.assertEqual(Voucher.objects.filter(campaign_name='Fair').count(), 5)
+        download = self.client.get(reverse('invapp:job_download', kwargs={'job_id': job.public_id}))
+        # code, activation link and WhatsApp link per voucher
+        self.assertEqual(download.content.decode('utf-8').count('TARG-'), 5 * 3)
+        self.assertEqual(job.owner, admin_user)
+
+    @patch('stripe.Webhook.construct_event')
+    def test_stripe_webhook_is_queued(self, construct_event):
+        plan = Plan.objects.create(name='Premium', price=100, max_events=5, max_guests=500)
+        payload = {
+            'id': 'evt_1', 'type': 'checkout.session.completed',
+            'data': {'object': {'id': 'cs_1', 'metadata': {'user_id': str(self.user.id), 'plan_id': str(plan.id)}}},
+        }
+        construct_event.return_value = payload
+        response = self.client.post(reverse('invapp:stripe_webhook'), data=json.dumps(payload),
+                                    content_type='application/json', HTTP_STRIPE_SIGNATURE='t=1,v1=x')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(UserProfile.objects.get(user=self.user).plan, plan)
+
+        jobs.run_pending()
+        self.assertEqual(UserProfile.objects.get(user=self.user).plan, plan)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class StripeWebhookTest(TestCase):
+    fixture_path = os.path.join(os.path.dirname(__file__), 'fixtures', 'stripe_events.json')
+
+    def setUp(self):
+        self.plan = Plan.objects.create(name='Premium', price=100, max_events=5, max_guests=500)
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password123')
+
+    def _event(self, event_type):
+        with open(self.fixture_path, encoding='utf-8') as handle:
+            body = json.dumps(json.load(handle)[event_type])
+        return body.replace('{user_id}', str(self.user.pk)).replace('{plan_id}', str(self.plan.pk))
+
+    def _deliver(self, body, secret='whsec_test'):
+        # Signed the way Stripe signs webhooks, so the real verification runs
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+        return self.client.post(reverse('invapp:stripe_webhook'), data=body, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}")
+
+    def test_redeliveries_are_logged_and_handled_once(self):
+        body = self._event('checkout.session.completed')
+        self.assertEqual(self._deliver(body).status_code, 200)
+        self.assertEqual(self._deliver(body).status_code, 200)
+        self.assertEqual(StripeEventLog.objects.count(), 1)
+        self.assertEqual(Job.objects.filter(name='stripe_event').count(), 1)
+
+        jobs.run_pending()
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.plan, self.plan)
+        self.assertEqual(profile.stripe_customer_id, 'cus_test_1')
+        self.assertIsNotNone(StripeEventLog.objects.get().processed_at)
+
+    @patch('stripe.Customer.retrieve')
+    def test_cancellation_uses_saved_customer_id(self, retrieve):
+        UserProfile.objects.filter(user=self.user).update(plan=self.plan, stripe_customer_id='cus_test_1')
+        self._deliver(self._event('customer.subscription.deleted'))
+        jobs.run_pending()
+        self.assertIsNone(UserProfile.objects.get(user=self.user).plan)
+        retrieve.assert_not_called()
+
+    @patch('stripe.Customer.retrieve')
+    def test_cancellation_backfills_unknown_customer(self, retrieve):
+        retrieve.return_value = {'email': 'buyer@example.com'}
+        UserProfile.objects.filter(user=self.user).update(plan=self.plan)
+        self._deliver(self._event('customer.subscription.deleted'))
+        jobs.run_pending()
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertIsNone(profile.plan)
+        self.assertEqual(profile.stripe_customer_id, 'cus_test_1')
+
+    def test_bad_signature_is_rejected(self):
+        response = self._deliver(self._event('checkout.session.completed'), secret='whsec_other')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEventLog.objects.exists())
+
+
+class AdminQueryBudgetTest(TestCase):
+    """Changelist pages cost the same number of queries however many rows they show."""
+    changelists = ['event', 'guest', 'table', 'tableassignment', 'rsvp', 'eventstats', 'userprofile',
+                   'carddesign', 'plan', 'voucher', 'marketingcampaign', 'job']
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='boss', password='password123', email='boss@example.com')
+        self.client.force_login(self.admin)
+        self.plans = [Plan.objects.create(name='Free', price=0), Plan.objects.create(name='Premium', price=49)]
+        self.special = SpecialField.objects.create(name='Godparents')
+        self.rows = 0
+
+    def _add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            i = self.rows
+            user = User.objects.create_user(username=f'host{i}', email=f'host{i}@example.com')
+            event = Event.objects.create(owner=user, title=f"Wedding {i}")
+            guest = Guest.objects.create(owner=user, event=event, name=f"Guest {i}")
+            RSVP.objects.create(guest=guest, attending=True, number_attending=2)
+            table = Table.objects.create(owner=user, event=event, name=f"T{i}", capacity=10)
+            TableAssignment.objects.create(event=event, guest=guest, table=table)
+            design = CardDesign.objects.create(name=f'Design {i}', template_name='invapp/invites/default_invite.html')
+            design.available_on_plans.set(self.plans)
+            design.special_fields.add(self.special)
+            Voucher.objects.create(code=f'ADMIN{i}', discount_percentage=10)
+            partner = PlatformPartner.objects.create(name=f'Partner {i}', whatsapp_number='0700000000')
+            MarketingCampaign.objects.create(name=f'Campaign {i}', partner=partner)
+            jobs.enqueue('send_email', {'recipient_list': []}, owner=user)
+
+    def _query_counts(self):
+        counts = {}
+        for model in self.changelists:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'admin:invapp_{model}_changelist'))
+            self.assertEqual(response.status_code, 200, model)
+            counts[model] = len(queries)
+        return counts
+
+    def test_changelists_have_constant_query_counts(self):
+        self._add_rows(2)
+        self._query_counts()  # warm per-process caches (content types, plans)
+        small = self._query_counts()
+        self._add_rows(4)
+        large = self._query_counts()
+        for model in self.changelists:
+            with self.subTest(model=model):
+                self.assertEqual(large[model], small[model])
+
+    def test_job_changelist_skips_file_contents(self):
+        self._add_rows(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:invapp_job_changelist'))
+        job_selects = [query['sql'] for query in queries if 'FROM "invapp_job"' in query['sql']]
+        self.assertTrue(job_selects)
+        for sql in job_selects:
+            self.assertNotIn('"input_file"', sql)
+            self.assertNotIn('"result_file"', sql)
+
+
+class AdminImportExportJobTest(TestCase):
+    """Admin export and import run in the worker; imports go through a reviewed dry run."""
+    fields = ('id', 'name', 'price', 'max_guests', 'max_events', 'stripe_price_id', 'is_public')
+
+    def setUp(self):
+        self.transfer_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.transfer_root, ignore_errors=True)
+        settings_override = override_settings(ADMIN_TRANSFER_STORAGE=None, ADMIN_TRANSFER_ROOT=self.transfer_root,
+                                              ADMIN_IMPORT_BATCH_SIZE=2, ADMIN_EXPORT_CHUNK_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = User.objects.create_superuser(username='boss', password='password123', email='boss@example.com')
+        self.client.force_login(self.admin)
+        self.basic = Plan.objects.create(name='Basic', price=0, max_guests=50)
+        Plan.objects.create(name='Premium', price=49, max_guests=300)
+        self.plan_admin = admin_site._registry[Plan]
+
+    def _format_index(self, formats, format_class):
+        return str(formats.index(format_class))
+
+    def _upload(self, rows):
+        lines = [','.join(self.fields)] + [','.join(str(value) for value in row) for row in rows]
+        upload = SimpleUploadedFile('plans.csv', '\n'.join(lines).encode('utf-8'), content_type='text/csv')
+        response = self.client.post(reverse('admin:invapp_plan_import'), {
+            'import_file': upload,
+            'format': self._format_index(self.plan_admin.get_import_formats(), base_formats.CSV),
+        })
+        job = Job.objects.filter(name='admin_import').latest('created_at')
+        self.assertRedirects(response, reverse('admin:invapp_job_progress', kwargs={'job_id': job.public_id}))
+        return job
+
+    def _run(self, job):
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED, job.last_error)
+        return job
+
+    def _download(self, job):
+        response = self.client.get(reverse('invapp:job_download', kwargs={'job_id': job.public_id}))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_is_written_to_storage_by_the_worker(self):
+        for i in range(3):
+            Plan.objects.create(name=f'Extra {i}', price=10 + i)
+        data = {'format': self._format_index(self.plan_admin.get_export_formats(), base_formats.CSV)}
+        data.update({f'planresource_{field}': 'on' for field in ('id', 'name', 'price')})
+        response = self.client.post(reverse('admin:invapp_plan_export'), data)
+
+        job = Job.objects.get(name='admin_export')
+        self.assertRedirects(response, reverse('admin:invapp_job_progress', kwargs={'job_id': job.public_id}))
+        job = self._run(job)
+        self.assertNotIn('query', job.payload)
+        self.assertEqual(len(job.payload['pks']), 5)
+        self.assertEqual((job.progress_current, job.progress_total, job.result), (5, 5, {'rows': 5}))
+        self.assertIsNone(job.result_file)
+
+        lines = self._download(job).splitlines()
+        self.assertEqual(lines[0], 'id,name,price')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(any(line.startswith(f'{self.basic.pk},Basic,') for line in lines))
+
+    def test_xlsx_export_is_written_by_the_worker(self):
+        from openpyxl import load_workbook
+        data = {'format': self._format_index(self.plan_admin.get_export_formats(), base_formats.XLSX)}
+        data.update({f'planresource_{field}': 'on' for field in ('id', 'name')})
+        self.client.post(reverse('admin:invapp_plan_export'), data)
+        job = self._run(Job.objects.get(name='admin_export'))
+        self.assertEqual(job.result, {'rows': 2})
+
+        response = self.client.get(reverse('invapp:job_download', kwargs={'job_id': job.public_id}))
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['Plans'])
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('id', 'name'))
+        self.assertEqual({row[1] for row in rows[1:]}, {'Basic', 'Premium'})
+
+    def test_import_dry_run_then_confirm(self):
+        job = self._upload([
+            (self.basic.pk, 'Basic', 0, 80, 1, '', 1),
+            ('', 'Gold', 99, 500, 3, '', 1),
+            ('', 'Platinum', 199, 1000, 5, '', 0),
+        ])
+        job = self._run(job)
+        self.assertTrue(job.result['dry_run'])
+        self.assertEqual((job.result['totals']['new'], job.result['totals']['update']), (2, 1))
+        self.assertEqual(job.result['errors'], [])
+        self.assertFalse(Plan.objects.filter(name='Gold').exists())
+        self.basic.refresh_from_db()
+        self.assertEqual(self.basic.max_guests, 50)
+        report = self._download(job)
+        self.assertIn('1,update,Basic,', report)
+        self.assertIn('max_guests', report.splitlines()[1])
+
+        response = self.client.post(job.result['confirm_url'])
+        real = Job.objects.filter(name='admin_import').latest('created_at')
+        self.assertRedirects(response, reverse('admin:invapp_job_progress', kwargs={'job_id': real.public_id}))
+        real = self._run(real)
+        self.assertFalse(real.result['dry_run'])
+        self.assertEqual(set(Plan.objects.values_list('name', flat=True)), {'Basic', 'Premium', 'Gold', 'Platinum'})
+        self.basic.refresh_from_db()
+        self.assertEqual(self.basic.max_guests, 80)
+        self.assertFalse(os.path.exists(os.path.join(self.transfer_root, real.payload['input'])))
+
+    def test_guest_import_refreshes_the_events_stats(self):
+        owner = User.objects.create_user(username='host', password='password123')
+        event = Event.objects.create(owner=owner, title="Imported Wedding")
+        first = Guest.objects.create(owner=owner, event=event, name="First", max_attendees=1)
+        Guest.objects.create(owner=owner, event=event, name="Second", max_attendees=1)
+        EventStats.objects.create(event=event)
+        guest_admin = admin_site._registry[Guest]
+        upload = SimpleUploadedFile('guests.csv', f'id,name,max_attendees\n{first.pk},First,3\n'.encode('utf-8'),
+                                    content_type='text/csv')
+        self.client.post(reverse('admin:invapp_guest_import'), {
+            'import_file': upload,
+            'format': self._format_index(guest_admin.get_import_formats(), base_formats.CSV),
+        })
+        self._run(Job.objects.filter(name='admin_import').latest('created_at'))
+        self.assertEqual(EventStats.objects.get(event=event).invited, 0)
+
+        self.client.post(Job.objects.filter(name='admin_import').latest('created_at').result['confirm_url'])
+        self._run(Job.objects.filter(name='admin_import').latest('created_at'))
+        first.refresh_from_db()
+        self.assertEqual(first.max_attendees, 3)
+        self.assertEqual(EventStats.objects.get(event=event).invited, 2)
+
+    def test_import_with_errors_cannot_be_confirmed(self):
+        self.assertEqual(self.client.get(reverse('admin:invapp_plan_import')).status_code, 200)
+        job = self._run(self._upload([('', 'Gold', 'lots', 500, 3, '', 1)]))
+        self.assertEqual(job.result['totals']['error'], 1)
+        self.assertEqual(job.result['errors'][0][0], 1)
+        self.assertNotIn('confirm_url', job.result)
+
+        confirm_url = reverse('admin:invapp_plan_import_confirm', kwargs={'job_id': job.public_id})
+        self.assertEqual(self.client.post(confirm_url).status_code, 403)
+        self.assertEqual(Job.objects.filter(name='admin_import').count(), 1)
+
+
+class PerformanceMiddlewareTest(TestCase):
+    """Every request is measured, logged and checked against its URL's budget."""
+
+    def setUp(self):
+        cache.clear()
+        views.voucher_throttle.reset()
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_server_timing_header_and_log_line(self):
+        with self.assertLogs('wedding_project.perf', 'INFO') as logs, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('invapp:faq'))
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'cache;desc=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+        perf = logs.records[0].perf
+        self.assertEqual((perf['route'], perf['status']), ('invapp:faq', 200))
+        self.assertEqual(perf['db_queries'], len(queries))
+        self.assertGreater(perf['template_ms'], 0)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+
+    def test_cache_hits_and_misses_are_counted(self):
+        url = reverse('invapp:api_verify_voucher') + '?code=NOPE'
+        with self.assertLogs('wedding_project.perf', 'INFO') as logs:
+            self.client.get(url)
+            self.client.get(url)
+        first, second = (record.perf for record in logs.records)
+        self.assertGreater(first['cache_misses'], 0)
+        self.assertGreater(second['cache_hits'], first['cache_hits'])
+
+    @override_settings(PERF_SERVER_TIMING=False, PERF_BUDGETS={'invapp:faq': {'db_queries': 0}})
+    def test_budget_overrun_is_logged(self):
+        with self.assertLogs('wedding_project.perf', 'WARNING') as logs:
+            response = self.client.get(reverse('invapp:faq'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertIn('invapp:faq', logs.output[0])
+        self.assertIn('db_queries=', logs.output[0])
+
+
+class ProfilingMiddlewareTest(TestCase):
+    """Staff can profile an invapp request when PROFILING_ENABLED is set."""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='password123', is_staff=True)
+        self.host = User.objects.create_user(username='host', password='password123')
+        self.url = reverse('invapp:faq')
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_cprofile_report_and_saved_profile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.client.force_login(self.staff)
+        with self.settings(PROFILING_DIR=directory):
+            response = self.client.get(self.url, {'_profile': 'cprofile'})
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        report = response.content.decode()
+        self.assertIn('cumulative', report)
+        self.assertIn('faq', report)
+        saved = os.listdir(directory)
+        self.assertEqual(len(saved), 1)
+        self.assertTrue(saved[0].startswith('invapp-faq-') and saved[0].endswith('.prof'))
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_memory_report(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'_profile': 'memory'})
+        self.assertIn('KiB peak', response.content.decode())
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_non_staff_get_the_page(self):
+        self.client.force_login(self.host)
+        response = self.client.get(self.url, {'_profile': 'cprofile'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_setting_removes_the_middleware(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url, {'_profile': 'cprofile'})
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+
+# Loads what every web worker and manage.py command loads, in a fresh interpreter
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+import invapp.tasks
+print(json.dumps({'seconds': time.perf_counter() - started, 'modules': sorted(sys.modules)}))
+"""
+STARTUP_BUDGET_SECONDS = 2.5
+LAZY_MODULES = ('pandas', 'stripe')
+
+
+class StartupTimeTest(SimpleTestCase):
+    """Heavy dependencies stay out of startup, which stays within its budget."""
+
+    def _start(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='wedding_project.settings')
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def test_startup_skips_lazy_modules_and_fits_the_budget(self):
+        runs = [self._start() for _ in range(3)]
+        self.assertFalse(set(LAZY_MODULES) & set(runs[0]['modules']))
+        # The fastest run, so a busy machine does not fail the build
+        self.assertLess(min(run['seconds'] for run in runs), STARTUP_BUDGET_SECONDS)
+
+    def test_guest_template_headers_round_trip_through_the_importer(self):
+        request = RequestFactory().get('/')
+        request.user = User(pk=1)
+        with translation.override('en'):
+            response = views.download_guest_template_view(request, event_id=1)
+            header = next(importers.read_rows(SimpleUploadedFile(
+                'template.xlsx', b''.join(response.streaming_content))))
+            expected = [str(label) for label in importers.TEMPLATE_COLUMNS.values()]
+        self.assertEqual(list(header), expected)
+
+
+class SeedPerfDataTest(TestCase):
+    """The benchmark dataset is reproducible from its seed."""
+
+    def _seed(self, *args):
+        call_command('seed_perf_data', '--users', '3', '--guests', '120', '--seed', '7', *args, stdout=StringIO())
+        return list(Guest.objects.filter(owner__username__startswith='perf-')
+                    .order_by('unique_id').values_list('unique_id', 'name', 'event__title', 'rsvp_details__attending'))
+
+    def test_same_seed_same_rows(self):
+        first = self._seed()
+        self.assertEqual(len(first), 120)
+        self.assertEqual(Event.objects.filter(owner__username__startswith='perf-').count(), 6)
+        self.assertEqual(sum(EventStats.objects.values_list('invited', flat=True)), 120)
+        self.assertTrue(RSVP.objects.filter(attending=True).exists())
+        self.assertTrue(TableAssignment.objects.exists())
+        self.assertTrue(all(profile.plan_id for profile in UserProfile.objects.filter(user__username__startswith='perf-')))
+
+        with self.assertRaises(CommandError):
+            self._seed()
+        self.assertEqual(self._seed('--flush'), first)
+
+
+class BenchViewsTest(TestCase):
+    def setUp(self):
+        perf_data.seed(users=2, guests=60, seed=3)
+        premium = Plan.objects.get(name='Perf Premium')
+        UserProfile.objects.filter(user__username__startswith='perf-').update(plan=premium)
+        self.output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.output), ignore_errors=True)
+
+    def _bench(self, *args):
+        call_command('bench_views', '--current-db', '--iterations', '3', '--warmup', '1', *args, stdout=StringIO())
+
+    def test_reports_every_scenario_and_fails_on_regression(self):
+        self._bench('--output', self.output)
+        with open(self.output) as handle:
+            report = json.load(handle)
+        self.assertIn('invitation_post', report['results'])
+        self.assertIn('guest_list_sort_desc_status', report['results'])
+        for result in report['results'].values():
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+        self.assertGreater(report['results']['guest_list_sort_name']['bytes'], 0)
+
+        report['results']['dashboard']['queries'] = 0
+        with open(self.output, 'w') as handle:
+            json.dump(report, handle)
+        with self.assertRaisesMessage(CommandError, 'dashboard'):
+            self._bench('--scenario', 'dashboard', '--baseline', self.output, '--threshold', '100')
+
+
+# --- Query budgets ---
+# One row per named route in invapp/urls.py: (method, expected status, most queries one
+# request may make). QueryCountMatrixTest sends each route a request its real code handles
+# (a valid form, a signed webhook, a redeemable voucher) over a small and a large dataset;
+# the status must match, and the count must stay within the budget and must not change
+# with the number of guests, tables or events. A new route needs a row here (or an exemption with its reason).
+QUERY_BUDGETS = {
+    'landing_page': ('get', 200, 12),
+    'faq': ('get', 200, 4),
+    'upgrade_plan': ('get', 302, 1),
+    'manual_upgrade_page': ('get', 200, 4),
+    'terms_and_conditions': ('get', 200, 3),
+    'privacy_policy': ('get', 200, 3),
+    'signup': ('get', 200, 4),
+    'login': ('get', 200, 3),
+    'submit_feedback': ('get', 200, 5),
+    'fix_domain': ('get', 200, 4),
+    'dashboard': ('get', 200, 5),
+    'event_create': ('get', 200, 8),
+    'event_edit': ('get', 200, 13),
+    'event_autosave': ('post', 200, 6),
+    'event_preview': ('post', 200, 1),
+    'event_live_preview': ('post', 200, 4),
+    'event_preview_demo': ('get', 200, 8),
+    'preview_upload': ('post', 200, 2),
+    'guest_invite': ('get', 200, 4),
+    'guest_invite_thank_you': ('get', 200, 10),
+    'guest_list': ('get', 200, 7),
+    'guest_create': ('get', 200, 5),
+    'guest_edit': ('get', 200, 5),
+    'guest_delete': ('get', 200, 5),
+    'update_attendance': ('post', 200, 11),
+    'mark_invitation_sent': ('post', 200, 3),
+    'guest_export': ('get', 200, 4),
+    'guest_import': ('post', 302, 4),
+    'download_guest_template': ('get', 200, 2),
+    'table_list': ('get', 200, 8),
+    'table_create': ('get', 200, 4),
+    'table_edit': ('get', 200, 5),
+    'table_delete': ('get', 200, 8),
+    'table_assignment_ui': ('get', 200, 12),
+    'unassign_guest': ('post', 302, 4),
+    'table_auto_assign': ('get', 200, 15),
+    'export_assignments_csv': ('get', 200, 4),
+    'job_status': ('get', 200, 3),
+    'job_download': ('get', 200, 3),
+    'payment_success': ('get', 302, 2),
+    'payment_cancel': ('get', 302, 2),
+    'api_verify_voucher': ('get', 200, 1),
+    'api_apply_free_voucher': ('post', 200, 11),
+    'stripe_webhook': ('post', 200, 5),
+}
+QUERY_BUDGET_EXEMPT = {
+    'create_checkout_session': "calls the Stripe API",
+    'event_delete': "no confirmation page (event_confirm_delete.html does not exist); a POST deletes the event",
+    'table_assignment': "legacy page whose template no longer exists; superseded by table_assignment_ui",
+}
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class QueryCountMatrixTest(TestCase):
+    """Every named route costs a bounded number of queries, whatever the size of the event."""
+
+    def setUp(self):
+        cache.clear()
+        views.voucher_throttle.reset()
+        views.preview_upload_throttle.reset()
+        upload_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_root, ignore_errors=True)
+        overrides = override_settings(PREVIEW_UPLOAD_ROOT=upload_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.plan = Plan.objects.create(name='Premium', price=0, max_guests=1000, max_events=50,
+                                        has_table_assignment=True)
+        self.host = User.objects.create_user(username='host', password='password123', email='host@example.com')
+        self.design = CardDesign.objects.create(name='Classic', template_name='invapp/invites/default_invite.html')
+        self.design.available_on_plans.add(self.plan)
+        self.event = Event.objects.create(owner=self.host, title="Big Wedding", selected_design=self.design)
+        self.table = Table.objects.create(owner=self.host, event=self.event, name="Head", capacity=100)
+        self.guest = Guest.objects.create(owner=self.host, event=self.event, name="Ana", max_attendees=2)
+        self.assignment = TableAssignment.objects.create(event=self.event, guest=self.guest, table=self.table)
+        self.job = Job.objects.create(name='import_guests', owner=self.host, status=Job.Status.SUCCEEDED,
+                                      result={'created': 1}, result_file=b'id\n1\n', result_filename='r.csv')
+        Voucher.objects.create(code='FREE', discount_percentage=100, max_uses=1000)
+        self.rows = 0
+        self.webhooks = 0
+        self.client.force_login(self.host)
+        # signup and login send a signed-in user away, so their forms are requested signed out,
+        # with the social login apps their buttons link to configured as in production
+        self.anonymous = Client()
+        for provider in ('google', 'facebook'):
+            app = SocialApp.objects.create(provider=provider, name=provider, client_id='id', secret='secret')
+            app.sites.add(Site.objects.get_current())
+
+    def _add_rows(self, count):
+        """Grows the event: guests in every RSVP state, tables, assignments, and other events."""
+        for _ in range(count):
+            self.rows += 1
+            i = self.rows
+            table = Table.objects.create(owner=self.host, event=self.event, name=f"T{i}", capacity=10)
+            for state in (True, False, None):
+                guest = Guest.objects.create(owner=self.host, event=self.event, name=f"Guest {i} {state}",
+                                             max_attendees=2, preferred_language='en' if i % 2 else 'ro')
+                if state is not None:
+                    RSVP.objects.create(guest=guest, attending=state, number_attending=2 if state else None)
+                if state:
+                    TableAssignment.objects.create(event=self.event, guest=guest, table=table)
+            other = Event.objects.create(owner=self.host, title=f"Event {i}", selected_design=self.design)
+            Guest.objects.create(owner=self.host, event=other, name=f"Other {i}")
+
+    def _url(self, name):
+        pattern = next(p for p in invapp_urls.urlpatterns if getattr(p, 'name', None) == name)
+        values = {
+            'event_id': self.event.pk, 'guest_id': self.guest.pk, 'guest_uuid': self.guest.unique_id,
+            'plan_id': self.plan.pk, 'assignment_id': self.assignment.pk, 'job_id': self.job.public_id,
+            'pk': {'table_edit': self.table.pk, 'table_delete': self.table.pk,
+                   'guest_edit': self.guest.pk, 'guest_delete': self.guest.pk}.get(name, self.event.pk),
+        }
+        kwargs = {key: values[key] for key in pattern.pattern.converters}
+        return reverse(f'invapp:{name}', kwargs=kwargs)
+
+    def _signed_webhook(self, url):
+        # A new event id every time, so each delivery is logged and queued rather than ignored
+        self.webhooks += 1
+        body = json.dumps({'id': f'evt_matrix_{self.webhooks}', 'object': 'event', 'type': 'invoice.paid',
+                           'data': {'object': {'object': 'invoice'}}})
+        timestamp = int(time.time())
+        signature = hmac.new(b'whsec_test', f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+        return self.client.post(url, data=body, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}")
+
+    def _request(self, name):
+        method, _status, _budget = QUERY_BUDGETS[name]
+        url = self._url(name)
+        if name == 'api_verify_voucher':
+            return self.client.get(url, {'code': 'NOPE'})
+        if name in ('event_preview', 'update_attendance', 'api_apply_free_voucher'):
+            body = {'event_preview': {'selected_design': self.design.pk, 'title': 'Preview'},
+                    'update_attendance': {'number_attending': 1},
+                    'api_apply_free_voucher': {'code': 'FREE', 'plan_id': self.plan.pk}}[name]
+            return self.client.post(url, json.dumps(body), content_type='application/json')
+        if name == 'event_live_preview':
+            return self.client.post(url, {'selected_design': self.design.pk, 'event_id': self.event.pk})
+        if name == 'event_autosave':
+            return self.client.post(url, {'event_type': 'wedding', 'title': "Big Wedding", 'event_date': '2027-06-05',
+                                          'selected_design': self.design.pk})
+        if name == 'preview_upload':
+            from PIL import Image
+            output = BytesIO()
+            Image.new('RGB', (40, 30), (200, 120, 80)).save(output, 'JPEG')
+            return self.client.post(url, {'file': SimpleUploadedFile('photo.jpg', output.getvalue(),
+                                                                     content_type='image/jpeg')})
+        if name == 'guest_import':
+            upload = SimpleUploadedFile('guests.csv', b'Name\nIon\n', content_type='text/csv')
+            return self.client.post(url, {'guest_file': upload})
+        if name == 'stripe_webhook':
+            return self._signed_webhook(url)
+        if name in ('signup', 'login'):
+            return self.anonymous.get(url)
+        return getattr(self.client, method)(url)
+
+    def _query_counts(self):
+        counts = {}
+        for name, (_method, status, _budget) in QUERY_BUDGETS.items():
+            if name == 'unassign_guest':
+                # Removed by the previous pass
+                self.assignment, _created = TableAssignment.objects.get_or_create(
+                    guest=self.guest, defaults={'event': self.event, 'table': self.table})
+            with CaptureQueriesContext(connection) as queries:
+                response = self._request(name)
+            self.assertEqual(response.status_code, status, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_every_route_has_a_budget(self):
+        named = {p.name for p in invapp_urls.urlpatterns if getattr(p, 'name', None)}
+        self.assertEqual(named - set(QUERY_BUDGET_EXEMPT), set(QUERY_BUDGETS))
+
+    def test_query_counts_stay_within_budget_and_flat(self):
+        # Each size is requested twice: the first pass warms per-process caches and builds
+        # the rows pages create lazily on first view (event stats, cached invitations)
+        self._add_rows(2)
+        self._query_counts()
+        small = self._query_counts()
+        self._add_rows(5)
+        self._query_counts()
+        large = self._query_counts()
+        for name, (_method, _status, budget) in QUERY_BUDGETS.items():
+            with self.subTest(route=name):
+                self.assertLessEqual(large[name], budget)
+                self.assertEqual(large[name], small[name])
+
+
+class CachedContextProcessorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        context_processors.site_images_cache.invalidate()
+        context_processors.plans_cache.invalidate()
+        self.factory = RequestFactory()
+        self.plan = Plan.objects.create(name='Context Plan', price=0, max_events=5, max_guests=100)
+        self.user = User.objects.create_user(username='context', password='password123')
+        UserProfile.objects.filter(user=self.user).update(plan=self.plan)
+
+    def make_request(self, user=None):
+        request = self.factory.get('/')
+        request.user = user or User.objects.get(pk=self.user.pk)
+        return request
+
+    def test_site_images_are_cached_and_invalidated_on_save(self):
+        SiteImage.objects.create(key='hero_bg', image='site_assets/hero.jpg')
+        request = self.make_request()
+        context_processors.site_assets(request)
+        with self.assertNumQueries(0):
+            images = context_processors.site_assets(request)['site_images']
+        self.assertEqual(images['hero_bg'].name, 'site_assets/hero.jpg')
+
+        SiteImage.objects.create(key='logo_main', image='site_assets/logo.png')
+        images = context_processors.site_assets(self.make_request())['site_images']
+        self.assertEqual(sorted(images), ['hero_bg', 'logo_main'])
+
+    def test_active_plan_costs_at_most_one_query_per_request(self):
+        context_processors.plans_cache.get()
+        request = self.make_request()
+        with self.assertNumQueries(1):
+            self.assertEqual(context_processors.add_active_plan_to_context(request)['active_plan'], self.plan)
+            self.assertEqual(context_processors.get_active_plan(request), self.plan)
+
+        # A profile the view already loaded is reused
+        user = User.objects.select_related('userprofile').get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(context_processors.get_active_plan(self.make_request(user)), self.plan)
+
+    def test_plan_save_invalidates_cached_plans(self):
+        context_processors.get_active_plan(self.make_request())
+        self.plan.show_watermark = False
+        self.plan.save()
+        self.assertFalse(context_processors.get_active_plan(self.make_request()).show_watermark)
+
+    def test_anonymous_user_has_no_plan(self):
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        with self.assertNumQueries(0):
+            self.assertIsNone(context_processors.get_active_plan(request))
+
+
+class SeatingSolverTest(TestCase):
+    def test_respects_capacity_and_rules(self):
+        guests = [seating.SeatingGuest(1, 2), seating.SeatingGuest(2, 2), seating.SeatingGuest(3, 3),
+                  seating.SeatingGuest(4, 1), seating.SeatingGuest(5, 2)]
+        tables = [seating.SeatingTable(10, 5, []), seating.SeatingTable(20, 5, [])]
+        plan = seating.solve_seating(guests, tables, keep_together=[(1, 4)], keep_apart=[(3, 5)])
+
+        self.assertTrue(plan.is_complete)
+        self.assertEqual(plan.assignments[1], plan.assignments[4])
+        self.assertNotEqual(plan.assignments[3], plan.assignments[5])
+        sizes = {guest.id: guest.size for guest in guests}
+        for table in tables:
+            self.assertLessEqual(sum(sizes[g] for g, t in plan.assignments.items() if t == table.id), 5)
+
+    def test_local_search_makes_room_by_moving_a_party(self):
+        guests = [seating.SeatingGuest(1, 2), seating.SeatingGuest(2, 1), seating.SeatingGuest(3, 3)]
+        solver = seating._Solver(guests, [seating.SeatingTable(10, 4, []), seating.SeatingTable(20, 3, [])], [], [])
+        # A fragmented start: two free seats at each table, so the party of 3 fits nowhere
+        solver._place(solver.unit_of[1], 10)
+        solver._place(solver.unit_of[2], 20)
+        self.assertEqual(solver.improve([solver.unit_of[3]], budget=1), [])
+        self.assertEqual((solver.table_of[solver.unit_of[3].index], solver.table_of[solver.unit_of[1].index]), (10, 20))
+
+    def test_keep_apart_with_already_seated_guest(self):
+        tables = [seating.SeatingTable(10, 8, [99]), seating.SeatingTable(20, 2, [])]
+        plan = seating.solve_seating([seating.SeatingGuest(1, 2)], tables, keep_apart=[(1, 99)])
+        self.assertEqual(plan.assignments, {1: 20})
+
+    def test_oversized_group_is_split_and_reported(self):
+        tables = [seating.SeatingTable(10, 3, []), seating.SeatingTable(20, 3, [])]
+        guests = [seating.SeatingGuest(1, 2), seating.SeatingGuest(2, 2)]
+        plan = seating.solve_seating(guests, tables, keep_together=[(1, 2)])
+        self.assertEqual(len(plan.assignments), 2)
+        self.assertEqual(plan.broken_constraints, [(1, 2, SeatingConstraint.Kind.TOGETHER)])
+
+    def test_500_guests_60_tables_is_fast(self):
+        guests = [seating.SeatingGuest(i, 1 + i % 4) for i in range(500)]
+        tables = [seating.SeatingTable(1000 + t, 22, []) for t in range(60)]
+        keep_apart = [(i, i + 7) for i in range(0, 490, 5)]
+        started = time.perf_counter()
+        plan = seating.solve_seating(guests, tables, keep_together=[(i, i + 1) for i in range(0, 100, 3)],
+                                     keep_apart=keep_apart)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertTrue(plan.is_complete)
+
+
+class AutoSeatViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='seater', password='password123')
+        plan = Plan.objects.create(name='Seating Plan', price=0, max_events=5, max_guests=100, has_table_assignment=True)
+        UserProfile.objects.filter(user=self.user).update(plan=plan)
+        self.event = Event.objects.create(owner=self.user, title="Seated Wedding")
+        self.tables = [Table.objects.create(owner=self.user, event=self.event, name=f"Table {i}", capacity=4)
+                       for i in range(3)]
+        self.guests = [Guest.objects.create(owner=self.user, event=self.event, name=f"Guest {i}",
+                                            manual_is_attending=True, manual_attending_count=2)
+                       for i in range(5)]
+        Guest.objects.create(owner=self.user, event=self.event, name="Declined", manual_is_attending=False)
+        self.url = reverse('invapp:table_auto_assign', kwargs={'event_id': self.event.id})
+        self.client.login(username='seater', password='password123')
+
+    def test_preview_then_accept_writes_plan(self):
+        response = self.client.get(self.url)
+        seats = response.context['seat_values']
+        self.assertEqual(len(seats), 5)
+        self.assertEqual(TableAssignment.objects.count(), 0)
+
+        response = self.client.post(self.url, {'action': 'accept', 'seat': seats})
+        self.assertRedirects(response, reverse('invapp:table_assignment_ui', kwargs={'event_id': self.event.id}))
+        self.assertEqual(TableAssignment.objects.filter(table__event=self.event).count(), 5)
+        for table in Table.objects.filter(event=self.event).with_seated_count():
+            self.assertLessEqual(table.seated_count, table.capacity)
+
+    def test_stale_plan_is_rejected(self):
+        seats = self.client.get(self.url).context['seat_values']
+        Table.objects.filter(pk=self.tables[0].pk).update(capacity=1)
+        self.client.post(self.url, {'action': 'accept', 'seat': seats})
+        self.assertEqual(TableAssignment.objects.count(), 0)
+
+    def test_rules_are_used_by_the_preview(self):
+        self.client.post(self.url, {'action': 'add_constraint', 'guest_a': self.guests[0].id,
+                                    'kind': 'together', 'guest_b': self.guests[1].id})
+        plan = self.client.get(self.url).context['plan']
+        self.assertEqual(plan.assignments[self.guests[0].id], plan.assignments[self.guests[1].id])
+
+
+class LivePreviewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        previews.designs_cache.invalidate()
+        previews.preview_cache.clear()
+        self.user = User.objects.create_user(username='previewer', password='password123')
+        self.design = CardDesign.objects.create(name='Preview Design', template_name='invapp/invites/default_invite.html')
+        self.client.login(username='previewer', password='password123')
+        self.url = reverse('invapp:event_live_preview')
+        self.payload = {
+            'selected_design': self.design.pk,
+            'title': 'Ana & Mihai',
+            'bride_name': 'Ana',
+            'event_date': '2027-06-12',
+            'party_time': '19:30',
+            'godparents-TOTAL_FORMS': '2',
+            'godparents-0-name': 'Ioana',
+            'godparents-1-name': 'Removed',
+            'godparents-1-DELETE': 'on',
+            'csrfmiddlewaretoken': 'abc',
+        }
+
+    def test_normalization_ignores_noise(self):
+        noisy = dict(self.payload, csrfmiddlewaretoken='xyz', venue_name='  ', title=' Ana & Mihai ')
+        self.assertEqual(previews.payload_hash(previews.normalize_payload(noisy)),
+                         previews.payload_hash(previews.normalize_payload(self.payload)))
+        normalized = previews.normalize_payload(self.payload)
+        self.assertEqual(normalized['godparents'], ['Ioana'])
+
+    def test_mock_event_fields_are_parsed(self):
+        event = previews.build_preview_event(previews.normalize_payload(dict(
+            self.payload, couple_photo='/media/event_photos/a.jpg', ceremony_time='bad')), self.design)
+        self.assertEqual(event.event_date.isoformat(), '2027-06-12')
+        self.assertEqual(event.date_time, event.event_date)
+        self.assertEqual(event.party_time.strftime('%H:%M'), '19:30')
+        self.assertIsNone(event.ceremony_time)
+        self.assertEqual(event.couple_photo.url, '/media/event_photos/a.jpg')
+        self.assertEqual(event.get_couple_photo_url, '/media/event_photos/a.jpg')
+        self.assertEqual([g.name for g in event.godparents.all()], ['Ioana'])
+
+    @override_settings(GOOGLE_MAPS_API_KEY='maps-test-key')
+    def test_preview_gets_the_site_wide_context(self):
+        self.design.template_name = 'invapp/invites/image_based_invite_smart.html'
+        self.design.save()
+        response = self.client.post(self.url, dict(self.payload, selected_design=self.design.pk,
+                                                   venue_address='Strada Florilor 1, Cluj'))
+        self.assertContains(response, 'maps/embed/v1/place?key=maps-test-key')
+
+    def test_repeated_preview_is_served_from_cache(self):
+        response = self.client.post(self.url, self.payload)
+        self.assertContains(response, 'Ana')
+        with patch('invapp.previews.render_to_string') as render_mock, self.assertNumQueries(3):
+            # Only the session, user and plan watermark lookups remain
+            cached = self.client.post(self.url, dict(self.payload, csrfmiddlewaretoken='other'))
+        render_mock.assert_not_called()
+        self.assertEqual(cached.content, response.content)
+
+        changed = self.client.post(self.url, dict(self.payload, title='Elena & Radu'))
+        self.assertContains(changed, 'Elena &amp; Radu')
+
+    def test_watermark_follows_the_hosts_plan(self):
+        free = Plan.objects.create(name='Free', price=0, max_events=1, max_guests=50, show_watermark=True)
+        paid = Plan.objects.create(name='Paid', price=10, max_events=1, max_guests=50, show_watermark=False)
+        UserProfile.objects.filter(user=self.user).update(plan=free)
+        self.assertContains(self.client.post(self.url, self.payload), 'DEMO INVAPP')
+
+        # Same payload from a host without the watermark: not served the watermarked render
+        other = User.objects.create_user(username='paid-host', password='password123')
+        UserProfile.objects.filter(user=other).update(plan=paid)
+        self.client.force_login(other)
+        self.assertNotContains(self.client.post(self.url, self.payload), 'DEMO INVAPP')
+        self.assertEqual(len(previews.preview_cache), 2)
+
+    def test_cache_evicts_least_recently_used(self):
+        lru = previews.PreviewCache(max_entries=2)
+        lru.set('a', 'A')
+        lru.set('b', 'B')
+        lru.get('a')
+        lru.set('c', 'C')
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual((lru.get('a'), lru.get('c')), ('A', 'C'))
+
+    def test_json_preview_endpoint_uses_the_same_engine(self):
+        response = self.client.post(reverse('invapp:event_preview'), json.dumps(self.payload), content_type='application/json')
+        self.assertContains(response, 'Ana')
+        self.assertEqual(len(previews.preview_cache), 1)
+        response = self.client.post(reverse('invapp:event_preview'), json.dumps({'title': 'x'}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bench_preview_command(self):
+        out = StringIO()
+        call_command('bench_preview', design=self.design.pk, iterations=3, stdout=out)
+        self.assertIn('renders/s cached', out.getvalue())
+
+
+class PreviewUploadTest(TestCase):
+    def setUp(self):
+        self.upload_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_root, ignore_errors=True)
+        overrides = override_settings(PREVIEW_UPLOAD_ROOT=self.upload_root, PREVIEW_UPLOAD_MAX_DIMENSION=100)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        previews.preview_cache.clear()
+        views.preview_upload_throttle.reset()
+        self.user = User.objects.create_user(username='uploader', password='password123')
+        self.design = CardDesign.objects.create(name='Upload Design', template_name='invapp/invites/sage_gold.html')
+        self.client.login(username='uploader', password='password123')
+
+    def make_image(self, size=(400, 300), fmt='JPEG'):
+        from PIL import Image
+        output = BytesIO()
+        Image.new('RGB', size, (200, 120, 80)).save(output, fmt)
+        return output.getvalue()
+
+    def upload(self, raw):
+        return self.client.post(reverse('invapp:preview_upload'),
+                                {'file': SimpleUploadedFile('photo.jpg', raw, content_type='image/jpeg')})
+
+    def test_upload_is_downsized_and_stored_once(self):
+        from PIL import Image
+        raw = self.make_image()
+        token = self.upload(raw).json()['token']
+        self.assertTrue(preview_uploads.is_valid_token(token))
+        self.assertEqual(self.upload(raw).json()['token'], token)
+        self.assertEqual(os.listdir(os.path.join(self.upload_root, preview_uploads.UPLOAD_DIR)), [token])
+
+        response = self.client.get(preview_uploads.token_url(token))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size, (100, 75))
+
+    def test_rejects_non_images(self):
+        response = self.upload(b'not an image')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/preview-uploads/../settings.py').status_code, 404)
+
+    def test_preview_references_token_instead_of_inlining(self):
+        value = self.upload(self.make_image()).json()['value']
+        response = self.client.post(reverse('invapp:event_live_preview'), {
+            'selected_design': self.design.pk, 'title': 'Ana & Mihai', 'couple_photo': value})
+        self.assertContains(response, preview_uploads.token_url(value[len(preview_uploads.TOKEN_PREFIX):]))
+        self.assertNotContains(response, 'base64,')
+
+    def stored_files(self):
+        directory = os.path.join(self.upload_root, preview_uploads.UPLOAD_DIR)
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_inline_data_urls_are_stored_for_signed_in_hosts(self):
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(self.make_image()).decode()
+        response = self.client.post(reverse('invapp:event_live_preview'), {
+            'selected_design': self.design.pk, 'title': 'Ana', 'couple_photo': data_url})
+        self.assertNotContains(response, 'base64,')
+        self.assertContains(response, '/preview-uploads/')
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_public_preview_stores_nothing(self):
+        self.client.logout()
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(self.make_image()).decode()
+        response = self.client.post(reverse('invapp:event_preview'), json.dumps({
+            'selected_design': self.design.pk, 'title': 'Ana', 'couple_photo': data_url}), content_type='application/json')
+        self.assertContains(response, 'Ana')
+        self.assertNotContains(response, 'base64,')
+        self.assertNotContains(response, '/preview-uploads/')
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(self.upload(self.make_image()).status_code, 302)
+
+    def test_storage_writes_are_throttled_per_user(self):
+        with patch.object(views, 'preview_upload_throttle', TokenBucket(2, 0)):
+            self.assertEqual(self.upload(self.make_image((400, 300))).status_code, 200)
+            self.assertEqual(self.upload(self.make_image((300, 300))).status_code, 200)
+            self.assertEqual(self.upload(self.make_image((200, 300))).status_code, 429)
+            data_url = 'data:image/jpeg;base64,' + base64.b64encode(self.make_image((100, 300))).decode()
+            response = self.client.post(reverse('invapp:event_live_preview'), {
+                'selected_design': self.design.pk, 'title': 'Ana', 'couple_photo': data_url})
+        self.assertNotContains(response, 'base64,')
+        self.assertNotContains(response, '/preview-uploads/')
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_sweeper_removes_expired_uploads(self):
+        token = self.upload(self.make_image()).json()['token']
+        path = os.path.join(self.upload_root, preview_uploads.UPLOAD_DIR, token)
+        old = time.time() - 2 * 24 * 60 * 60
+        os.utime(path, (old, old))
+        out = StringIO()
+        call_command('sweep_preview_uploads', stdout=out)
+        self.assertIn('Removed 1', out.getvalue())
+        self.assertFalse(os.path.exists(path))
+
+
+class ResponsiveImageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root, RESPONSIVE_IMAGE_WORKERS=0,
+                                      RESPONSIVE_IMAGE_WIDTHS=(100, 200, 1000))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user(username='photos', password='password123')
+
+    def make_event(self, size=(400, 300)):
+        from PIL import Image
+        output = BytesIO()
+        Image.new('RGB', size, (30, 90, 160)).save(output, 'JPEG')
+        return Event.objects.create(owner=self.user, title='Photo Event',
+                                    couple_photo=SimpleUploadedFile('couple.jpg', output.getvalue(), content_type='image/jpeg'))
+
+    def render(self, image):
+        from django.template import Context, Template
+        return Template('{% load responsive_images %}{% responsive_image image alt="Couple" class="w-full" %}').render(
+            Context({'image': image}))
+
+    def test_variants_are_generated_with_dimensions(self):
+        event = self.make_event()
+        html = self.render(event.couple_photo)
+        record = ResponsiveImage.objects.get()
+        self.assertEqual(record.status, ResponsiveImage.Status.READY)
+        self.assertEqual((record.width, record.height), (400, 300))
+        self.assertEqual(sorted((v['format'], v['width'], v['height']) for v in record.variants),
+                         [('jpeg', 100, 75), ('jpeg', 200, 150), ('webp', 100, 75), ('webp', 200, 150)])
+
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('-100.webp 100w', html)
+        self.assertIn(f'{event.couple_photo.url} 400w', html)
+        self.assertIn('width="400"', html)
+        self.assertIn('height="300"', html)
+        self.assertIn('class="w-full"', html)
+
+        with self.assertNumQueries(0):
+            self.render(event.couple_photo)
+
+    def test_command_backfills_images(self):
+        self.make_event()
+        out = StringIO()
+        call_command('build_image_derivatives', stdout=out)
+        self.assertIn('Generated 1 image(s), 0 failed', out.getvalue())
+        call_command('build_image_derivatives', stdout=out)
+        self.assertEqual(ResponsiveImage.objects.count(), 1)
+
+    def test_cloudinary_images_use_transformation_urls(self):
+        from types import SimpleNamespace
+        url = 'https://res.cloudinary.com/demo/image/upload/v1/invapp_gallery/photo.jpg'
+        ResponsiveImage.objects.create(source=f'cloudinary:{url}', width=1200, height=800,
+                                       status=ResponsiveImage.Status.READY)
+        html = self.render(SimpleNamespace(url=url))
+        self.assertIn('/image/upload/c_limit,w_200,f_webp,q_auto/v1/invapp_gallery/photo.jpg 200w', html)
+        self.assertIn('/image/upload/c_limit,w_1000,f_jpg,q_auto/v1/invapp_gallery/photo.jpg 1000w', html)
+
+    def test_plain_urls_render_a_simple_img(self):
+        from types import SimpleNamespace
+        html = self.render(SimpleNamespace(url='data:image/png;base64,xyz'))
+        self.assertTrue(html.startswith('<img '))
+        self.assertIn('src="data:image/png;base64,xyz"', html)
+        self.assertNotIn('srcset', html)
+        self.assertEqual(self.render(None), '')
+        self.assertFalse(ResponsiveImage.objects.exists())
+
+
+class OptimizeStaticTest(TestCase):
+    def setUp(self):
+        from PIL import Image
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        os.makedirs(os.path.join(self.source, 'img', 'copies'))
+        Image.new('RGB', (64, 64), (10, 120, 200)).save(os.path.join(self.source, 'img', 'logo.png'))
+        shutil.copy(os.path.join(self.source, 'img', 'logo.png'), os.path.join(self.source, 'img', 'copies', 'logo.png'))
+        with open(os.path.join(self.source, 'site.css'), 'w') as handle:
+            handle.write('body { background: url("img/logo.png"); }\n' * 50)
+
+    def test_pipeline_hashes_dedupes_and_compresses(self):
+        from invapp.static_storage import OptimizedStaticFilesStorage
+        out = StringIO()
+        with override_settings(STATICFILES_DIRS=[self.source], STATIC_ROOT=self.root,
+                               STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder']):
+            call_command('optimize_static', stdout=out)
+            storage = OptimizedStaticFilesStorage()
+            self.assertEqual(storage.stored_name('img/logo.png'), storage.stored_name('img/copies/logo.png'))
+            self.assertRegex(storage.stored_name('img/logo.webp'), r'logo\.[0-9a-f]{12}\.webp$')
+            self.assertEqual(storage.stored_name('missing.js'), 'missing.js')
+            css_name = storage.stored_name('site.css')
+            self.assertTrue(os.path.exists(os.path.join(self.root, css_name + '.gz')))
+
+        report = out.getvalue()
+        self.assertIn('Images recompressed: 2', report)
+        self.assertIn('WebP siblings:       2', report)
+        self.assertIn('Duplicates merged:   2', report)
+
+
+class VoucherRedemptionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        views.voucher_throttle.reset()
+        self.basic = Plan.objects.create(name='Basic', price=0)
+        self.premium = Plan.objects.create(name='Premium', price=49)
+        self.user = User.objects.create_user('vouchers', 'vouchers@example.com', 'pw')
+
+    def test_redeem_claims_one_use_and_upgrades(self):
+        Voucher.objects.create(code='TWICE', discount_percentage=100, max_uses=2)
+        first = vouchers.redeem_voucher('twice', self.user, self.premium)
+        self.assertTrue(first.ok)
+        voucher = Voucher.objects.get(code='TWICE')
+        self.assertEqual(voucher.current_uses, 1)
+        self.assertFalse(voucher.is_used)
+        self.assertEqual(voucher.used_by, 'vouchers@example.com')
+        self.assertEqual(UserProfile.objects.get(user=self.user).plan, self.premium)
+
+        self.assertTrue(vouchers.redeem_voucher('TWICE', self.user, self.premium).ok)
+        self.assertTrue(Voucher.objects.get(code='TWICE').is_used)
+        self.assertEqual(vouchers.redeem_voucher('TWICE', self.user, self.premium).status,
+                         vouchers.VoucherStatus.USED)
+
+    def test_refusals_are_typed_and_claim_nothing(self):
+        restricted = Voucher.objects.create(code='PREMIUMONLY', discount_percentage=100, max_uses=5)
+        restricted.applicable_plans.add(self.premium)
+        Voucher.objects.create(code='HALF', discount_percentage=50, max_uses=5)
+        Voucher.objects.create(code='OLD', discount_percentage=100, valid_until=timezone.now() - timedelta(days=1))
+
+        cases = [
+            ('PREMIUMONLY', self.basic, False, vouchers.VoucherStatus.WRONG_PLAN),
+            ('HALF', self.premium, True, vouchers.VoucherStatus.NOT_FREE),
+            ('OLD', self.premium, False, vouchers.VoucherStatus.EXPIRED),
+            ('NOPE', self.premium, False, vouchers.VoucherStatus.INVALID),
+            ('', self.premium, False, vouchers.VoucherStatus.MISSING_CODE),
+        ]
+        for code, plan, require_free, status in cases:
+            with self.subTest(code=code):
+                result = vouchers.redeem_voucher(code, self.user, plan, require_free=require_free)
+                self.assertEqual(result.status, status)
+                self.assertEqual(vouchers.check_voucher(code, plan, require_free).status, status)
+        self.assertFalse(Voucher.objects.filter(current_uses__gt=0).exists())
+        self.assertTrue(vouchers.redeem_voucher('PREMIUMONLY', self.user, self.premium).ok)
+
+    def test_views_share_the_service(self):
+        Voucher.objects.create(code='FREE', discount_percentage=100, max_uses=1)
+        response = self.client.get(reverse('invapp:api_verify_voucher'), {'code': 'free', 'plan_id': self.premium.pk})
+        self.assertTrue(response.json()['valid'])
+
+        self.client.force_login(self.user)
+        url = reverse('invapp:api_apply_free_voucher')
+        payload = json.dumps({'code': 'FREE', 'plan_id': self.premium.pk})
+        self.assertEqual(self.client.post(url, payload, content_type='application/json').status_code, 200)
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], str(vouchers.MESSAGES[vouchers.VoucherStatus.USED]))
+
+
+class VoucherVerifyCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        views.voucher_throttle.reset()
+        self.plan = Plan.objects.create(name='Premium', price=49)
+        self.url = reverse('invapp:api_verify_voucher')
+
+    def test_lookups_are_cached_and_invalidated_on_save(self):
+        voucher = Voucher.objects.create(code='Summer25', discount_percentage=25)
+        voucher.applicable_plans.add(self.plan)
+        self.assertTrue(self.client.get(self.url, {'code': 'summer25', 'plan_id': self.plan.pk}).json()['valid'])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'code': 'SUMMER25', 'plan_id': self.plan.pk})
+        self.assertEqual(response.json()['discount_percentage'], 25)
+
+        voucher.active = False
+        voucher.save()
+        self.assertFalse(self.client.get(self.url, {'code': 'summer25'}).json()['valid'])
+
+        voucher.active = True
+        voucher.save()
+        voucher.applicable_plans.clear()
+        other = Plan.objects.create(name='Other', price=10)
+        voucher.applicable_plans.add(other)
+        self.assertFalse(self.client.get(self.url, {'code': 'summer25', 'plan_id': self.plan.pk}).json()['valid'])
+
+    def test_renamed_code_stops_resolving(self):
+        voucher = Voucher.objects.create(code='OLD10', discount_percentage=10)
+        self.assertTrue(self.client.get(self.url, {'code': 'old10'}).json()['valid'])
+        voucher.code = 'NEW10'
+        voucher.save()
+        self.assertFalse(self.client.get(self.url, {'code': 'old10'}).json()['valid'])
+        self.assertTrue(self.client.get(self.url, {'code': 'new10'}).json()['valid'])
+
+    def test_unknown_codes_are_remembered_until_created(self):
+        self.assertFalse(self.client.get(self.url, {'code': 'GUESS1'}).json()['valid'])
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {'code': 'guess1'})
+        Voucher.objects.create(code='GUESS1', discount_percentage=10)
+        self.assertTrue(self.client.get(self.url, {'code': 'guess1'}).json()['valid'])
+
+    def test_lookup_uses_the_upper_index_expression(self):
+        sql = str(vouchers.by_code('abc').query)
+        self.assertIn('UPPER', sql)
+
+    def test_client_ip_skips_our_proxies(self):
+        factory = RequestFactory()
+        # spoofed by the client, real client (added by Cloudflare), Cloudflare edge (added by the platform)
+        request = factory.get('/', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.7, 172.70.1.1', REMOTE_ADDR='10.0.0.9',
+                              HTTP_CF_CONNECTING_IP='198.51.100.3')
+        with self.settings(CLIENT_IP_HEADER=None, TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(client_ip(request), '203.0.113.7')
+            self.assertEqual(client_ip(factory.get('/', HTTP_X_FORWARDED_FOR='203.0.113.7')), '203.0.113.7')
+            self.assertEqual(client_ip(factory.get('/', REMOTE_ADDR='10.0.0.9')), '10.0.0.9')
+        with self.settings(CLIENT_IP_HEADER='HTTP_CF_CONNECTING_IP'):
+            self.assertEqual(client_ip(request), '198.51.100.3')
+        with self.settings(CLIENT_IP_HEADER=None, TRUSTED_PROXY_COUNT=0):
+            self.assertEqual(client_ip(request), '10.0.0.9')
+
+    @patch.object(views, 'voucher_throttle', TokenBucket(burst=3, rate=0.001))
+    def test_guessing_is_throttled_per_ip(self):
+        statuses = [self.client.get(self.url, {'code': f'X{i}'}, REMOTE_ADDR='10.0.0.1').status_code for i in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        self.assertEqual(self.client.get(self.url, {'code': 'X9'}, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+
+class VoucherGenerationTest(TestCase):
+    def test_codes_use_the_alphabet_and_skip_existing(self):
+        Voucher.objects.create(code='x-ab', discount_percentage=10)
+        batches = list(vouchers.generate_codes(3, length=2, alphabet='abc', prefix='X-', batch_size=2))
+        codes = [code for batch in batches for code in batch]
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(len(set(codes)), 3)
+        self.assertNotIn('X-AB', codes)
+        self.assertTrue(all(len(code) == 4 and set(code[2:]) <= set('ABC') for code in codes))
+        with self.assertRaises(vouchers.CodeSpaceExhausted):
+            next(vouchers.generate_codes(10, length=2, alphabet='ab'))
+
+    def test_bulk_create_costs_a_few_queries_per_batch(self):
+        plans = [Plan.objects.create(name='Basic', price=0), Plan.objects.create(name='Premium', price=49)]
+        with CaptureQueriesContext(connection) as queries:
+            created = [voucher for batch in vouchers.create_vouchers(
+                1500, plan_ids=[plan.pk for plan in plans], batch_size=1000,
+                campaign_name='Fair', discount_percentage=100, max_uses=1) for voucher in batch]
+        # One existence check per batch; the rest are multi-row inserts
+        self.assertEqual(sum(query['sql'].startswith('SELECT') for query in queries), 2)
+        self.assertEqual(len(created), 1500)
+        self.assertEqual(Voucher.applicable_plans.through.objects.count(), 3000)
+        self.assertEqual(len(created[0].code), len(settings.VOUCHER_CODE_PREFIX) + settings.VOUCHER_CODE_LENGTH)
+
+    def test_command_streams_csv(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'out.csv')
+        call_command('generate_campaign_vouchers', '--count', '25', '--campaign', 'Fair', '--days-valid', '5',
+                     '--length', '6', '--output', path, stdout=StringIO())
+        with open(path, encoding='utf-8-sig') as handle:
+            lines = handle.read().splitlines()
+        self.assertEqual(len(lines), 26)
+        self.assertEqual(Voucher.objects.filter(campaign_name='Fair', max_uses=1).count(), 25)
+
+
+class VoucherConcurrencyTest(TransactionTestCase):
+    def test_last_use_is_claimed_once(self):
+        Plan.objects.create(name='Basic', price=0)
+        plan = Plan.objects.create(name='Premium', price=49)
+        Voucher.objects.create(code='RACE', discount_percentage=100, max_uses=1)
+        users = [User.objects.create_user(f'racer{i}', f'racer{i}@example.com', 'pw') for i in range(8)]
+        barrier = threading.Barrier(len(users))
+        results = []
+
+        def redeem(user):
+            try:
+                barrier.wait()
+                results.append(vouchers.redeem_voucher('RACE', user, plan).ok)
+            except OperationalError:
+                # SQLite may refuse a concurrent writer outright; that is a lost race too
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=redeem, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 1)
+        voucher = Voucher.objects.get(code='RACE')
+        self.assertEqual(voucher.current_uses, 1)
+        self.assertTrue(voucher.is_used)
+        self.assertEqual(UserProfile.objects.filter(plan=plan).count(), 1)
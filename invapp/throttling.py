@@ -0,0 +1,64 @@
+"""
+In-process request throttling for public endpoints that would otherwise invite
+brute force (see api_verify_voucher). Each process keeps its own buckets, so the
+effective limit is per worker; that is enough to take guessing off the database.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    One bucket per key (usually the client IP): holds up to `burst` tokens,
+    refilled at `rate` tokens per second; each allowed request takes one.
+    """
+
+    def __init__(self, burst, rate, max_keys=10000):
+        self.burst = burst
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            if key not in self._buckets and len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            self._buckets[key] = (tokens, now)
+            return allowed
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full_after = self.burst / self.rate if self.rate else float('inf')
+        self._buckets = {key: entry for key, entry in self._buckets.items() if now - entry[1] < full_after}
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def client_ip(request):
+    """
+    The address the request came from. CLIENT_IP_HEADER (e.g. Cloudflare's
+    CF-Connecting-IP) wins when set, since only the edge can set it; otherwise
+    X-Forwarded-For is read TRUSTED_PROXY_COUNT entries from the right, skipping
+    the addresses our own proxies appended, so a client cannot choose its bucket.
+    """
+    header = getattr(settings, 'CLIENT_IP_HEADER', None)
+    if header and request.META.get(header, '').strip():
+        return request.META[header].strip()
+    depth = getattr(settings, 'TRUSTED_PROXY_COUNT', 1)
+    forwarded = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entry.strip()]
+    if depth and forwarded:
+        return forwarded[max(len(forwarded) - depth, 0)]
+    return request.META.get('REMOTE_ADDR', '')
@@ -0,0 +1,220 @@
+"""
+Admin import/export run as background jobs (see BackgroundImportExportMixin in
+invapp/admin.py and the admin_export/admin_import tasks). Exports are written
+chunk by chunk to a file in the transfer storage; imports read the uploaded file
+from there, commit in batches of ADMIN_IMPORT_BATCH_SIZE rows, and always run as
+a dry run first so the admin can review the changes before confirming.
+"""
+import csv
+import io
+import re
+import tempfile
+
+import tablib
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext as _
+from import_export.formats import base_formats
+from import_export.resources import modelresource_factory
+from import_export.results import RowResult
+
+from .exports import write_xlsx
+from .models import Guest
+
+TRANSFER_DIR = 'admin_transfers'
+REPORT_HEADER = ['row', 'action', 'object', 'changed_fields', 'errors']
+ROLLED_BACK = 'rolled_back'  # report action of rows kept out by a failing batch
+MAX_REPORTED_ERRORS = 20
+CHANGED_RE = re.compile(r'<(ins|del)\b')
+
+
+def get_storage():
+    """
+    ADMIN_TRANSFER_STORAGE names an entry of STORAGES that the web and worker
+    processes share. Unset, which settings only allow with DEBUG, the files stay
+    on this machine's disk under ADMIN_TRANSFER_ROOT, outside the public media folder.
+    """
+    alias = getattr(settings, 'ADMIN_TRANSFER_STORAGE', None)
+    if alias:
+        return storages[alias]
+    return FileSystemStorage(location=getattr(settings, 'ADMIN_TRANSFER_ROOT', settings.MEDIA_ROOT))
+
+
+def transfer_path(job_or_token, filename):
+    return f"{TRANSFER_DIR}/{job_or_token}/{filename}"
+
+
+def class_path(cls):
+    """Dotted path of `cls`, or None for classes made on the fly (e.g. the default resource)."""
+    path = f"{cls.__module__}.{cls.__qualname__}"
+    try:
+        return path if import_string(path) is cls else None
+    except ImportError:
+        return None
+
+
+def export_pks(queryset):
+    """
+    The rows to export, as a JSON-safe list of primary keys in the changelist's
+    order. Jobs carry data, never code: the worker re-reads the rows by key.
+    """
+    return list(queryset.values_list('pk', flat=True))
+
+
+def load_resource(model, resource_path):
+    resource_class = import_string(resource_path) if resource_path else modelresource_factory(model)
+    return resource_class()
+
+
+def _save(storage, name, output):
+    output.seek(0)
+    return storage.save(name, File(output, name=name))
+
+
+# --- Export ---
+def _export_rows(resource, pks, fields, chunk_size):
+    """Reads the rows ADMIN_EXPORT_CHUNK_SIZE keys at a time, keeping the order of `pks`."""
+    for start in range(0, len(pks), chunk_size):
+        chunk = pks[start:start + chunk_size]
+        queryset = resource.filter_export(resource.get_queryset().filter(pk__in=chunk))
+        objects = {obj.pk: obj for obj in queryset}
+        for pk in chunk:
+            if pk in objects:
+                yield resource.export_resource(objects[pk], selected_fields=fields)
+
+
+def export_queryset(job, payload):
+    """
+    Writes the export described by `payload` to the transfer storage, reporting
+    progress every ADMIN_EXPORT_CHUNK_SIZE rows, and returns the stored name.
+    CSV and XLSX are streamed; other formats are built in memory by tablib.
+    """
+    model = apps.get_model(payload['model'])
+    pks = payload['pks']
+    resource = load_resource(model, payload.get('resource'))
+    file_format = import_string(payload['format'])()
+    fields = payload.get('fields')
+    chunk_size = getattr(settings, 'ADMIN_EXPORT_CHUNK_SIZE', 1000)
+
+    resource.before_export(model._default_manager.filter(pk__in=pks))
+    total = len(pks)
+    headers = resource.get_export_headers(selected_fields=fields)
+    job.set_progress(0, total, _("Exporting..."))
+
+    def rows():
+        for done, row in enumerate(_export_rows(resource, pks, fields, chunk_size), start=1):
+            yield row
+            if done % chunk_size == 0:
+                job.set_progress(done, total, _("Exporting..."))
+
+    with tempfile.TemporaryFile() as output:
+        if isinstance(file_format, base_formats.CSV):
+            text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(headers)
+            writer.writerows(rows())
+            text.flush()
+            text.detach()
+        elif isinstance(file_format, base_formats.XLSX):
+            write_xlsx(output, headers, rows(), model._meta.verbose_name_plural.title())
+        else:
+            dataset = tablib.Dataset(*rows(), headers=headers)
+            data = file_format.export_data(dataset)
+            output.write(data.encode('utf-8') if isinstance(data, str) else data)
+        name = _save(get_storage(), transfer_path(job.public_id, payload['filename']), output)
+
+    job.set_progress(total, total, _("Export complete."))
+    return name
+
+
+# --- Import ---
+def read_dataset(payload):
+    input_format = import_string(payload['format'])()
+    with get_storage().open(payload['input']) as handle:
+        data = handle.read()
+    if not input_format.is_binary():
+        data = data.decode(payload.get('encoding') or 'utf-8-sig')
+    return input_format.create_dataset(data)
+
+
+def _report_rows(result, offset):
+    for number, row in enumerate(result.rows, start=offset + 1):
+        changed = [header for header, cell in zip(result.diff_headers, row.diff or []) if CHANGED_RE.search(cell)]
+        errors = [str(error.error) for error in row.errors]
+        yield [number, row.import_type, row.object_repr or '', ', '.join(changed), '; '.join(errors)]
+    for invalid in result.invalid_rows:
+        messages = [f"{field}: {' '.join(errors)}" for field, errors in invalid.error_dict.items()]
+        yield [offset + invalid.number, RowResult.IMPORT_TYPE_INVALID, '', '', '; '.join(messages)]
+
+
+def _touched_events(rows):
+    """Ids of the events whose guests the imported rows created, changed or deleted."""
+    event_ids, guest_ids = set(), set()
+    for row in rows:
+        for obj in (row.instance, row.original):
+            if getattr(obj, 'event_id', None):
+                event_ids.add(obj.event_id)
+            elif getattr(obj, 'guest_id', None):
+                guest_ids.add(obj.guest_id)
+    if guest_ids:
+        event_ids.update(Guest.objects.filter(pk__in=guest_ids).values_list('event_id', flat=True))
+    return event_ids
+
+
+def import_dataset(job, payload, user=None):
+    """
+    Imports the uploaded file batch by batch, each batch in its own transaction;
+    a batch with any failing row is rolled back whole. With payload['dry_run']
+    nothing is kept. Writes a CSV report of every row (action, changed fields,
+    errors) and returns (stored report name, totals, first errors, ids of the
+    events whose guests changed).
+    """
+    dataset = read_dataset(payload)
+    model = apps.get_model(payload['model'])
+    resource = load_resource(model, payload.get('resource'))
+    dry_run = payload.get('dry_run', True)
+    batch_size = getattr(settings, 'ADMIN_IMPORT_BATCH_SIZE', 500)
+    total = len(dataset)
+    totals = {}
+    errors = []
+    event_ids = set()
+    message = _("Checking rows...") if dry_run else _("Importing rows...")
+    job.set_progress(0, total, message)
+
+    with tempfile.TemporaryFile() as output:
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(REPORT_HEADER)
+        for start in range(0, total, batch_size):
+            batch = tablib.Dataset(*dataset[start:start + batch_size], headers=dataset.headers)
+            result = resource.import_data(
+                batch, dry_run=dry_run, raise_errors=False, use_transactions=True,
+                rollback_on_validation_errors=True, user=user, retain_instance_in_row_result=not dry_run,
+            )
+            rolled_back = not dry_run and (result.has_errors() or result.has_validation_errors())
+            if not dry_run and not rolled_back:
+                event_ids |= _touched_events(result.rows)
+            for key, count in result.totals.items():
+                if rolled_back and key in RowResult.valid_import_types:
+                    key = ROLLED_BACK
+                totals[key] = totals.get(key, 0) + count
+            for row in _report_rows(result, start):
+                if rolled_back and row[1] in RowResult.valid_import_types:
+                    row[1] = ROLLED_BACK
+                writer.writerow(row)
+                if row[4] and len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append([row[0], row[4]])
+            for error in result.base_errors:
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append([None, strip_tags(str(error.error))])
+            job.set_progress(min(start + batch_size, total), total, message)
+        text.flush()
+        text.detach()
+        name = _save(get_storage(), transfer_path(job.public_id, 'import_report.csv'), output)
+
+    return name, totals, errors, event_ids
+
@@ -37,6 +37,7 @@ urlpatterns = [
     path('table/<int:pk>/delete/', views.TableDeleteView.as_view(), name='table_delete'),  # pk = table's primary key
     path('event/new/', views.EventCreateView.as_view(), name='event_create'),
     path('event/preview/', views.event_preview_view, name='event_preview'),
+    path('event/preview/upload/', views.preview_upload_view, name='preview_upload'),
     path('event/<int:pk>/autosave/', views.event_autosave_view, name='event_autosave'),
     path('event/<int:pk>/edit/', views.EventUpdateView.as_view(), name='event_edit'),  # pk = event's primary key
     path('event/<int:pk>/delete/', views.EventDeleteView.as_view(), name='event_delete'),
@@ -55,7 +56,11 @@ urlpatterns = [
     path('event/<int:event_id>/assign/', views.table_assignment_view, name='table_assignment'),
     path('events/<int:event_id>/assignments/<int:assignment_id>/unassign/', views.unassign_guest_from_table_view,
          name='unassign_guest'),
+    path('events/<int:event_id>/assignments/auto/', views.table_auto_assign_view, name='table_auto_assign'),
     path('event/<int:event_id>/assignments/export/', views.export_assignments_csv, name='export_assignments_csv'),
+    path('event/<int:event_id>/guests/export/', views.guest_export_view, name='guest_export'),
+    path('jobs/<uuid:job_id>/', views.job_status_view, name='job_status'),
+    path('jobs/<uuid:job_id>/download/', views.job_download_view, name='job_download'),
 
     # === NEW: URLS FOR STRIPE PAYMENT FLOW        ===
     # ==============================================
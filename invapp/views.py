@@ -4,13 +4,15 @@ from django.contrib.sites.models import Site
 from allauth.socialaccount.models import SocialAccount
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse, HttpResponseForbidden
+from django.http import FileResponse, HttpResponse, JsonResponse, HttpResponseForbidden, Http404
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
 from .models import (
-    UserProfile, Event, Guest, RSVP, Table, TableAssignment, 
+    UserProfile, Event, EventStats, Guest, RSVP, Table, TableAssignment,
     CardDesign, Plan, FAQ, AboutSection, FutureFeature, Testimonial, Voucher,
-    MarketingCampaign
+    MarketingCampaign, Job, SeatingConstraint, StripeEventLog
 )
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
@@ -19,193 +21,56 @@ from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
-from django.core.mail import send_mail
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-import pandas as pd
+import logging
 import urllib.parse
 import json
-import csv
-import base64
+import uuid
 import sys
-import stripe
 from datetime import datetime, timedelta, time
 from types import SimpleNamespace
-from django.utils import timezone
+from django.utils import timezone, translation
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
+from . import exports, importers, invite_cache, jobs, preview_uploads, previews, seating, transfers, vouchers
+from .pagination import keyset_paginate
+from .context_processors import plans_cache
+from .throttling import TokenBucket, client_ip
 from .forms import (
     GuestForm, EventForm, GuestContactForm, AssignGuestForm,
     RSVPForm, TableForm, CustomUserCreationForm, TableAssignmentForm,
-    GuestCreateForm, GodparentFormSet, ScheduleItemFormSet, ReviewForm, GalleryImageFormSet
+    GuestCreateForm, GodparentFormSet, ScheduleItemFormSet, ReviewForm, GalleryImageFormSet,
+    SeatingConstraintForm
 )
 
+logger = logging.getLogger(__name__)
 
-@csrf_exempt
-@xframe_options_exempt
-def event_preview(request):
-    """
-    Preview logic with Debugging for Cloudinary URL issues.
-    """
-    if request.method == 'POST':
-        try:
-            # 1. Extract Data
-            if request.content_type == 'application/json':
-                try:
-                    data = json.loads(request.body)
-                except json.JSONDecodeError:
-                    return HttpResponse("Invalid JSON", status=400)
-            else:
-                data = request.POST.dict()
 
-            print(f"DEBUG: Preview Data Received. Keys: {list(data.keys())}")
+# --- CSV / Excel Export Views ---
+def _export_format(request):
+    return 'xlsx' if request.GET.get('format') == 'xlsx' else 'csv'
 
-            # 2. Build Mock Event
-            event_data = {}
-            for key, value in data.items():
-                if value == "":
-                    event_data[key] = None
-                else:
-                    event_data[key] = value
-
-            # --- 2.1 Process Dates/Times ---
-            if 'event_date' in event_data and event_data['event_date']:
-                try:
-                    event_data['event_date'] = datetime.strptime(event_data['event_date'], '%Y-%m-%d').date()
-                except ValueError:
-                    pass
-
-            if 'party_time' in event_data and event_data['party_time']:
-                try:
-                    event_data['party_time'] = datetime.strptime(event_data['party_time'], '%H:%M').time()
-                except ValueError:
-                    pass
-
-            if 'ceremony_time' in event_data and event_data['ceremony_time']:
-                try:
-                    event_data['ceremony_time'] = datetime.strptime(event_data['ceremony_time'], '%H:%M').time()
-                except ValueError:
-                    pass
-
-            # 3. FIX IMAGES (Cloudinary & Base64)
-            image_fields = ['couple_photo', 'landscape_photo', 'main_invitation_image']
-
-            for field_name in image_fields:
-                raw_val = data.get(field_name)
-
-                if raw_val and isinstance(raw_val, str):
-                    # CRITICAL: Clean whitespace
-                    raw_val = raw_val.strip()
-
-                    print(f"DEBUG: Processing {field_name}. Value starts with: '{raw_val[:10]}...'")
-
-                    # CASE 1: Absolute URL (Cloudinary/S3)
-                    if 'http://' in raw_val or 'https://' in raw_val:
-                        if not raw_val.startswith('http'):
-                            start = raw_val.find('http')
-                            if start != -1:
-                                raw_val = raw_val[start:]
-
-                        event_data[field_name] = SimpleNamespace(url=raw_val)
-                        print(f"DEBUG: {field_name} treated as Absolute URL: {raw_val}")
-
-                    # CASE 2: Base64 (New Upload)
-                    elif raw_val.startswith('data:image'):
-                        event_data[field_name] = SimpleNamespace(url=raw_val)
-                        print(f"DEBUG: {field_name} treated as Base64")
-
-                    # CASE 3: Relative Path (Local Dev or partial path)
-                    elif raw_val:
-                        clean_val = raw_val.replace('/media/', '')
-                        media_url = settings.MEDIA_URL.rstrip('/')
-                        final_url = f"{media_url}/{clean_val.lstrip('/')}"
-
-                        event_data[field_name] = SimpleNamespace(url=final_url)
-                        print(f"DEBUG: {field_name} treated as Local URL: {final_url}")
-                else:
-                    event_data[field_name] = None
-
-            # Convert dict to object
-            event_instance = SimpleNamespace(**event_data)
-
-            # 4. Design & Template
-            design_id = data.get('selected_design')
-            template_name = 'invapp/invites/default_invite.html'
-
-            if design_id:
-                try:
-                    design = CardDesign.objects.get(pk=design_id)
-                    template_name = design.template_name
-                    event_instance.selected_design = design
-                except (CardDesign.DoesNotExist, ValueError):
-                    pass
-
-            print(f"DEBUG: Rendering template {template_name}")
-
-            # 5. Context
-            context = {
-                'event': event_instance,
-                'guest': None,
-                'is_preview': True,
-                'godparents': [],
-                'schedule_items': [],
-                'gallery_images': []
-            }
-
-            return render(request, template_name, context)
 
-        except Exception as e:
-            print(f"ERROR in Preview: {e}")
-            return HttpResponse(f"Error generating preview: {str(e)}", status=500)
+@login_required
+def export_assignments_csv(request, event_id):
+    event = get_object_or_404(Event, pk=event_id)
+    if event.owner != request.user:
+        return HttpResponseForbidden(_("You do not have permission to export data for this event."))
 
-    return HttpResponse("Method not allowed", status=405)
+    header, rows, filename = exports.assignment_export(event)
+    return exports.export_response(_export_format(request), header, rows, filename, str(_('Table Assignments')))
 
 
-# --- CSV Export View ---
 @login_required
-def export_assignments_csv(request, event_id):
+def guest_export_view(request, event_id):
+    """Full guest list, including RSVP meal preferences and messages, as CSV or Excel."""
     event = get_object_or_404(Event, pk=event_id)
     if event.owner != request.user:
         return HttpResponseForbidden(_("You do not have permission to export data for this event."))
 
-    response = HttpResponse(content_type='text/csv')
-    response[
-        'Content-Disposition'] = f'attachment; filename="event_{event.title.replace(" ", "_")}_table_assignments.csv"'
-
-    # Add BOM (Byte Order Mark) for Excel to recognize UTF-8 (Special characters like ă, î, ș, ț)
-    response.write(u'\ufeff'.encode('utf8'))
-
-    writer = csv.writer(response)
-
-    # TRANSLATED HEADERS
-    writer.writerow([
-        str(_('Type')),
-        str(_('Guest Name')),
-        str(_('Phone Number')),
-        str(_('Email')),
-        str(_('Assigned Table')),
-        str(_('Number Attending')),
-        str(_('Invitation Method')),
-        str(_('Meal Preferences'))
-    ])
-
-    assignments = TableAssignment.objects.filter(table__event=event) \
-        .select_related('guest', 'table', 'guest__rsvp_details') \
-        .order_by('table__name', 'guest__name')
-
-    for assignment in assignments:
-        guest = assignment.guest
-        writer.writerow([
-            guest.get_honorific_display(),
-            guest.name,
-            guest.phone_number if guest.phone_number else '',
-            guest.email if guest.email else '',
-            assignment.table.name,
-            guest.attending_count,
-            guest.get_invitation_method_display(),
-            guest.rsvp_details.meal_preference if hasattr(guest, 'rsvp_details') else '',
-        ])
-    return response
+    header, rows, filename = exports.guest_list_export(event)
+    return exports.export_response(_export_format(request), header, rows, filename, str(_('Guest List')))
 
 
 # --- Invitation & RSVP View ---
@@ -214,7 +79,10 @@ def invitation_rsvp_combined_view(request, guest_uuid):
     """
     Handles displaying the invitation and the RSVP form for a specific guest.
     """
-    guest = get_object_or_404(Guest.objects.select_related('event__selected_design'), unique_id=guest_uuid)
+    guest = get_object_or_404(
+        Guest.objects.select_related('event__selected_design', 'event__owner__userprofile__plan', 'rsvp_details'),
+        unique_id=guest_uuid
+    )
     event = guest.event
 
     # --- SMART LANGUAGE REDIRECT ---
@@ -239,6 +107,22 @@ def invitation_rsvp_combined_view(request, guest_uuid):
     if current_lang != translation.get_language():
         translation.activate(current_lang)
 
+    template_to_render = event.selected_design.template_name if event.selected_design and event.selected_design.template_name else 'invapp/invites/default_invite.html'
+
+    # --- Shared shell for guests who have not answered yet ---
+    if invite_cache.is_cacheable(request, guest):
+        html = invite_cache.get_or_render(
+            request, guest, template_to_render,
+            lambda placeholder_guest: {
+                'event': event,
+                'guest': placeholder_guest,
+                'form': RSVPForm(guest=placeholder_guest),
+                'google_calendar_link': _build_google_calendar_link(event),
+                'is_preview': False,
+            }
+        )
+        return HttpResponse(html)
+
     try:
         existing_rsvp = guest.rsvp_details
     except (RSVP.DoesNotExist, AttributeError):
@@ -247,16 +131,18 @@ def invitation_rsvp_combined_view(request, guest_uuid):
     if request.method == 'POST':
         form = RSVPForm(request.POST, instance=existing_rsvp, guest=guest)
         if form.is_valid():
-            rsvp = form.save(commit=False)
-            rsvp.guest = guest
-            rsvp.save()
-
-            # Mark source as automatic and clear manual overrides
-            guest.rsvp_source = Guest.RSVPSourceChoices.AUTOMATIC
-            if guest.manual_is_attending is not None:
-                guest.manual_is_attending = None
-                guest.manual_attending_count = None
-            guest.save()
+            with transaction.atomic():
+                rsvp = form.save(commit=False)
+                rsvp.guest = guest
+                rsvp.save()
+
+                # Mark source as automatic and clear manual overrides
+                guest.rsvp_source = Guest.RSVPSourceChoices.AUTOMATIC
+                if guest.manual_is_attending is not None:
+                    guest.manual_is_attending = None
+                    guest.manual_attending_count = None
+                guest.save()
+                EventStats.refresh(event.id)
 
             messages.success(request, _("Confirmation details are updated. Thank you!") if existing_rsvp else _(
                 'Thank you for confirmation!'))
@@ -264,43 +150,43 @@ def invitation_rsvp_combined_view(request, guest_uuid):
     else:
         form = RSVPForm(instance=existing_rsvp, guest=guest)
 
-    # --- UPDATED: Calendar Link Generation ---
-    google_calendar_link = None
-    if event.event_date:
-        # 1. Determine Time: Party Time -> Ceremony Time -> Midnight
-        event_time = event.party_time or event.ceremony_time or datetime.min.time()
-
-        # 2. Combine Date and Time
-        start_time = datetime.combine(event.event_date, event_time)
-        end_time = start_time + timedelta(hours=5)
-
-        # 3. Format for Google (UTC format essentially)
-        fmt = "%Y%m%dT%H%M%SZ"
-        utc_start = start_time.strftime(fmt)
-        utc_end = end_time.strftime(fmt)
-
-        params = {
-            'action': 'TEMPLATE',
-            'text': event.title,
-            'dates': f"{utc_start}/{utc_end}",
-            'details': event.calendar_description or _("Join us for %(title)s!") % {'title': event.title},
-            'location': f"{event.venue_name}, {event.venue_address}",
-            'trp': 'false'
-        }
-        google_calendar_link = f"https://www.google.com/calendar/render?{urllib.parse.urlencode(params)}"
-
-    template_to_render = event.selected_design.template_name if event.selected_design and event.selected_design.template_name else 'invapp/invites/default_invite.html'
-
     context = {
         'event': event,
         'guest': guest,
         'form': form,
-        'google_calendar_link': google_calendar_link,
+        'google_calendar_link': _build_google_calendar_link(event),
         'is_preview': False,
     }
     return render(request, template_to_render, context)
 
 
+def _build_google_calendar_link(event):
+    if not event.event_date:
+        return None
+
+    # 1. Determine Time: Party Time -> Ceremony Time -> Midnight
+    event_time = event.party_time or event.ceremony_time or datetime.min.time()
+
+    # 2. Combine Date and Time
+    start_time = datetime.combine(event.event_date, event_time)
+    end_time = start_time + timedelta(hours=5)
+
+    # 3. Format for Google (UTC format essentially)
+    fmt = "%Y%m%dT%H%M%SZ"
+    utc_start = start_time.strftime(fmt)
+    utc_end = end_time.strftime(fmt)
+
+    params = {
+        'action': 'TEMPLATE',
+        'text': event.title,
+        'dates': f"{utc_start}/{utc_end}",
+        'details': event.calendar_description or _("Join us for %(title)s!") % {'title': event.title},
+        'location': f"{event.venue_name}, {event.venue_address}",
+        'trp': 'false'
+    }
+    return f"https://www.google.com/calendar/render?{urllib.parse.urlencode(params)}"
+
+
 # --- Thank You View ---
 def guest_invite_thank_you_view(request, guest_uuid):
     guest = get_object_or_404(Guest, unique_id=guest_uuid)
@@ -358,17 +244,9 @@ def landing_page_view(request):
     # Capture Voucher from URL (?v=CODE)
     voucher_code = request.GET.get('v')
     if voucher_code:
-        try:
-            voucher = Voucher.objects.get(code__iexact=voucher_code, active=True, is_used=False)
-            # Check activation and expiration
-            is_active = not (voucher.valid_from and voucher.valid_from > timezone.now())
-            is_not_expired = not (voucher.valid_until and voucher.valid_until < timezone.now())
-            
-            if is_active and is_not_expired:
-                request.session['active_voucher'] = voucher.code
-                print(f"DEBUG: Voucher {voucher.code} captured in session.")
-        except Voucher.DoesNotExist:
-            pass
+        result = vouchers.check_voucher(voucher_code)
+        if result.ok:
+            request.session['active_voucher'] = result.voucher.code
 
     plans = Plan.objects.filter(is_public=True).prefetch_related('card_designs').order_by('price')
 
@@ -409,48 +287,25 @@ def signup_view(request):
             subject = _('Welcome to InvApp!')
             message = _(
                 'Hello %(username)s,\n\nThank you for creating an account on our platform. You can now login to create invitations.\n\nRespectfully,\nInvApp Team') % {'username': user.username}
-            from_email = settings.DEFAULT_FROM_EMAIL
             recipient_list = [user.email]
-            try:
-                send_mail(subject, message, from_email, recipient_list)
-                messages.success(request, _("Registration successful! A confirmation email has been sent."))
-            except Exception:
-                messages.warning(request, _("Registration successful, but we could not send a confirmation email."))
+            # Sent by the background worker, which retries if the mail server is unavailable
+            jobs.enqueue('send_email', {
+                'subject': str(subject),
+                'message': str(message),
+                'recipient_list': recipient_list,
+            }, owner=user)
+            messages.success(request, _("Registration successful! A confirmation email is on its way."))
 
             login(request, user)
             
             # --- Apply Voucher from Session if any ---
             voucher_code = request.session.get('active_voucher')
             if voucher_code:
-                try:
-                    voucher = Voucher.objects.get(code__iexact=voucher_code, active=True, is_used=False)
-                    # Expiration & Activation checks
-                    is_expired = voucher.valid_until and voucher.valid_until < timezone.now()
-                    is_not_active_yet = voucher.valid_from and voucher.valid_from > timezone.now()
-                    
-                    if not is_expired and not is_not_active_yet:
-                        # 1. Update Profile Plan
-                        profile, created = UserProfile.objects.get_or_create(user=user)
-                        
-                        # Find the first paid plan (or Premium if we want to be specific)
-                        premium_plan = Plan.objects.filter(price__gt=0).order_by('-price').first()
-                        if premium_plan:
-                            profile.plan = premium_plan
-                            profile.save()
-                            
-                            # 2. Mark Voucher as Used
-                            voucher.is_used = True
-                            voucher.used_by = user.email
-                            voucher.used_at = timezone.now()
-                            voucher.current_uses += 1
-                            voucher.save()
-                            
-                            messages.success(request, _("Welcome! Your account has been upgraded to %(plan)s for free thanks to your voucher.") % {'plan': premium_plan.name})
-                            
-                            # 3. Clear session
-                            del request.session['active_voucher']
-                except Voucher.DoesNotExist:
-                    pass
+                # Find the first paid plan (or Premium if we want to be specific)
+                premium_plan = Plan.objects.filter(price__gt=0).order_by('-price').first()
+                if premium_plan and vouchers.redeem_voucher(voucher_code, user, premium_plan).ok:
+                    messages.success(request, _("Welcome! Your account has been upgraded to %(plan)s for free thanks to your voucher.") % {'plan': premium_plan.name})
+                    del request.session['active_voucher']
 
             return redirect('invapp:dashboard')
     else:
@@ -461,14 +316,17 @@ def signup_view(request):
 # --- Dashboard ---
 @login_required
 def dashboard_view(request):
-    # Fetch events with annotations to avoid N+1 query
-    events = Event.objects.filter(owner=request.user).select_related('selected_design').annotate(
-        confirmed_count=Count('guests', filter=Q(guests__rsvp_details__attending=True)),
-        total_guests_count=Count('guests')
-    ).order_by('-event_date')
+    # Totals come from the denormalized EventStats row instead of scanning guests
+    events = list(
+        Event.objects.filter(owner=request.user).select_related('selected_design', 'stats').order_by('-event_date')
+    )
+    for event in events:
+        stats = EventStats.get_for(event)
+        event.confirmed_count = stats.attending
+        event.total_guests_count = stats.invited
 
     user_guests = Guest.objects.filter(event__owner=request.user)
-    guest_count = user_guests.count()
+    guest_count = sum(event.total_guests_count for event in events)
 
     active_plan = request.user.userprofile.plan if hasattr(request.user, 'userprofile') else None
 
@@ -506,7 +364,7 @@ class TableListView(EventOwnerRequiredMixin, ListView):
         return get_object_or_404(Event, pk=self.kwargs.get('event_id'))
 
     def get_queryset(self):
-        return Table.objects.filter(event=self.get_event()).order_by('name')
+        return Table.objects.filter(event=self.get_event()).with_seated_count().order_by('name')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -633,11 +491,115 @@ def table_assignment_ui_view(request, event_id):
     else:
         form = TableAssignmentForm(event=event)
 
-    tables = Table.objects.filter(event=event).prefetch_related('assigned_guests__guest__rsvp_details').order_by('name')
+    tables = Table.objects.filter(event=event).with_seated_count() \
+        .prefetch_related('assigned_guests__guest__rsvp_details').order_by('name')
     context = {'event': event, 'tables': tables, 'assignment_form': form}
     return render(request, 'invapp/table_assignment_ui.html', context)
 
 
+def _parse_seating_plan(values):
+    """Reads the 'guest_id:table_id' pairs posted back from the auto-seat preview."""
+    plan = {}
+    for value in values:
+        guest_id, _sep, table_id = value.partition(':')
+        if guest_id.isdigit() and table_id.isdigit():
+            plan[int(guest_id)] = int(table_id)
+    return plan
+
+
+def _save_seating_plan(event, plan):
+    """
+    Re-validates an accepted plan against the current data and writes it with one
+    bulk_create. Returns the number of guests seated, or None if the plan is stale.
+    """
+    table_ids = set(plan.values())
+    with transaction.atomic():
+        # Lock with a plain query: PostgreSQL refuses FOR UPDATE with GROUP BY or outer joins
+        list(Table.objects.select_for_update().filter(event=event, id__in=table_ids).values_list('id', flat=True))
+        tables = {table.id: table for table in Table.objects.filter(event=event, id__in=table_ids).with_seated_count()}
+        guests = {
+            guest.id: guest
+            for guest in Guest.objects.filter(event=event, id__in=plan.keys(), tableassignment__isnull=True)
+            .with_effective_attendance().filter(effective_is_attending=True)
+        }
+        if len(guests) != len(plan) or len(tables) != len(table_ids):
+            return None
+
+        needed = {}
+        for guest_id, table_id in plan.items():
+            needed[table_id] = needed.get(table_id, 0) + max(guests[guest_id].attending_count, 1)
+        if any(tables[table_id].capacity - tables[table_id].seated_count < seats for table_id, seats in needed.items()):
+            return None
+
+        TableAssignment.objects.bulk_create([
+            TableAssignment(event=event, guest=guests[guest_id], table=tables[table_id])
+            for guest_id, table_id in plan.items()
+        ])
+    return len(plan)
+
+
+@login_required
+def table_auto_assign_view(request, event_id):
+    """
+    Auto-seat: proposes a seating plan for every unseated attending guest, which the
+    host can accept as a whole. Also manages the keep-together / keep-apart rules.
+    """
+    if not request.user.userprofile.plan.has_table_assignment:
+        messages.error(request, _("Table assignment is not included in your plan."))
+        return redirect(reverse('invapp:landing_page') + '#pricing')
+
+    event = get_object_or_404(Event, id=event_id, owner=request.user)
+    constraint_form = SeatingConstraintForm(event=event)
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        if action == 'accept':
+            seated = _save_seating_plan(event, _parse_seating_plan(request.POST.getlist('seat')))
+            if seated is None:
+                messages.error(request, _("The guest list or tables changed since this plan was made. Please review the new proposal."))
+                return redirect('invapp:table_auto_assign', event_id=event.id)
+            messages.success(request, _("%(count)d guest(s) seated automatically.") % {'count': seated})
+            return redirect('invapp:table_assignment_ui', event_id=event.id)
+        if action == 'delete_constraint':
+            SeatingConstraint.objects.filter(event=event, pk=request.POST.get('constraint_id')).delete()
+            return redirect('invapp:table_auto_assign', event_id=event.id)
+        if action == 'add_constraint':
+            constraint_form = SeatingConstraintForm(request.POST, event=event)
+            if constraint_form.is_valid():
+                constraint = constraint_form.save(commit=False)
+                constraint.event = event
+                SeatingConstraint.objects.get_or_create(
+                    event=event, guest_a=constraint.guest_a, guest_b=constraint.guest_b, kind=constraint.kind)
+                return redirect('invapp:table_auto_assign', event_id=event.id)
+
+    plan = seating.build_plan_for_event(event)
+
+    # Shape the preview: proposed guests per table, next to the ones already seated
+    tables = list(Table.objects.filter(event=event).with_seated_count().order_by('name', 'id'))
+    involved_ids = set(plan.assignments) | set(plan.unseated)
+    guests = Guest.objects.filter(id__in=involved_ids).select_related('rsvp_details').with_effective_attendance().in_bulk()
+    proposed = {}
+    for guest_id, table_id in plan.assignments.items():
+        proposed.setdefault(table_id, []).append(guests[guest_id])
+    for table in tables:
+        table.proposed_guests = sorted(proposed.get(table.id, []), key=lambda guest: guest.name.lower())
+        table.proposed_seats = sum(max(guest.attending_count, 1) for guest in table.proposed_guests)
+        table.total_after = table.seated_count + table.proposed_seats
+
+    names = dict(Guest.objects.filter(event=event).values_list('id', 'name'))
+    context = {
+        'event': event,
+        'tables': tables,
+        'plan': plan,
+        'seat_values': [f"{guest_id}:{table_id}" for guest_id, table_id in sorted(plan.assignments.items())],
+        'unseated_guests': sorted((guests[guest_id] for guest_id in plan.unseated), key=lambda guest: guest.name.lower()),
+        'broken_constraints': [(names.get(a), names.get(b), SeatingConstraint.Kind(kind).label) for a, b, kind in plan.broken_constraints],
+        'constraints': SeatingConstraint.objects.filter(event=event).select_related('guest_a', 'guest_b'),
+        'constraint_form': constraint_form,
+    }
+    return render(request, 'invapp/table_auto_assign.html', context)
+
+
 @login_required
 def unassign_guest_from_table_view(request, event_id, assignment_id):
     assignment = get_object_or_404(TableAssignment, id=assignment_id, table__event__owner=request.user,
@@ -923,161 +885,155 @@ def event_autosave_view(request, pk):
 
 
 # --- Preview View ---
+# Preview images stored per user (see preview_upload_view and EventLivePreviewView)
+preview_upload_throttle = TokenBucket(settings.PREVIEW_UPLOAD_THROTTLE_BURST, settings.PREVIEW_UPLOAD_THROTTLE_RATE)
+
+
 @csrf_exempt
 @xframe_options_exempt
 def event_preview_view(request):
+    """
+    Public, unauthenticated preview: it stores nothing, so inline data: images are
+    left out and only stored uploads and URLs are shown.
+    """
     if request.method != 'POST': return HttpResponse("Invalid", status=400)
     try:
         data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return HttpResponse("Invalid JSON", status=400)
 
-        # --- 1. Manage date and time ---
-        date_str = data.get('event_date')
-        if date_str:
-            try:
-                data['event_date'] = datetime.strptime(date_str, "%Y-%m-%d").date()
-                data['date_time'] = data['event_date'] # Alias for older templates
-            except:
-                data['event_date'] = None
-                data['date_time'] = None
-
-        time_str = data.get('party_time')
-        if time_str:
-            try:
-                data['party_time'] = datetime.strptime(time_str, "%H:%M").time()
-            except:
-                data['party_time'] = None
-
-        ceremony_time_str = data.get('ceremony_time')
-        if ceremony_time_str:
-            try:
-                data['ceremony_time'] = datetime.strptime(ceremony_time_str, "%H:%M").time()
-            except:
-                data['ceremony_time'] = None
-
-        # --- 1.5. Manage Formsets (Godparents & Timeline) ---
-        # Extract data from flat format (godparents-0-name) into structured lists
-        godparents_list = []
-        schedule_list = []
-        
-        for key, value in data.items():
-            if key.startswith('godparents-') and key.endswith('-name') and value.strip():
-                if not data.get(key.replace('-name', '-DELETE')) == 'on': # Skip deleted
-                    godparents_list.append(SimpleNamespace(name=value))
-            
-            if key.startswith('schedule_items-') and key.endswith('-activity_type') and value.strip():
-                if not data.get(key.replace('-activity_type', '-DELETE')) == 'on':
-                    prefix = key.rsplit('-', 1)[0]
-                    time_val = data.get(f"{prefix}-time")
-                    try:
-                        parsed_time = datetime.strptime(time_val, "%H:%M").time() if time_val else None
-                    except:
-                        parsed_time = None
-                    schedule_list.append(SimpleNamespace(activity_type=value, time=parsed_time))
-
-        mock_event = SimpleNamespace(**data)
-        
-        # Attach "Mock Managers" to support .exists() and .all() in templates
-        mock_event.godparents = SimpleNamespace(
-            exists=lambda: len(godparents_list) > 0,
-            all=lambda: godparents_list
-        )
-        mock_event.schedule_items = SimpleNamespace(
-            exists=lambda: len(schedule_list) > 0,
-            all=lambda: sorted(schedule_list, key=lambda x: x.time if x.time else time.min)
-        )
+    design = previews.get_design(data.get('selected_design'))
+    if not design: return HttpResponse("No design", status=400)
 
-        # --- 2. Manage Images ---
-        for field in ['couple_photo', 'landscape_photo', 'main_invitation_image', 'audio_greeting']:
-            img = data.get(field)
+    try:
+        return HttpResponse(previews.render_preview(previews.drop_inline_images(data), design))
+    except Exception as e:
+        print(f"Preview Error: {e}")
+        return HttpResponse(f"Error: {e}", status=500)
 
-            if not img:
-                setattr(mock_event, field, None)
-                continue
 
-            img = img.strip()
+@login_required
+def preview_upload_view(request):
+    """Stores an image picked in the event form once and returns the token previews refer to it by."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'error': _("No file was uploaded.")}, status=400)
+    if not preview_upload_throttle.allow(request.user.pk):
+        return JsonResponse({'error': _("Too many uploads. Please wait a moment and try again.")}, status=429)
+    try:
+        token = preview_uploads.store_file(upload)
+    except preview_uploads.PreviewUploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'token': token,
+        'value': preview_uploads.TOKEN_PREFIX + token,
+        'url': preview_uploads.token_url(token),
+    })
 
-            # Case A: New Upload (Base64) or Absolute URL (Cloudinary/HTTPS)
-            if img.startswith('data:') or img.startswith('http://') or img.startswith('https://'):
-                setattr(mock_event, field, SimpleNamespace(url=img))
 
-            # Case B: Local URL (Development)
-            else:
-                clean_path = img.lstrip('/')
-                if clean_path.startswith('media/'):
-                    final_url = f"/{clean_path}"
-                else:
-                    final_url = f"{settings.MEDIA_URL}{clean_path}"
-
-                setattr(mock_event, field, SimpleNamespace(url=final_url))
-
-        # --- 3. Manage Design ---
-        design_id = data.get('selected_design')
-        if not design_id: return HttpResponse("No design", status=400)
-        design = CardDesign.objects.get(id=design_id)
-
-        # --- 4. Mock Guest (Using unique_id) ---
-        mock_guest = SimpleNamespace(
-            unique_id='00000000-0000-0000-0000-000000000000',
-            name=_('Guest Name'),
-            honorific='family',
-            max_attendees=5,
-            manual_is_attending=None,
-            rsvp_details=SimpleNamespace(attending=None)
-        )
+def preview_upload_file_view(request, token):
+    if not preview_uploads.is_valid_token(token):
+        raise Http404
+    storage = preview_uploads.get_storage()
+    name = preview_uploads.token_path(token)
+    try:
+        handle = storage.open(name)
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(handle, content_type=preview_uploads.CONTENT_TYPES[token.rsplit('.', 1)[1]])
+    # The name is derived from the content, so the file never changes
+    response['Cache-Control'] = f"private, max-age={getattr(settings, 'PREVIEW_UPLOAD_MAX_AGE', 24 * 60 * 60)}, immutable"
+    return response
 
-        # --- 5. Mock Form (Critical for RSVP display) ---
-        from .forms import RSVPForm
-        mock_form = RSVPForm(guest=mock_guest)
 
-        context = {
-            'event': mock_event,
-            'guest': mock_guest,
-            'form': mock_form,
-            'is_preview': True
-        }
+# --- Guest Management Views ---
+GUEST_LIST_PAGE_SIZE = 50
 
-        # --- 6. Render with Request (Critical for CSRF Token) ---
-        html = render_to_string(design.template_name, context, request=request)
-        return HttpResponse(html)
+# Keyset sort keys per ?sort= value: (field, descending). The last key must be unique.
+GUEST_LIST_SORTS = {
+    'name': [('sort_name', False), ('id', False)],
+    '-name': [('sort_name', True), ('id', True)],
+    'status': [('status_priority', False), ('sort_name', False), ('id', False)],
+    '-status': [('status_priority', True), ('sort_name', True), ('id', True)],
+}
 
-    except Exception as e:
-        print(f"Preview Error: {e}")
-        return HttpResponse(f"Error: {e}", status=500)
+GUEST_STATUS_FILTERS = {
+    'attending': Q(effective_is_attending=True),
+    'declined': Q(effective_is_attending=False),
+    'pending': Q(effective_is_attending__isnull=True),
+}
 
 
-# --- Guest Management Views ---
 @login_required
 def guest_list(request, event_id):
     event = get_object_or_404(Event, pk=event_id, owner=request.user)
 
-    # 1. Fetch data
-    guests_queryset = Guest.objects.filter(event=event).select_related('rsvp_details')
-    guests_list = list(guests_queryset)
-
-    # 2. Sort by URL parameter
+    # 1. Sort by URL parameter (attendance status is computed in SQL)
     sort_param = request.GET.get('sort', 'name')
+    if sort_param not in GUEST_LIST_SORTS:
+        sort_param = 'name'
+
+    guests_queryset = Guest.objects.filter(event=event) \
+        .select_related('rsvp_details') \
+        .with_effective_attendance() \
+        .annotate(sort_name=Lower('name'))
+
+    # 2. Server-side filters
+    filters = {
+        'status': request.GET.get('status', ''),
+        'language': request.GET.get('language', ''),
+        'method': request.GET.get('method', ''),
+        'table': request.GET.get('table', ''),
+        'q': request.GET.get('q', '').strip(),
+    }
+    if filters['status'] in GUEST_STATUS_FILTERS:
+        guests_queryset = guests_queryset.filter(GUEST_STATUS_FILTERS[filters['status']])
+    if filters['language']:
+        guests_queryset = guests_queryset.filter(preferred_language=filters['language'])
+    if filters['method']:
+        guests_queryset = guests_queryset.filter(invitation_method=filters['method'])
+    if filters['table'] == 'none':
+        guests_queryset = guests_queryset.filter(tableassignment__isnull=True)
+    elif filters['table'].isdigit():
+        guests_queryset = guests_queryset.filter(tableassignment__table_id=int(filters['table']))
+    if filters['q']:
+        guests_queryset = guests_queryset.filter(name__icontains=filters['q'])
+
+    # 3. Keyset pagination on (sort key, id)
+    page = keyset_paginate(
+        guests_queryset,
+        GUEST_LIST_SORTS[sort_param],
+        GUEST_LIST_PAGE_SIZE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
 
-    def status_priority(guest):
-        if guest.is_attending is True: return 0
-        if guest.is_attending is None: return 1
-        return 2
-
-    if sort_param == 'name':
-        guests_list.sort(key=lambda g: g.name.lower())
-    elif sort_param == '-name':
-        guests_list.sort(key=lambda g: g.name.lower(), reverse=True)
-    elif sort_param == 'status':
-        guests_list.sort(key=lambda g: (status_priority(g), g.name.lower()))
-    elif sort_param == '-status':
-        guests_list.sort(key=lambda g: (status_priority(g), g.name.lower()), reverse=True)
+    # 4. Footer totals: event-wide from EventStats, filtered ones from one aggregate
+    stats = EventStats.get_for(event)
+    active_filters = {key: value for key, value in filters.items() if value}
 
-    total_attending = sum(g.attending_count for g in guests_list)
+    # 5. Progress of an import started from this page (polled by the template)
+    import_job_url = None
+    try:
+        import_job_url = reverse('invapp:job_status', kwargs={'job_id': uuid.UUID(request.GET.get('import_job', ''))})
+    except ValueError:
+        pass
 
     context = {
         'event': event,
-        'guests': guests_list,
-        'total_attending': total_attending,
+        'guests': page.object_list,
+        'page': page,
+        'stats': stats,
+        'total_attending': stats.headcount,
+        'filtered_totals': guests_queryset.attendance_totals() if active_filters else None,
         'current_sort': sort_param,
+        'filters': filters,
+        'filter_query': urllib.parse.urlencode(active_filters),
+        'page_query': urllib.parse.urlencode({**active_filters, 'sort': sort_param}),
+        'tables': Table.objects.filter(event=event).order_by('name'),
+        'import_job_url': import_job_url,
     }
     return render(request, 'invapp/guest_list_tailwind.html', context)
 
@@ -1104,7 +1060,9 @@ class GuestCreateView(LoginRequiredMixin, CreateView):
         guest = form.save(commit=False)
         guest.owner = self.request.user
         guest.event = self.event
-        guest.save()
+        with transaction.atomic():
+            guest.save()
+            EventStats.refresh(self.event.id)
         messages.success(self.request, _("Guest added."))
         return redirect('invapp:guest_list', event_id=self.event.id)
 
@@ -1152,7 +1110,10 @@ class GuestDeleteView(LoginRequiredMixin, DeleteView):
 
     def form_valid(self, form):
         success_url = self.get_success_url()
-        self.object.delete()
+        event_id = self.object.event_id
+        with transaction.atomic():
+            self.object.delete()
+            EventStats.refresh(event_id)
         messages.success(self.request, _("Guest deleted."))
         return redirect(success_url)
 
@@ -1176,10 +1137,11 @@ def update_attendance_view(request, guest_id):
         if 'preferred_language' in data:
             guest.preferred_language = data.get('preferred_language')
 
-        guest.save()
+        with transaction.atomic():
+            guest.save()
+            stats = EventStats.refresh(guest.event_id)
 
-        total = sum(g.attending_count for g in Guest.objects.filter(event=guest.event))
-        return JsonResponse({'status': 'success', 'new_total_attending': total})
+        return JsonResponse({'status': 'success', 'new_total_attending': stats.headcount})
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
@@ -1201,6 +1163,8 @@ def mark_invitation_sent_view(request, guest_id):
 # --- Stripe Views ---
 @login_required
 def create_checkout_session_view(request, plan_id):
+    import stripe
+
     plan = get_object_or_404(Plan, id=plan_id)
     stripe.api_key = settings.STRIPE_SECRET_KEY
 
@@ -1210,8 +1174,11 @@ def create_checkout_session_view(request, plan_id):
         checkout_mode = 'payment'
 
     try:
+        # Reuse the Stripe customer from an earlier checkout, so webhooks keep matching this user
+        customer_id = UserProfile.objects.filter(user=request.user).values_list('stripe_customer_id', flat=True).first()
+        customer_args = {'customer': customer_id} if customer_id else {'customer_email': request.user.email}
         session = stripe.checkout.Session.create(
-            customer_email=request.user.email,
+            **customer_args,
             metadata={
                 'user_id': request.user.id,
                 'plan_id': plan.id
@@ -1233,85 +1200,31 @@ def create_checkout_session_view(request, plan_id):
 
 @csrf_exempt
 def stripe_webhook(request):
+    import stripe
+
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
-    event = None
-
-    print("\n=== STRIPE WEBHOOK RECEIVED ===")
 
     try:
         event = stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError:
-        print(f"❌ Error: Invalid payload")
+        logger.warning("Stripe webhook: invalid payload")
         return HttpResponse(status=400)
     except stripe.SignatureVerificationError:
-        print(f"❌ Error: Signature verification failed.")
+        logger.warning("Stripe webhook: signature verification failed")
         return HttpResponse(status=400)
 
-    # --- 1. PAYMENT COMPLETED ---
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        print(f"💰 Payment Succeeded for Session ID: {session.get('id')}")
-
-        user_id = session.get('metadata', {}).get('user_id')
-        plan_id = session.get('metadata', {}).get('plan_id')
-        subscription_id = session.get('subscription')
-
-        print(f"👤 Metadata Found -> User ID: {user_id}, Plan ID: {plan_id}, Sub ID: {subscription_id}")
-
-        if user_id and plan_id:
-            try:
-                user = User.objects.get(id=user_id)
-                new_plan = Plan.objects.get(id=plan_id)
-
-                if not hasattr(user, 'userprofile'):
-                    UserProfile.objects.create(user=user)
-
-                profile = user.userprofile
-                profile.plan = new_plan
-                profile.save()
-
-                print(f"✅ SUCCESS: Upgraded {user.username} to plan '{new_plan.name}'")
-            except Exception as e:
-                print(f"❌ ERROR updating DB: {str(e)}")
-                return HttpResponse(status=200)
-
-    # --- 2. NEW SUBSCRIPTION CREATED ---
-    elif event['type'] == 'customer.subscription.created':
-        subscription = event['data']['object']
-        subscription_id = subscription.get('id')
-        customer_id = subscription.get('customer')
-        print(f"🆕 Subscription CREATED: {subscription_id} for Customer: {customer_id}")
-
-    # --- 3. SUBSCRIPTION CANCELLED ---
-    elif event['type'] == 'customer.subscription.deleted':
-        subscription = event['data']['object']
-        customer_id = subscription.get('customer')
-
-        print(f"⚠️ Subscription Cancelled for Customer ID: {customer_id}")
-
-        try:
-            stripe.api_key = settings.STRIPE_SECRET_KEY
-            customer = stripe.Customer.retrieve(customer_id)
-            email = customer.get('email')
-
-            if email:
-                try:
-                    user = User.objects.get(email=email)
-                    user.userprofile.plan = None
-                    user.userprofile.save()
-                    print(f"✅ SUCCESS: Downgraded user {email} (Subscription Ended)")
-                except User.DoesNotExist:
-                    print(f"❌ User with email {email} not found.")
-            else:
-                print("❌ Could not find email in Stripe Customer object.")
-
-        except Exception as e:
-            print(f"❌ Error handling cancellation: {e}")
-            return HttpResponse(status=200)
-
+    # Logged once per event id, so Stripe's redeliveries are acknowledged without
+    # being handled again; the handling itself runs in the worker.
+    try:
+        with transaction.atomic():
+            log = StripeEventLog.objects.create(
+                event_id=event['id'], event_type=event['type'], payload=json.loads(payload))
+            jobs.enqueue('stripe_event', {'event_log_id': log.pk}, max_attempts=5)
+    except IntegrityError:
+        logger.info("Stripe webhook: duplicate event %s ignored", event['id'])
     return HttpResponse(status=200)
 
 
@@ -1327,54 +1240,33 @@ def payment_cancel_view(request):
     return redirect(reverse('invapp:landing_page') + '#pricing')
 
 
+voucher_throttle = TokenBucket(settings.VOUCHER_THROTTLE_BURST, settings.VOUCHER_THROTTLE_RATE)
+
+
 @csrf_exempt
 def api_verify_voucher(request):
     """
     JSON endpoint to verify if a voucher is valid.
+    Public, so it is throttled per IP and answered from cached voucher state.
     """
+    if not voucher_throttle.allow(client_ip(request)):
+        return JsonResponse({'valid': False, 'message': _('Too many attempts. Please try again in a minute.')},
+                            status=429)
+
     code = request.GET.get('code') or request.POST.get('code')
     requested_plan_id = request.GET.get('plan_id') or request.POST.get('plan_id')
-    
-    print(f"DEBUG VOUCHER: Verifying code='{code}' for plan_id='{requested_plan_id}'")
-
-    if not code:
-        return JsonResponse({'valid': False, 'message': _('Please enter a voucher code.')})
-
-    try:
-        voucher = Voucher.objects.prefetch_related('applicable_plans').get(code__iexact=code)
-    except Voucher.DoesNotExist:
-        return JsonResponse({'valid': False, 'message': _('Invalid voucher code.')})
-
-    if not voucher.active:
-        return JsonResponse({'valid': False, 'message': _('This voucher is no longer active.')})
-
-    if voucher.is_used:
-        return JsonResponse({'valid': False, 'message': _('This voucher has already been used.')})
 
-    if voucher.valid_until and voucher.valid_until < timezone.now():
-        return JsonResponse({'valid': False, 'message': _('This voucher has expired.')})
+    plan = None
+    if requested_plan_id and str(requested_plan_id).isdigit():
+        plan = plans_cache.get().get(int(requested_plan_id))
 
-    if voucher.valid_from and voucher.valid_from > timezone.now():
-        return JsonResponse({'valid': False, 'message': _('This voucher is not yet active.')})
-
-    if voucher.current_uses >= voucher.max_uses:
-        return JsonResponse({'valid': False, 'message': _('This voucher has reached its maximum uses.')})
-
-    # Plan Restriction Check
-    if requested_plan_id and voucher.applicable_plans.exists():
-        try:
-            plan_id_int = int(requested_plan_id)
-            if not voucher.applicable_plans.filter(id=plan_id_int).exists():
-                print(f"DEBUG VOUCHER: Plan {plan_id_int} not in {list(voucher.applicable_plans.values_list('id', flat=True))}")
-                return JsonResponse({'valid': False, 'message': _('This voucher is not valid for the selected plan.')})
-        except ValueError:
-            pass
-
-    print(f"DEBUG VOUCHER: SUCCESS for code='{code}'")
+    result = vouchers.check_voucher(code, plan=plan)
+    if not result.ok:
+        return JsonResponse({'valid': False, 'message': result.message})
     return JsonResponse({
         'valid': True,
-        'discount_percentage': voucher.discount_percentage,
-        'message': _('Voucher applied successfully!')
+        'discount_percentage': result.voucher.discount_percentage,
+        'message': result.message
     })
 
 
@@ -1398,42 +1290,9 @@ def api_apply_free_voucher(request):
 
     plan = get_object_or_404(Plan, id=plan_id)
 
-    try:
-        voucher = Voucher.objects.get(code__iexact=code, active=True)
-    except Voucher.DoesNotExist:
-        return JsonResponse({'status': 'error', 'message': _('Invalid voucher.')}, status=400)
-
-    if voucher.is_used:
-        return JsonResponse({'status': 'error', 'message': _('Voucher already used.')}, status=400)
-
-    if voucher.valid_until and voucher.valid_until < timezone.now():
-        return JsonResponse({'status': 'error', 'message': _('Voucher expired.')}, status=400)
-
-    if voucher.valid_from and voucher.valid_from > timezone.now():
-        return JsonResponse({'status': 'error', 'message': _('Voucher not yet active.')}, status=400)
-
-    if voucher.discount_percentage != 100:
-        return JsonResponse({'status': 'error', 'message': _('This voucher is not for a free upgrade.')}, status=400)
-
-    if voucher.current_uses >= voucher.max_uses:
-        return JsonResponse({'status': 'error', 'message': _('Voucher reached usage limit.')}, status=400)
-
-    # Plan Restriction Check
-    if voucher.applicable_plans.exists():
-        if not voucher.applicable_plans.filter(id=plan.id).exists():
-            return JsonResponse({'status': 'error', 'message': _('This voucher is not valid for the selected plan.')}, status=400)
-
-    # Perform Upgrade
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    profile.plan = plan
-    profile.save()
-
-    # Increment uses and mark as used
-    voucher.current_uses += 1
-    voucher.is_used = True
-    voucher.used_by = request.user.email
-    voucher.used_at = timezone.now()
-    voucher.save()
+    result = vouchers.redeem_voucher(code, request.user, plan, require_free=True)
+    if not result.ok:
+        return JsonResponse({'status': 'error', 'message': result.message}, status=400)
 
     messages.success(request,
                      _("Congratulations! Your plan has been upgraded to %(plan)s for free!") % {'plan': plan.name})
@@ -1449,63 +1308,75 @@ def manual_upgrade_page_view(request, plan_id):
 # --- Guest Import/Export ---
 @login_required
 def download_guest_template_view(request, event_id):
-    # Added Invitation Method to template
-    df = pd.DataFrame(columns=[
-        _('Honorific'), 
-        _('Name'), 
-        _('Email'), 
-        _('Phone Number'), 
-        _('Max Attendees'),
-        _('Invitation Method') # digital or physical
-    ])
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="guest_list_template.xlsx"'
-    df.to_excel(response, index=False)
-    return response
+    # Same headers the importer recognises, in the current language
+    header = [str(label) for label in importers.TEMPLATE_COLUMNS.values()]
+    return exports.xlsx_file_response(header, [], 'guest_list_template', str(_("Guests")))
 
 
 @login_required
 def guest_import_view(request, event_id):
     event = get_object_or_404(Event, id=event_id, owner=request.user)
     if request.method == 'POST' and request.FILES.get('guest_file'):
-        try:
-            df = pd.read_excel(request.FILES['guest_file'])
-            if 'Name' not in df.columns: raise ValueError(_("Missing 'Name' column"))
-
-            current_count = event.guests.count()
-            limit = request.user.userprofile.plan.max_guests
-            to_add = df['Name'].dropna().count()
-
-            if current_count + to_add > limit:
-                messages.error(request, _("Import exceeds guest limit."))
-                return redirect('invapp:guest_list', event_id=event.id)
-
-            objs = []
-            for _, row in df.iterrows():
-                if pd.isna(row['Name']): continue
-                
-                # Logic for invitation method mapping
-                raw_method = str(row.get('Invitation Method', '')).lower()
-                method = 'physical'
-                if 'digit' in raw_method:
-                    method = 'digital'
-
-                objs.append(Guest(
-                    event=event, 
-                    owner=request.user, 
-                    name=str(row['Name']).strip(),
-                    email=row.get('Email') if pd.notna(row.get('Email')) else None,
-                    max_attendees=int(row.get('Max Attendees', 1)),
-                    invitation_method=method,
-                    preferred_language='ro' # Default to Romanian
-                ))
-            Guest.objects.bulk_create(objs)
-            messages.success(request, _("Imported %(count)d guests.") % {'count': len(objs)})
-        except Exception as e:
-            messages.error(request, _("Import error: %(error)s") % {'error': str(e)})
+        job = jobs.enqueue('import_guests', {
+            'event_id': event.id,
+            'language': translation.get_language(),
+        }, owner=request.user, input_file=request.FILES['guest_file'])
+        messages.info(request, _("Your file is being imported. The guest list will update when it finishes."))
+        return redirect(f"{reverse('invapp:guest_list', kwargs={'event_id': event.id})}?import_job={job.public_id}")
     return redirect('invapp:guest_list', event_id=event.id)
 
 
+# --- Background Jobs ---
+def _get_visible_job(request, job_id, with_result_file=False):
+    # The progress page polls every 1.5s, so the file blobs are only read for a download
+    deferred = ('input_file',) if with_result_file else ('input_file', 'result_file')
+    job = get_object_or_404(Job.objects.defer(*deferred), public_id=job_id)
+    if not request.user.is_staff and job.owner_id != request.user.id:
+        raise Http404
+    return job
+
+
+@login_required
+def job_status_view(request, job_id):
+    """JSON progress of a background job, polled by the import and admin pages."""
+    job = _get_visible_job(request, job_id)
+    data = {
+        'id': str(job.public_id),
+        'name': job.name,
+        'status': job.status,
+        'finished': job.is_finished,
+        'attempts': job.attempts,
+        'progress': {
+            'current': job.progress_current,
+            'total': job.progress_total,
+            'percent': job.progress_percent,
+            'message': job.progress_message,
+        },
+        'result': job.result,
+        'download_url': reverse('invapp:job_download', kwargs={'job_id': job.public_id}) if job.result_filename else None,
+    }
+    if job.status == Job.Status.FAILED and not (job.result or {}).get('error'):
+        data['result'] = {'error': str(_("Something went wrong. Please try again."))}
+    return JsonResponse(data)
+
+
+@login_required
+def job_download_view(request, job_id):
+    job = _get_visible_job(request, job_id, with_result_file=True)
+    if job.status != Job.Status.SUCCEEDED or (job.result_file is None and not job.result_storage_name):
+        raise Http404
+    if job.result_storage_name:
+        try:
+            handle = transfers.get_storage().open(job.result_storage_name)
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(handle, as_attachment=True, filename=job.result_filename,
+                            content_type=job.result_content_type or 'application/octet-stream')
+    response = HttpResponse(bytes(job.result_file), content_type=job.result_content_type or 'application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="{job.result_filename}"'
+    return response
+
+
 class terms_of_service_view(TemplateView): template_name = "invapp/terms_and_conditions.html"
 
 
@@ -1671,8 +1542,8 @@ def event_preview_demo(request, event_id):
     return render(request, event.selected_design.template_name, context)
 
 def upgrade_plan(request):
-    """Page where users can view plans and upgrade."""
-    return render(request, 'invapp/upgrade_page.html')
+    """Plans are compared on the landing page; the upgrade page itself needs a plan."""
+    return redirect(reverse('invapp:landing_page') + '#pricing')
 
 
 class EventLivePreviewView(LoginRequiredMixin, View):
@@ -1686,143 +1557,23 @@ class EventLivePreviewView(LoginRequiredMixin, View):
 
     def post(self, request, *args, **kwargs):
         # 1. Get Design (Required for rendering)
-        design_id = request.POST.get('selected_design')
-        design = None
-        if design_id:
-            try:
-                design = CardDesign.objects.get(pk=design_id)
-            except: pass
-        
+        design = previews.get_design(request.POST.get('selected_design'))
         if not design:
             return HttpResponse(_("Please select a template to see the preview."))
 
-        # 2. Find existing event if any
-        event_id = request.POST.get('event_id')
+        # 2. Existing event: supplies the stored photos when none are uploaded
         existing_event = None
-        if event_id:
-            try:
-                existing_event = Event.objects.get(pk=event_id, owner=request.user)
-            except: pass
-
-        # 3. Build a Mock Event object (SimpleNamespace)
-        event_data = {}
-        for key in request.POST:
-            if not key.startswith('godparents-') and not key.startswith('schedule_items-'):
-                event_data[key] = request.POST.get(key)
-
-        # Parse critical fields for template filters
-        if event_data.get('event_date'):
-            try:
-                event_data['event_date'] = datetime.strptime(event_data['event_date'], "%d/%m/%Y")
-            except:
-                try:
-                    event_data['event_date'] = datetime.strptime(event_data['event_date'], "%Y-%m-%d")
-                except:
-                    event_data['event_date'] = None
-
-        for time_field in ['party_time', 'ceremony_time']:
-            if event_data.get(time_field):
-                try:
-                    event_data[time_field] = datetime.strptime(event_data[time_field], "%H:%M").time()
-                except:
-                    event_data[time_field] = None
-
-        mock_event = SimpleNamespace(**event_data)
-        mock_event.selected_design = design
-        mock_event.owner = request.user
-
-        # 4. Mock Related Managers for godparents/schedule
-        class MockRelatedManager:
-            def __init__(self, objects): self.objects = objects
-            def all(self): return self.objects
-            def count(self): return len(self.objects)
-            def exists(self): return len(self.objects) > 0
-
-        # Godparents
-        godparents = []
-        try:
-            total_gp = int(request.POST.get('godparents-TOTAL_FORMS', 0))
-            for i in range(total_gp):
-                name = request.POST.get(f'godparents-{i}-name')
-                delete = request.POST.get(f'godparents-{i}-DELETE') == 'on'
-                if name and not delete:
-                    godparents.append(SimpleNamespace(name=name))
-        except: pass
-        mock_event.godparents = MockRelatedManager(godparents)
-
-        # Schedule
-        schedule = []
-        try:
-            total_sch = int(request.POST.get('schedule_items-TOTAL_FORMS', 0))
-            for i in range(total_sch):
-                activity = request.POST.get(f'schedule_items-{i}-activity_type')
-                time_val = request.POST.get(f'schedule_items-{i}-time')
-                delete = request.POST.get(f'schedule_items-{i}-DELETE') == 'on'
-                if activity and not delete:
-                    try:
-                        parsed_time = datetime.strptime(time_val, "%H:%M").time() if time_val else None
-                    except: parsed_time = None
-                    schedule.append(SimpleNamespace(activity_type=activity, time=parsed_time))
-        except: pass
-        mock_event.schedule_items = MockRelatedManager(schedule)
-
-        # 5. Handle Photos (Live + Fallback)
-        mock_event.preview_couple_photo_b64 = None
-        if 'couple_photo' in request.FILES:
-            f = request.FILES['couple_photo']
-            try:
-                img_data = base64.b64encode(f.read()).decode('utf-8')
-                mock_event.preview_couple_photo_b64 = f"data:{f.content_type};base64,{img_data}"
-            except: pass
-
-        mock_event.preview_main_image_b64 = None
-        if 'main_invitation_image' in request.FILES:
-            f = request.FILES['main_invitation_image']
-            try:
-                img_data = base64.b64encode(f.read()).decode('utf-8')
-                mock_event.preview_main_image_b64 = f"data:{f.content_type};base64,{img_data}"
-            except: pass
-        
-        # Smart Helper Logic for mock (Template compatibility)
-        if mock_event.preview_couple_photo_b64:
-            mock_event.couple_photo = SimpleNamespace(url=mock_event.preview_couple_photo_b64)
-            mock_event.get_couple_photo_url = mock_event.preview_couple_photo_b64
-        elif existing_event and existing_event.couple_photo:
-            mock_event.couple_photo = existing_event.couple_photo
-            mock_event.get_couple_photo_url = existing_event.couple_photo.url
-        else:
-            mock_event.couple_photo = None
-            mock_event.get_couple_photo_url = None
+        event_id = request.POST.get('event_id')
+        if event_id and event_id.isdigit():
+            existing_event = Event.objects.filter(pk=event_id, owner=request.user).only(
+                'id', 'couple_photo', 'landscape_photo', 'main_invitation_image', 'audio_greeting').first()
 
-        if mock_event.preview_main_image_b64:
-            mock_event.main_invitation_image = SimpleNamespace(url=mock_event.preview_main_image_b64)
-        elif existing_event and existing_event.main_invitation_image:
-            mock_event.main_invitation_image = existing_event.main_invitation_image
-        else:
-            mock_event.main_invitation_image = None
-
-        # 6. DUMMY DATA (As in Dashboard Preview)
-        # Prevents "NoneType" errors in templates that expect a guest/form
-        dummy_guest = SimpleNamespace(
-            unique_id='00000000-0000-0000-0000-000000000000',
-            name=_('Sample Guest Name'),
-            honorific='family',
-            max_attendees=2,
-            manual_is_attending=None,
-            rsvp_details=SimpleNamespace(attending=None),
-            event=mock_event
-        )
-        dummy_form = RSVPForm(guest=dummy_guest)
-
-        context = {
-            'event': mock_event,
-            'guest': dummy_guest,
-            'form': dummy_form,
-            'is_preview': True,
-            'google_calendar_link': None
-        }
+        # 3. Files still sent along (no upload token yet) are stored once and referenced
+        data = previews.store_images(request.POST.dict(), request.FILES,
+                                     allow_write=lambda: preview_upload_throttle.allow(request.user.pk))
 
         try:
-            return render(request, design.template_name, context)
+            return HttpResponse(previews.render_preview(data, design, fallback_event=existing_event,
+                                                        show_watermark=previews.show_watermark_for(request.user)))
         except Exception as e:
             return HttpResponse(f"Preview Error: {str(e)}")
@@ -0,0 +1,330 @@
+"""
+Voucher checks and redemption.
+
+redeem_voucher() claims a use with a single conditional UPDATE, so two
+people redeeming the last use of a code at the same moment cannot both
+succeed; the reason for a refusal is only looked up when the UPDATE misses.
+
+check_voucher() answers from a cached copy of the voucher and its plans (and
+remembers unknown codes briefly), so the public verify endpoint does not
+reach the database for every guess. Redemption always reads the database.
+"""
+import csv
+import enum
+import hashlib
+import secrets
+import urllib.parse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+from django.db.models.functions import Upper
+from django.db.models.lookups import Exact
+from django.utils import timezone
+from django.utils.text import slugify
+from django.utils.translation import gettext_lazy as _
+
+from .models import UserProfile, Voucher
+
+
+class VoucherStatus(enum.Enum):
+    VALID = 'valid'
+    MISSING_CODE = 'missing_code'
+    INVALID = 'invalid'
+    INACTIVE = 'inactive'
+    USED = 'used'
+    EXPIRED = 'expired'
+    NOT_YET_ACTIVE = 'not_yet_active'
+    EXHAUSTED = 'exhausted'
+    WRONG_PLAN = 'wrong_plan'
+    NOT_FREE = 'not_free'
+
+
+MESSAGES = {
+    VoucherStatus.VALID: _('Voucher applied successfully!'),
+    VoucherStatus.MISSING_CODE: _('Please enter a voucher code.'),
+    VoucherStatus.INVALID: _('Invalid voucher code.'),
+    VoucherStatus.INACTIVE: _('This voucher is no longer active.'),
+    VoucherStatus.USED: _('This voucher has already been used.'),
+    VoucherStatus.EXPIRED: _('This voucher has expired.'),
+    VoucherStatus.NOT_YET_ACTIVE: _('This voucher is not yet active.'),
+    VoucherStatus.EXHAUSTED: _('This voucher has reached its maximum uses.'),
+    VoucherStatus.WRONG_PLAN: _('This voucher is not valid for the selected plan.'),
+    VoucherStatus.NOT_FREE: _('This voucher is not for a free upgrade.'),
+}
+
+
+class VoucherResult:
+    def __init__(self, status, voucher=None):
+        self.status = status
+        self.voucher = voucher
+
+    @property
+    def ok(self):
+        return self.status is VoucherStatus.VALID
+
+    @property
+    def message(self):
+        return MESSAGES[self.status]
+
+    def __repr__(self):
+        return f"<VoucherResult {self.status.value}>"
+
+
+CACHE_KEY_PREFIX = 'voucher:v1'
+MISSING = 'missing'
+
+
+def _normalize(code):
+    return (code or '').strip()
+
+
+def by_code(code):
+    """Vouchers matching `code` regardless of case, using the Upper(code) index."""
+    return Voucher.objects.filter(Exact(Upper('code'), code.upper()))
+
+
+def _cache_key(code):
+    return f"{CACHE_KEY_PREFIX}:{hashlib.sha1(code.upper().encode('utf-8')).hexdigest()}"
+
+
+def get_voucher_state(code):
+    """(voucher, ids of the plans it is limited to) for `code`, or None if no such voucher."""
+    key = _cache_key(code)
+    state = cache.get(key)
+    if state is None:
+        voucher = by_code(code).first()
+        if voucher is None:
+            cache.set(key, MISSING, settings.VOUCHER_NEGATIVE_CACHE_TIMEOUT)
+            return None
+        state = (voucher, frozenset(voucher.applicable_plans.values_list('id', flat=True)))
+        cache.set(key, state, settings.VOUCHER_CACHE_TIMEOUT)
+    return None if state == MISSING else state
+
+
+def invalidate(code):
+    cache.delete(_cache_key(code))
+
+
+def invalidate_many(codes):
+    cache.delete_many([_cache_key(code) for code in codes])
+
+
+def _plan_allowed(plan):
+    """Q matching vouchers usable for `plan`: no plan restriction, or `plan` among theirs."""
+    through = Voucher.applicable_plans.through.objects.filter(voucher_id=OuterRef('pk'))
+    return ~Exists(through) | Exists(through.filter(plan_id=plan.pk))
+
+
+def _redeemable(now):
+    return Q(active=True, is_used=False, current_uses__lt=F('max_uses')) \
+        & (Q(valid_from__isnull=True) | Q(valid_from__lte=now)) \
+        & (Q(valid_until__isnull=True) | Q(valid_until__gt=now))
+
+
+def _diagnose(voucher, plan_ids=frozenset(), plan=None, require_free=False, now=None):
+    """Why `voucher`, limited to `plan_ids` (empty = any plan), cannot be used right now (or VALID)."""
+    now = now or timezone.now()
+    if voucher is None:
+        return VoucherStatus.INVALID
+    if not voucher.active:
+        return VoucherStatus.INACTIVE
+    if voucher.is_used:
+        return VoucherStatus.USED
+    if voucher.valid_until and voucher.valid_until < now:
+        return VoucherStatus.EXPIRED
+    if voucher.valid_from and voucher.valid_from > now:
+        return VoucherStatus.NOT_YET_ACTIVE
+    if voucher.current_uses >= voucher.max_uses:
+        return VoucherStatus.EXHAUSTED
+    if require_free and voucher.discount_percentage != 100:
+        return VoucherStatus.NOT_FREE
+    if plan is not None and plan_ids and plan.pk not in plan_ids:
+        return VoucherStatus.WRONG_PLAN
+    return VoucherStatus.VALID
+
+
+def check_voucher(code, plan=None, require_free=False):
+    """Read-only: can `code` be redeemed (for `plan`) right now?"""
+    code = _normalize(code)
+    if not code:
+        return VoucherResult(VoucherStatus.MISSING_CODE)
+    state = get_voucher_state(code)
+    if state is None:
+        return VoucherResult(VoucherStatus.INVALID)
+    voucher, plan_ids = state
+    return VoucherResult(_diagnose(voucher, plan_ids, plan, require_free), voucher)
+
+
+def redeem_voucher(code, user, plan, require_free=False):
+    """
+    Uses one redemption of `code` for `user` and moves their profile to `plan`,
+    in one transaction. The use is claimed by a single conditional UPDATE; the
+    voucher becomes `is_used` when its last use is taken.
+    """
+    code = _normalize(code)
+    if not code:
+        return VoucherResult(VoucherStatus.MISSING_CODE)
+
+    now = timezone.now()
+    candidates = by_code(code).filter(_redeemable(now), _plan_allowed(plan))
+    if require_free:
+        candidates = candidates.filter(discount_percentage=100)
+
+    with transaction.atomic():
+        claimed = candidates.update(
+            current_uses=F('current_uses') + 1,
+            is_used=Case(When(current_uses__gte=F('max_uses') - 1, then=Value(True)), default=Value(False)),
+            used_by=user.email,
+            used_at=now,
+        )
+        voucher = by_code(code).first()
+        if not claimed:
+            plan_ids = frozenset(voucher.applicable_plans.values_list('id', flat=True)) if voucher else frozenset()
+            status = _diagnose(voucher, plan_ids, plan, require_free, now)
+            # Valid when we looked, but another redemption took the last use first
+            return VoucherResult(VoucherStatus.USED if status is VoucherStatus.VALID else status, voucher)
+        UserProfile.objects.update_or_create(user=user, defaults={'plan': plan})
+    # update() sends no post_save, so drop the cached state here
+    invalidate(code)
+    return VoucherResult(VoucherStatus.VALID, voucher)
+
+
+# --- Generation ---
+class CodeSpaceExhausted(ValueError):
+    pass
+
+
+def _random_codes(count, length, alphabet, prefix):
+    """`count` codes of `length` characters drawn uniformly from `alphabet` with the OS CSPRNG."""
+    size = len(alphabet)
+    limit = 256 - 256 % size  # bytes at or above this would bias the draw
+    needed = count * length
+    chars = []
+    while len(chars) < needed:
+        # ~1/4 spare bytes covers the rejected ones in one call for any alphabet
+        chars.extend(alphabet[byte % size] for byte in secrets.token_bytes((needed - len(chars)) * 5 // 4 + 16)
+                     if byte < limit)
+    del chars[needed:]
+    return [prefix + ''.join(chars[i:i + length]) for i in range(0, needed, length)]
+
+
+def generate_codes(count, length=None, alphabet=None, prefix=None, batch_size=None):
+    """
+    Yields lists of new codes, `count` in total, none of which exist yet (case-insensitively)
+    or repeat. Each batch costs one query against the Upper(code) index.
+    """
+    length = length or settings.VOUCHER_CODE_LENGTH
+    alphabet = ''.join(dict.fromkeys((alphabet or settings.VOUCHER_CODE_ALPHABET).upper()))
+    prefix = settings.VOUCHER_CODE_PREFIX if prefix is None else prefix
+    batch_size = batch_size or settings.VOUCHER_BATCH_SIZE
+    if len(alphabet) < 2:
+        raise ValueError("The voucher code alphabet needs at least two distinct characters.")
+    # Past half the space, collisions make every batch retry; ask for longer codes instead
+    if count > len(alphabet) ** length // 2:
+        raise CodeSpaceExhausted(
+            f"{count} codes do not fit comfortably in {len(alphabet)}^{length}; use longer codes.")
+
+    seen = set()
+    remaining = count
+    while remaining:
+        wanted = min(batch_size, remaining)
+        batch = []
+        for _attempt in range(10):
+            candidates = [code for code in dict.fromkeys(_random_codes(wanted - len(batch), length, alphabet, prefix))
+                          if code not in seen]
+            existing = set(Voucher.objects.annotate(code_upper=Upper('code'))
+                           .filter(code_upper__in=[code.upper() for code in candidates])
+                           .values_list('code_upper', flat=True))
+            fresh = [code for code in candidates if code.upper() not in existing]
+            seen.update(fresh)
+            batch.extend(fresh)
+            if len(batch) == wanted:
+                break
+        else:
+            raise CodeSpaceExhausted("Could not find unused voucher codes; use longer codes.")
+        remaining -= wanted
+        yield batch
+
+
+def create_vouchers(count, plan_ids=(), length=None, alphabet=None, prefix=None, batch_size=None, **fields):
+    """
+    Creates `count` vouchers with `fields` (campaign_name, discount_percentage, ...) and
+    yields them batch by batch, so callers can write them out without holding all of
+    them. Vouchers and their plan rows are inserted with bulk_create, batch by batch.
+    """
+    Through = Voucher.applicable_plans.through
+    plan_ids = list(plan_ids)
+    for codes in generate_codes(count, length, alphabet, prefix, batch_size):
+        with transaction.atomic():
+            created = Voucher.objects.bulk_create([Voucher(code=code, **fields) for code in codes])
+            if created and created[0].pk is None:
+                # Backends without RETURNING: read the ids back
+                ids = dict(Voucher.objects.filter(code__in=codes).values_list('code', 'pk'))
+                for voucher in created:
+                    voucher.pk = ids[voucher.code]
+            if plan_ids:
+                Through.objects.bulk_create([Through(voucher_id=voucher.pk, plan_id=plan_id)
+                                             for voucher in created for plan_id in plan_ids])
+        # bulk_create sends no post_save: drop any "unknown code" cached for these
+        invalidate_many(codes)
+        yield created
+
+
+def write_csv(output, voucher_batches, campaign, plan_names):
+    """
+    Writes the vouchers from `voucher_batches` (e.g. create_vouchers()) to the text
+    stream `output` as they arrive, with activation and WhatsApp links for each.
+    Returns the number of vouchers written.
+    """
+    # BOM (Byte Order Mark) so Excel recognizes UTF-8
+    output.write('\ufeff')
+    safe_campaign = slugify(campaign) if campaign else "direct_sale"
+    base_domain = "https://invapp-romania.ro/ro/accounts/signup/"
+    open_link_text = str(_("Open Link"))
+    send_wa_text = str(_("SEND VIA WHATSAPP ➔"))
+
+    writer = csv.writer(output)
+    writer.writerow([
+        _('Code'), _('Campaign'), _('Discount %'),
+        _('Valid From'), _('Valid Until'), _('Plans'),
+        _('Activation Link (Client)'), _('Send via WhatsApp')
+    ])
+    # Everything but the code is the same for most rows, so the WhatsApp text around the link
+    # is quoted once per message rather than once per voucher (quote() works per character).
+    url_suffix = f"&utm_source=whatsapp&utm_medium=direct_message&utm_campaign={safe_campaign}"
+    quoted_url_parts = (urllib.parse.quote(f"{base_domain}?v="), urllib.parse.quote(url_suffix))
+    default_message = str(_("Hi! 🥂 We're happy we reached an agreement for your event decor! As promised, here is your link to activate the InvApp platform (Free). Click here to create your account: %(url)s") % {'url': '\0'})
+    before, after = default_message.split('\0', 1)
+    message_parts = {'': (urllib.parse.quote(before), urllib.parse.quote(after))}
+    dates = {}
+
+    def format_date(value):
+        if value not in dates:
+            dates[value] = value.strftime('%Y-%m-%d %H:%M') if value else ''
+        return dates[value]
+
+    written = 0
+    for batch in voucher_batches:
+        rows = []
+        for v in batch:
+            activation_url = f"{base_domain}?v={v.code}{url_suffix}"
+            activation_formula = f'=HYPERLINK("{activation_url}", "{open_link_text}")'
+
+            # Use custom message if provided, otherwise fallback to default
+            if v.custom_message not in message_parts:
+                message_parts[v.custom_message] = (urllib.parse.quote(f"{v.custom_message}\n\n"), '')
+            before, after = message_parts[v.custom_message]
+            wa_link = (f"https://wa.me/?text={before}{quoted_url_parts[0]}{urllib.parse.quote(v.code)}"
+                       f"{quoted_url_parts[1]}{after}")
+            wa_formula = f'=HYPERLINK("{wa_link}", "{send_wa_text}")'
+
+            rows.append([
+                v.code, v.campaign_name, v.discount_percentage,
+                format_date(v.valid_from), format_date(v.valid_until),
+                plan_names, activation_formula, wa_formula
+            ])
+        writer.writerows(rows)
+        written += len(rows)
+    return written
@@ -1,4 +1,19 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import ExitStack
+from contextvars import ContextVar
+
 from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
 
 
 class ForceDefaultLanguageMiddleware:
@@ -25,4 +40,262 @@ class ForceDefaultLanguageMiddleware:
                 del request.META['HTTP_ACCEPT_LANGUAGE']
 
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+
+# --- Performance instrumentation ---
+perf_logger = logging.getLogger('wedding_project.perf')
+
+# Metrics of the request being handled by this thread/task; None outside PerformanceMiddleware
+_current_metrics = ContextVar('request_metrics', default=None)
+_MISSING = object()
+_installed = set()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 1),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            'template_ms': round(self.template_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'total;dur={self.total * 1000:.1f}',
+        ])
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.db_queries += 1
+
+
+def _install_template_timing():
+    from django.template.backends.django import Template
+
+    if Template in _installed:
+        return
+    _installed.add(Template)
+    original_render = Template.render
+
+    def render(self, context=None, request=None):
+        metrics = _current_metrics.get()
+        # Nested render_to_string() calls are already inside the outer render's time
+        if metrics is None or metrics.template_depth:
+            return original_render(self, context, request)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+            metrics.template_depth -= 1
+
+    Template.render = render
+
+
+def _install_cache_counting(backend_class):
+    from django.core.cache.backends.base import BaseCache
+
+    if backend_class in _installed:
+        return
+    _installed.add(backend_class)
+    original_get = backend_class.get
+
+    def get(self, key, default=None, version=None):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return original_get(self, key, default, version)
+        value = original_get(self, key, _MISSING, version)
+        if value is _MISSING:
+            metrics.cache_misses += 1
+            return default
+        metrics.cache_hits += 1
+        return value
+
+    backend_class.get = get
+
+    # The base get_many() loops over get(), which is already counted
+    if backend_class.get_many is BaseCache.get_many:
+        return
+    original_get_many = backend_class.get_many
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = original_get_many(self, keys, version)
+        metrics = _current_metrics.get()
+        if metrics is not None:
+            metrics.cache_hits += len(found)
+            metrics.cache_misses += len(keys) - len(found)
+        return found
+
+    backend_class.get_many = get_many
+
+
+class PerformanceMiddleware:
+    """
+    Measures each request: SQL query count and time, template render time, cache
+    hits/misses and total latency. Logs them as one structured line on the
+    'wedding_project.perf' logger, warns when the URL name's PERF_BUDGETS entry
+    (or PERF_DEFAULT_BUDGET) is exceeded, and with PERF_SERVER_TIMING adds a
+    Server-Timing header for the browser's network panel. Streamed bodies are
+    produced after the response leaves, so their time is not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _install_template_timing()
+        for alias in settings.CACHES:
+            _install_cache_counting(type(caches[alias]))
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        metrics.finish()
+
+        if getattr(settings, 'PERF_SERVER_TIMING', False):
+            response['Server-Timing'] = metrics.server_timing()
+        self.report(request, response, metrics)
+        return response
+
+    def report(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else '-'
+        fields = {'method': request.method, 'path': request.path, 'route': route,
+                  'status': response.status_code, **metrics.as_dict()}
+        perf_logger.info("request %s", " ".join(f"{key}={value}" for key, value in fields.items()),
+                         extra={'perf': fields})
+
+        budget = getattr(settings, 'PERF_BUDGETS', {}).get(route, getattr(settings, 'PERF_DEFAULT_BUDGET', {}))
+        exceeded = [f"{key}={fields[key]} (budget {limit})" for key, limit in budget.items()
+                    if key in fields and fields[key] > limit]
+        if exceeded:
+            perf_logger.warning("Performance budget exceeded for %s %s: %s", route, request.path,
+                                ", ".join(exceeded), extra={'perf': fields})
+
+
+# --- On-demand profiling ---
+PROFILE_PARAM = '_profile'
+PROFILERS = ('cprofile', 'memory')
+
+
+class ProfilingMiddleware:
+    """
+    Lets staff profile one request of an invapp page in production: with
+    ?_profile=cprofile the view runs under cProfile and the response is the
+    stats sorted by cumulative time; with ?_profile=memory it runs under
+    tracemalloc and the response lists the top allocations by line. With
+    PROFILING_DIR set, the raw .prof file is also saved there for snakeviz or
+    pstats. Only installed when PROFILING_ENABLED is set, so it adds nothing
+    to requests otherwise. Must come after AuthenticationMiddleware and
+    CsrfViewMiddleware: the view is run from process_view.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profiler = request.GET.get(PROFILE_PARAM)
+        if profiler not in PROFILERS or 'invapp' not in request.resolver_match.namespaces:
+            return None
+        if not request.user.is_staff:
+            return None
+
+        def run_view():
+            response = view_func(request, *view_args, **view_kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+
+        if profiler == 'cprofile':
+            return self.profile_cpu(request, run_view)
+        return self.profile_memory(request, run_view)
+
+    def profile_cpu(self, request, run_view):
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        response = profile.runcall(run_view)
+        elapsed = time.perf_counter() - started
+
+        output = io.StringIO()
+        header = [f"{request.method} {request.get_full_path()} -> {response.status_code} "
+                  f"in {elapsed * 1000:.1f} ms"]
+        saved = self.save(request, profile)
+        if saved:
+            header.append(f"Saved {saved}")
+        output.write('\n'.join(header) + '\n\n')
+        stats = pstats.Stats(profile, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(getattr(settings, 'PROFILING_LIMIT', 50))
+        return HttpResponse(output.getvalue(), content_type='text/plain; charset=utf-8')
+
+    def profile_memory(self, request, run_view):
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(getattr(settings, 'PROFILING_TRACEMALLOC_FRAMES', 1))
+        try:
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            response = run_view()
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+        lines = [f"{request.method} {request.get_full_path()} -> {response.status_code}",
+                 f"Traced memory: {current / 1024:.1f} KiB now, {peak / 1024:.1f} KiB peak", '']
+        lines += [str(stat) for stat in stats[:getattr(settings, 'PROFILING_LIMIT', 50)]]
+        return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; charset=utf-8')
+
+    def save(self, request, profile):
+        directory = getattr(settings, 'PROFILING_DIR', None)
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        route = request.resolver_match.view_name.replace(':', '-')
+        path = os.path.join(directory, f"{route}-{timezone.now():%Y%m%dT%H%M%S%f}.prof")
+        profile.dump_stats(path)
+        return path
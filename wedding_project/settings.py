@@ -2,7 +2,7 @@
 Django settings for wedding_project project.
 CORE REFACTOR V6:
 - Languages: Restricted to RO and EN.
-- Static Files: Standard Storage + Whitenoise Middleware (Safe Mode).
+- Static Files: Whitenoise Middleware; hashed manifest storage in production (falls back to plain names).
 - Social Auth: Fail-safe for missing environment variables.
 """
 import os
@@ -52,6 +52,12 @@ SESSION_COOKIE_HTTPONLY = True    # Prevents JS access to session cookie
 USE_X_FORWARDED_HOST = True
 USE_X_FORWARDED_PORT = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+# Client address for per-IP throttles (invapp/throttling.py). Requests pass Cloudflare and then
+# the platform's proxy, each appending to X-Forwarded-For, so the client is the entry
+# TRUSTED_PROXY_COUNT from the right. CLIENT_IP_HEADER=HTTP_CF_CONNECTING_IP takes Cloudflare's
+# header instead; only set it when the app cannot be reached without going through Cloudflare.
+CLIENT_IP_HEADER = os.environ.get('CLIENT_IP_HEADER') or None
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 2))
 
 if not DEBUG:
     # Cookie security for production
@@ -91,6 +97,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     # WHITENOISE MUST BE HERE (Position 2)
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Before everything it measures, after WhiteNoise so static files are not logged
+    'wedding_project.middleware.PerformanceMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'wedding_project.middleware.ForceDefaultLanguageMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -100,6 +108,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    # Staff-only ?_profile=cprofile|memory; removes itself unless PROFILING_ENABLED
+    'wedding_project.middleware.ProfilingMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -145,6 +155,96 @@ DATABASES = {
     )
 }
 
+# ==========================================================
+# === CACHING                                            ===
+# ==========================================================
+# Local memory by default; point REDIS_URL at a shared instance so all
+# gunicorn workers reuse the same rendered invitations.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'invapp-default',
+        }
+    }
+
+# Seconds a rendered guest invitation shell is kept (0 disables the cache).
+INVITE_CACHE_TIMEOUT = int(os.environ.get('INVITE_CACHE_TIMEOUT', 60 * 60))
+
+# Site images and plans used by the context processors: shared cache lifetime, and how
+# long each process trusts its own copy before re-reading the shared one.
+SITE_CONTEXT_CACHE_TIMEOUT = int(os.environ.get('SITE_CONTEXT_CACHE_TIMEOUT', 60 * 60))
+SITE_CONTEXT_LOCAL_TIMEOUT = int(os.environ.get('SITE_CONTEXT_LOCAL_TIMEOUT', 30))
+
+# Rendered live previews of the event form kept per process (least recently used are dropped).
+PREVIEW_CACHE_SIZE = int(os.environ.get('PREVIEW_CACHE_SIZE', 256))
+
+# Images uploaded for the live preview: downsized to this many pixels on the long side and
+# removed by `manage.py sweep_preview_uploads` after PREVIEW_UPLOAD_MAX_AGE seconds.
+# PREVIEW_UPLOAD_STORAGE may name a STORAGES entry; unset, they are kept under MEDIA_ROOT.
+PREVIEW_UPLOAD_STORAGE = os.environ.get('PREVIEW_UPLOAD_STORAGE') or None
+PREVIEW_UPLOAD_MAX_DIMENSION = 1600
+PREVIEW_UPLOAD_MAX_BYTES = 15 * 1024 * 1024
+PREVIEW_UPLOAD_MAX_AGE = int(os.environ.get('PREVIEW_UPLOAD_MAX_AGE', 24 * 60 * 60))
+# Stored preview images per user: bursts of PREVIEW_UPLOAD_THROTTLE_BURST, refilled at
+# PREVIEW_UPLOAD_THROTTLE_RATE per second. Only signed-in hosts can store images.
+PREVIEW_UPLOAD_THROTTLE_BURST = int(os.environ.get('PREVIEW_UPLOAD_THROTTLE_BURST', 20))
+PREVIEW_UPLOAD_THROTTLE_RATE = float(os.environ.get('PREVIEW_UPLOAD_THROTTLE_RATE', 0.1))
+
+# Responsive image variants (see invapp/images.py): target widths, and the thread pool
+# that generates them off the request path (0 workers = generate inline).
+RESPONSIVE_IMAGE_WIDTHS = (480, 960, 1600)
+RESPONSIVE_IMAGE_WORKERS = int(os.environ.get('RESPONSIVE_IMAGE_WORKERS', 2))
+RESPONSIVE_IMAGE_QUEUE_LIMIT = 100
+RESPONSIVE_IMAGE_BACKENDS = [
+    'invapp.images.CloudinaryBackend',
+    'invapp.images.FilesystemBackend',
+]
+
+# Voucher checks (see invapp/vouchers.py): how long a code's state is cached, how long an
+# unknown code is remembered as unknown, and the per-IP limit on the public verify endpoint
+# (bursts of VOUCHER_THROTTLE_BURST, refilled at VOUCHER_THROTTLE_RATE requests per second).
+VOUCHER_CACHE_TIMEOUT = 5 * 60
+VOUCHER_NEGATIVE_CACHE_TIMEOUT = 60
+VOUCHER_THROTTLE_BURST = int(os.environ.get('VOUCHER_THROTTLE_BURST', 10))
+VOUCHER_THROTTLE_RATE = float(os.environ.get('VOUCHER_THROTTLE_RATE', 0.2))
+
+# Generated voucher codes: PREFIX + LENGTH characters from ALPHABET (no 0/O, 1/I/L lookalikes),
+# created VOUCHER_BATCH_SIZE at a time.
+VOUCHER_CODE_PREFIX = 'TARG-'
+VOUCHER_CODE_LENGTH = 8
+VOUCHER_CODE_ALPHABET = '23456789ABCDEFGHJKMNPQRSTUVWXYZ'
+VOUCHER_BATCH_SIZE = 2000
+
+# ==========================================================
+# === BACKGROUND JOBS                                    ===
+# ==========================================================
+# Queued in the database and executed by `python manage.py runworker`.
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BASE_DELAY = int(os.environ.get('JOB_RETRY_BASE_DELAY', 10))  # seconds, doubled on each retry
+JOB_RETRY_MAX_DELAY = 60 * 60
+JOB_HEARTBEAT_INTERVAL = 60  # seconds between a running job's heartbeats (updated_at)
+JOB_LOCK_TIMEOUT = 5 * 60  # a 'running' job without a heartbeat for this long is assumed orphaned
+
+# Admin import/export jobs (see invapp/transfers.py). Uploaded and exported files go to the
+# ADMIN_TRANSFER_STORAGE entry of STORAGES, which the web and worker processes must both
+# reach (Cloudinary's "raw" storage when configured). Only with DEBUG may it be unset, and
+# the files then stay on this machine under ADMIN_TRANSFER_ROOT.
+# Imports commit ADMIN_IMPORT_BATCH_SIZE rows per transaction.
+ADMIN_TRANSFER_STORAGE = os.environ.get('ADMIN_TRANSFER_STORAGE') or None
+ADMIN_TRANSFER_ROOT = BASE_DIR / 'transfers'
+ADMIN_EXPORT_CHUNK_SIZE = 1000
+ADMIN_IMPORT_BATCH_SIZE = 500
+
 # ==========================================================
 # === STATIC & MEDIA FILES (SAFE MODE)                   ===
 # ==========================================================
@@ -191,9 +291,21 @@ if not DEBUG:
     # Tell Whitenoise to check source if file not found in staticfiles/
     WHITENOISE_USE_FINDERS = True
 
+    # Hashed, recompressed and precompressed static files (see invapp/static_storage.py);
+    # built by `collectstatic` or `manage.py optimize_static`.
+    STORAGES["staticfiles"]["BACKEND"] = "invapp.static_storage.OptimizedStaticFilesStorage"
+
     # Media Files via Cloudinary in production
     if os.environ.get('CLOUDINARY_API_KEY'):
         STORAGES["default"]["BACKEND"] = "cloudinary_storage.storage.MediaCloudinaryStorage"
+        # Non-image files (CSV/XLSX), shared by the web and worker processes
+        STORAGES["raw"] = {"BACKEND": "cloudinary_storage.storage.RawMediaCloudinaryStorage"}
+        ADMIN_TRANSFER_STORAGE = ADMIN_TRANSFER_STORAGE or "raw"
+
+    if not ADMIN_TRANSFER_STORAGE:
+        from django.core.exceptions import ImproperlyConfigured
+        raise ImproperlyConfigured(
+            "ADMIN_TRANSFER_STORAGE must name a STORAGES entry shared by the web and worker processes.")
 
 # --- LEGACY SUPPORT ---
 STATICFILES_STORAGE = STORAGES["staticfiles"]["BACKEND"]
@@ -341,4 +453,28 @@ LOGGING = {
     'disable_existing_loggers': False,
     'handlers': {'console': {'class': 'logging.StreamHandler'}},
     'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        # One line per request from PerformanceMiddleware; WARNING keeps only budget overruns
+        'wedding_project.perf': {'level': os.environ.get('PERF_LOG_LEVEL', 'INFO')},
+    },
+}
+
+# Per-request instrumentation (see wedding_project/middleware.py). Budgets are keyed by URL
+# name; any measured field can be limited (total_ms, db_queries, db_ms, template_ms, ...).
+# Server-Timing exposes the numbers to browsers, so it is on only when PERF_SERVER_TIMING is set.
+PERF_SERVER_TIMING = os.environ.get('PERF_SERVER_TIMING', str(DEBUG)).lower() in ('1', 'true', 'yes')
+PERF_DEFAULT_BUDGET = {'total_ms': 1000, 'db_queries': 50}
+PERF_BUDGETS = {
+    'invapp:guest_invite': {'total_ms': 300, 'db_queries': 15},
+    'invapp:landing_page': {'total_ms': 300, 'db_queries': 10},
+    'invapp:dashboard': {'total_ms': 500, 'db_queries': 20},
+    'invapp:guest_list': {'total_ms': 500, 'db_queries': 20},
+    'invapp:api_verify_voucher': {'total_ms': 100, 'db_queries': 3},
 }
+
+# On-demand profiling of single requests by staff users (ProfilingMiddleware). PROFILING_DIR,
+# when set, keeps the raw cProfile output of each profiled request.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+PROFILING_DIR = os.environ.get('PROFILING_DIR') or None
+PROFILING_LIMIT = 50  # rows of stats / allocations in the report
+PROFILING_TRACEMALLOC_FRAMES = 1
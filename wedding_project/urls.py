@@ -21,6 +21,7 @@ urlpatterns = [
     path('admin/logout/', auth_views.LogoutView.as_view(next_page='/'), name='admin_logout'),
     path('i18n/', include('django.conf.urls.i18n')),
     path('webhook/stripe/', invapp_views.stripe_webhook, name='stripe_webhook'),
+    path('preview-uploads/<str:token>', invapp_views.preview_upload_file_view, name='preview_upload_file'),
     path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
 ]
 